@@ -38,9 +38,11 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'bookshelf',
+    'querymetrics',
 ]
 
 MIDDLEWARE = [
+    'querymetrics.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -121,3 +123,8 @@ STATIC_URL = 'static/'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Request/query instrumentation (see querymetrics/)
+QUERY_METRICS_SAMPLE_RATE = 1.0  # share of requests whose queries are recorded
+QUERY_METRICS_SLOW_MS = 500  # requests slower than this are logged with their worst queries
+QUERY_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # who may scrape /metrics
@@ -0,0 +1,172 @@
+'''
+Per-request query count, duplicate queries, DB time and total time.
+
+Every request is timed. A QUERY_METRICS_SAMPLE_RATE share of them also has
+its queries recorded through a connection execute_wrapper. SQL arrives with
+its parameters separate, so the statement text itself serves as the
+fingerprint for spotting repeats (N+1 loops). Requests slower than
+QUERY_METRICS_SLOW_MS are logged with their most expensive statements.
+
+The middleware works in both sync and async mode, so under ASGI it doesn't
+push the whole chain (and async views) onto a thread. Each connection
+carries one permanent execute_wrapper that hands queries to the recorder of
+the current request, found through a contextvar. Queries that async code
+runs through sync_to_async happen on other threads with their own
+connections, and sync_to_async carries the contextvar over to them.
+'''
+import logging
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .registry import registry
+
+logger = logging.getLogger('querymetrics')
+
+SAMPLE_RATE = getattr(settings, 'QUERY_METRICS_SAMPLE_RATE', 1.0)
+SLOW_MS = getattr(settings, 'QUERY_METRICS_SLOW_MS', 500)
+WORST_QUERIES = 3
+
+# Recorder of the sampled request being handled, if any
+current_recorder = ContextVar('querymetrics_recorder', default=None)
+
+
+class QueryRecorder:
+    '''
+    One request's queries. Reached through current_recorder, so it can be
+    called from whichever threads the request's sync_to_async work runs on;
+    the counters are updated under a lock.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        # sql -> [executions, total seconds]
+        self.statements = defaultdict(lambda: [0, 0.0])
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.count += 1
+                self.total += elapsed
+                entry = self.statements[sql]
+                entry[0] += 1
+                entry[1] += elapsed
+
+    @property
+    def duplicates(self):
+        return sum(executions - 1 for executions, _ in self.statements.values())
+
+    def worst(self, limit=WORST_QUERIES):
+        ranked = sorted(self.statements.items(), key=lambda item: item[1][1], reverse=True)
+        return [(sql, executions, seconds) for sql, (executions, seconds) in ranked[:limit]]
+
+
+def _record(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install(connection):
+    if _record not in connection.execute_wrappers:
+        # First, so `with connection.execute_wrapper()` blocks still pop their own
+        connection.execute_wrappers.insert(0, _record)
+
+
+@receiver(connection_created)
+def install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def recording(recorder):
+    for alias in connections:
+        install(connections[alias])
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        # Unresolved paths would otherwise give every 404 its own label
+        return '<unresolved>'
+    return match.view_name
+
+
+class QueryMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        if random.random() >= SAMPLE_RATE:
+            response = self.get_response(request)
+            self.finish(request, time.perf_counter() - start, None)
+            return response
+
+        with recording(QueryRecorder()) as recorder:
+            response = self.get_response(request)
+        self.finish(request, time.perf_counter() - start, recorder)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        if random.random() >= SAMPLE_RATE:
+            response = await self.get_response(request)
+            self.finish(request, time.perf_counter() - start, None)
+            return response
+
+        with recording(QueryRecorder()) as recorder:
+            response = await self.get_response(request)
+        self.finish(request, time.perf_counter() - start, recorder)
+        return response
+
+    def finish(self, request, duration, recorder):
+        view = _view_name(request)
+        if recorder is None:
+            registry.record(view, request.method, duration)
+        else:
+            registry.record(view, request.method, duration, recorder.count, recorder.duplicates, recorder.total)
+
+        if duration * 1000 < SLOW_MS:
+            return
+        if recorder is None:
+            logger.warning("Slow request %s %s (%s): %.0f ms", request.method, request.path, view, duration * 1000)
+            return
+        worst = "".join(
+            f"\n  {seconds * 1000:8.1f} ms  x{executions}  {sql[:300]}"
+            for sql, executions, seconds in recorder.worst()
+        )
+        logger.warning(
+            "Slow request %s %s (%s): %.0f ms, %d queries (%d duplicate) in %.0f ms%s",
+            request.method, request.path, view, duration * 1000,
+            recorder.count, recorder.duplicates, recorder.total * 1000, worst,
+        )
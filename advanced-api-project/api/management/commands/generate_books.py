@@ -0,0 +1,47 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.models import Author, Book
+
+FIRST = "Ngozi Amos Grace Peter Wanjiru Otieno Mary James Aisha John Achieng David".split()
+LAST = "Kiswaya Orwell Achebe Thiong'o Adichie Austen Mwangi Okafor Brown Smith".split()
+WORDS = "river night city garden house war peace road dream stone fire song child light sea".split()
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic authors and books in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=10_000)
+        parser.add_argument('--books', type=int, default=20, help="average books per author")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        start = time.perf_counter()
+        authors = []
+        for offset in range(0, options['authors'], batch_size):
+            size = min(batch_size, options['authors'] - offset)
+            created = Author.objects.bulk_create([
+                Author(name=f"{rng.choice(FIRST)} {rng.choice(LAST)}") for _ in range(size)
+            ])
+            authors.extend(author.pk for author in created)
+        self.stdout.write(f"authors {time.perf_counter() - start:8.1f}s")
+
+        start = time.perf_counter()
+        total = options['authors'] * options['books']
+        for offset in range(0, total, batch_size):
+            Book.objects.bulk_create([
+                Book(
+                    title=" ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+                    publication_year=rng.randint(1900, 2025),
+                    author_id=rng.choice(authors),
+                )
+                for _ in range(min(batch_size, total - offset))
+            ])
+        self.stdout.write(f"books   {time.perf_counter() - start:8.1f}s")
@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from querymetrics.testing import QueryBudgetMixin
+from .models import Book, Author
+
+
+class BookQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Query counts of the book endpoints must not grow with the number of books
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.author = Author.objects.create(name='Budget Author')
+
+    def grow_books(self, size):
+        """Top the books table up to `size` rows, spread over several authors"""
+        missing = size - Book.objects.count()
+        authors = [Author.objects.create(name=f'Author {i}') for i in range(min(missing, 5))]
+        Book.objects.bulk_create([
+            Book(title=f'Book {i}', author=authors[i % len(authors)], publication_year=2000 + i % 20)
+            for i in range(missing)
+        ])
+
+    def test_list_view_budget(self):
+        self.assertQueryBudgetScales(1, self.grow_books, lambda: self.client.get(reverse('list-books')))
+
+    def test_list_view_filtered_budget(self):
+        url = reverse('list-books') + '?publication_year=2001&ordering=-publication_year'
+        self.assertQueryBudgetScales(1, self.grow_books, lambda: self.client.get(url))
+
+    def test_detail_view_budget(self):
+        book = Book.objects.create(title='Detail', author=self.author, publication_year=2020)
+        url = reverse('book-detail', kwargs={'pk': book.pk})
+
+        def grow_author_books(size):
+            """Top up the fetched book's author with more books"""
+            missing = size - self.author.book_set.count()
+            Book.objects.bulk_create([
+                Book(title=f'More {i}', author=self.author, publication_year=2000 + i % 20)
+                for i in range(missing)
+            ])
+        self.assertQueryBudgetScales(1, grow_author_books, lambda: self.client.get(url))
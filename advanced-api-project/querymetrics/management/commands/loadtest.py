@@ -0,0 +1,262 @@
+'''
+HTTP load generator for a running server (runserver, gunicorn, ...).
+
+Two concurrency models:
+
+* closed (default): --concurrency workers each send a request, wait for the
+  answer and send the next one. Throughput is whatever the server sustains.
+* open (--rate R): requests are scheduled R per second whatever the server
+  does, and latency is measured from the scheduled start, so queueing behind
+  a slow server is counted instead of hidden. --concurrency caps the number
+  of requests in flight.
+
+Results go to a JSON file (--output) that a later run can be compared
+against (--compare), or two files can be compared directly (--diff).
+'''
+import http.client
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from importlib import import_module
+from urllib.parse import urlsplit
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+PERCENTILES = (50, 90, 95, 99)
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps')
+
+
+def percentile(ordered, pct):
+    '''Nearest-rank percentile of an already sorted list'''
+    return ordered[max(1, math.ceil(pct / 100 * len(ordered))) - 1]
+
+
+def summarize(samples, elapsed):
+    '''samples: (latency seconds, status) pairs; status 0 is a connection error'''
+    latencies = sorted(latency * 1000 for latency, _ in samples)
+    statuses = Counter(status for _, status in samples)
+    summary = {
+        'requests': len(samples),
+        'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+    }
+    if latencies:
+        summary['min_ms'] = round(latencies[0], 2)
+        summary['mean_ms'] = round(sum(latencies) / len(latencies), 2)
+        for pct in PERCENTILES:
+            summary[f'p{pct}_ms'] = round(percentile(latencies, pct), 2)
+        summary['max_ms'] = round(latencies[-1], 2)
+    return summary
+
+
+class Schedule:
+    '''Hands out request start times to the workers'''
+
+    def __init__(self, start, stop_at, rate, limit):
+        self.lock = threading.Lock()
+        self.start = start
+        self.stop_at = stop_at
+        self.rate = rate
+        self.limit = limit
+        self.issued = 0
+
+    def next(self):
+        with self.lock:
+            if self.limit is not None and self.issued >= self.limit:
+                return None
+            when = self.start + self.issued / self.rate if self.rate else time.perf_counter()
+            if when >= self.stop_at:
+                return None
+            self.issued += 1
+            return when
+
+
+class Command(BaseCommand):
+    help = "Drive endpoints of a running server and report latency percentiles and throughput"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'endpoints', nargs='*',
+            help="paths to request, optionally weighted as PATH@WEIGHT; defaults to QUERY_METRICS_LOADTEST_ENDPOINTS",
+        )
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=8, help="workers, i.e. the most requests in flight")
+        parser.add_argument('--rate', type=float, help="open model: start this many requests per second")
+        parser.add_argument('--duration', type=float, default=30.0, help="seconds to measure")
+        parser.add_argument('--warmup', type=float, default=0.0, help="seconds of load sent before measuring")
+        parser.add_argument('--requests', type=int, help="stop after this many requests, warm-up included")
+        parser.add_argument('--header', action='append', default=[], help="extra request header, 'Name: value'")
+        parser.add_argument('--user', help="send a session cookie (and DRF token, when installed) for this user")
+        parser.add_argument('--timeout', type=float, default=30.0)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--label', default='', help="free text stored with the results")
+        parser.add_argument('--output', help="write the results to this JSON file")
+        parser.add_argument('--compare', help="JSON file of an earlier run to compare the results with")
+        parser.add_argument('--diff', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help="only compare two result files")
+
+    def handle(self, *args, **options):
+        if options['diff']:
+            baseline, candidate = (self.load(path) for path in options['diff'])
+            self.compare(baseline, candidate)
+            return
+
+        endpoints = self.parse_endpoints(options['endpoints'] or getattr(settings, 'QUERY_METRICS_LOADTEST_ENDPOINTS', []))
+        headers = self.parse_headers(options['header'])
+        if options['user']:
+            headers.update(self.login_headers(options['user']))
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        results = self.run(endpoints, headers, options)
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(results, handle, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self.compare(self.load(options['compare']), results)
+
+    def parse_endpoints(self, specs):
+        if not specs:
+            raise CommandError("Give the paths to request or set QUERY_METRICS_LOADTEST_ENDPOINTS")
+        endpoints = {}
+        for spec in specs:
+            path, _, weight = spec.rpartition('@')
+            if not path or not weight.isdigit():
+                path, weight = spec, '1'
+            endpoints[path] = endpoints.get(path, 0) + int(weight)
+        return endpoints
+
+    def parse_headers(self, specs):
+        headers = {}
+        for spec in specs:
+            name, sep, value = spec.partition(':')
+            if not sep:
+                raise CommandError(f"Header {spec!r} is not 'Name: value'")
+            headers[name.strip()] = value.strip()
+        return headers
+
+    def login_headers(self, username):
+        '''Credentials for `username`, minted straight in the database the server uses'''
+        User = get_user_model()
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            raise CommandError(f"No user {username!r}")
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        headers = {'Cookie': f'{settings.SESSION_COOKIE_NAME}={session.session_key}'}
+        if apps.is_installed('rest_framework.authtoken'):
+            from rest_framework.authtoken.models import Token
+            headers['Authorization'] = f'Token {Token.objects.get_or_create(user=user)[0].key}'
+        return headers
+
+    def run(self, endpoints, headers, options):
+        url = urlsplit(options['base_url'])
+        connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        prefix = url.path.rstrip('/')
+        paths, weights = list(endpoints), list(endpoints.values())
+
+        start = time.perf_counter()
+        measure_from = start + options['warmup']
+        schedule = Schedule(start, measure_from + options['duration'], options['rate'], options['requests'])
+        samples = [[] for _ in range(options['concurrency'])]
+
+        def worker(index):
+            rng = random.Random(options['seed'] + index)
+            connection = connection_class(url.netloc, timeout=options['timeout'])
+            own = samples[index]
+            while True:
+                when = schedule.next()
+                if when is None:
+                    break
+                delay = when - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                path = rng.choices(paths, weights)[0]
+                try:
+                    connection.request('GET', prefix + path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    status = response.status
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    status = 0
+                if when >= measure_from:
+                    own.append((path, time.perf_counter() - when, status))
+            connection.close()
+
+        mode = f"{options['rate']:g} req/s open" if options['rate'] else "closed"
+        self.stdout.write(
+            f"{mode} model, {options['concurrency']} workers, {len(paths)} endpoints against {options['base_url']}"
+        )
+        threads = [threading.Thread(target=worker, args=(index,), daemon=True) for index in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - max(measure_from, start)
+
+        by_path = defaultdict(list)
+        for own in samples:
+            for path, latency, status in own:
+                by_path[path].append((latency, status))
+        return {
+            'label': options['label'],
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'base_url': options['base_url'],
+            'model': {
+                'type': 'open' if options['rate'] else 'closed',
+                'concurrency': options['concurrency'],
+                'rate': options['rate'],
+            },
+            'duration_s': round(elapsed, 3),
+            'endpoints': {path: summarize(by_path[path], elapsed) for path in paths},
+            'total': summarize([sample for path in paths for sample in by_path[path]], elapsed),
+        }
+
+    def load(self, path):
+        try:
+            with open(path) as handle:
+                return json.load(handle)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Can't read results from {path}: {exc}")
+
+    def row(self, name, stats):
+        values = [stats.get(key) for key in ('requests', 'errors', 'throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms')]
+        cells = [f"{value:>9}" if value is not None else f"{'-':>9}" for value in values]
+        return f"{name[:40]:40} " + " ".join(cells)
+
+    def report(self, results):
+        header = ('requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms')
+        self.stdout.write(f"{'endpoint':40} " + " ".join(f"{title:>9}" for title in header))
+        for path, stats in results['endpoints'].items():
+            self.stdout.write(self.row(path, stats))
+        self.stdout.write(self.row('total', results['total']))
+
+    def compare(self, baseline, candidate):
+        '''Per endpoint change of each figure; lower latency and higher req/s are better'''
+        self.stdout.write(f"{'endpoint':40} " + " ".join(f"{key:>24}" for key in COMPARED))
+        names = [name for name in candidate['endpoints'] if name in baseline['endpoints']] + ['total']
+        for name in names:
+            old = baseline['total'] if name == 'total' else baseline['endpoints'][name]
+            new = candidate['total'] if name == 'total' else candidate['endpoints'][name]
+            cells = []
+            for key in COMPARED:
+                if old.get(key) is None or new.get(key) is None:
+                    cells.append(f"{'-':>24}")
+                    continue
+                change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                cells.append(f"{f'{old[key]:g} -> {new[key]:g} ({change:+.0f}%)':>24}")
+            self.stdout.write(f"{name[:40]:40} " + " ".join(cells))
@@ -0,0 +1,73 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from relationship_app.models import Author, Book, Library, Librarian
+
+FIRST = "Ngozi Amos Grace Peter Wanjiru Otieno Mary James Aisha John Achieng David".split()
+LAST = "Kiswaya Orwell Achebe Thiong'o Adichie Austen Mwangi Okafor Brown Smith".split()
+WORDS = "river night city garden house war peace road dream stone fire song child light sea".split()
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic authors, books, libraries and librarians in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=10_000)
+        parser.add_argument('--books', type=int, default=20, help="average books per author")
+        parser.add_argument('--libraries', type=int, default=100)
+        parser.add_argument('--books-per-library', type=int, default=5_000)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        authors = self.step("authors", self.make_authors, options['authors'])
+        books = self.step("books", self.make_books, authors, options['authors'] * options['books'])
+        self.step("libraries", self.make_libraries, books, options['libraries'], options['books_per_library'])
+
+    def step(self, label, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        self.stdout.write(f"{label:10} {time.perf_counter() - start:8.1f}s")
+        return result
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def make_authors(self, total):
+        ids = []
+        for size in self.batches(total):
+            created = Author.objects.bulk_create([
+                Author(name=f"{self.rng.choice(FIRST)} {self.rng.choice(LAST)}") for _ in range(size)
+            ])
+            ids.extend(author.pk for author in created)
+        return ids
+
+    def make_books(self, authors, total):
+        ids = []
+        for size in self.batches(total):
+            created = Book.objects.bulk_create([
+                Book(title=" ".join(self.rng.choices(WORDS, k=self.rng.randint(2, 5))).title(), author_id=self.rng.choice(authors))
+                for _ in range(size)
+            ])
+            ids.extend(book.pk for book in created)
+        return ids
+
+    def make_libraries(self, books, total, per_library):
+        offset = Library.objects.count()
+        libraries = Library.objects.bulk_create([Library(name=f"Library {offset + i}") for i in range(total)])
+        Librarian.objects.bulk_create([
+            Librarian(name=f"{self.rng.choice(FIRST)} {self.rng.choice(LAST)}", library=library) for library in libraries
+        ])
+        Shelf = Library.books.through
+        per_library = min(per_library, len(books))
+        for library in libraries:
+            Shelf.objects.bulk_create(
+                [Shelf(library_id=library.pk, book_id=book_id) for book_id in self.rng.sample(books, per_library)],
+                batch_size=self.batch_size,
+            )
@@ -0,0 +1,13 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from .registry import registry
+
+ALLOWED_IPS = getattr(settings, 'QUERY_METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+
+
+def metrics(request):
+    '''Prometheus scrape endpoint; open to QUERY_METRICS_ALLOWED_IPS only'''
+    if request.META.get('REMOTE_ADDR') not in ALLOWED_IPS:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
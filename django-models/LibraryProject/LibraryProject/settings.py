@@ -39,9 +39,11 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'bookshelf',
     'relationship_app.apps.RelationshipAppConfig',
+    'querymetrics',
 ]
 
 MIDDLEWARE = [
+    'querymetrics.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,3 +130,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/accounts/login/'
 
+# Request/query instrumentation (see querymetrics/)
+QUERY_METRICS_SAMPLE_RATE = 1.0  # share of requests whose queries are recorded
+QUERY_METRICS_SLOW_MS = 500  # requests slower than this are logged with their worst queries
+QUERY_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # who may scrape /metrics
@@ -21,4 +21,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('relationship_app.urls')),
     path('accounts/', include('django.contrib.auth.urls')),
+    path('', include('querymetrics.urls')),
 ]
@@ -0,0 +1,100 @@
+'''
+In-process metric store, rendered in the Prometheus text format.
+
+Each worker process keeps its own numbers; scrape every worker (or run one)
+for complete figures.
+'''
+import threading
+from bisect import bisect_left
+
+# Upper bounds in seconds of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class ViewStats:
+    __slots__ = ('requests', 'duration', 'buckets', 'sampled', 'queries', 'duplicates', 'db_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.duration = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sampled = 0
+        self.queries = 0
+        self.duplicates = 0
+        self.db_time = 0.0
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, method, duration, queries=None, duplicates=0, db_time=0.0):
+        '''`queries` is None for requests that weren't sampled'''
+        with self.lock:
+            stats = self.views.get((view, method))
+            if stats is None:
+                stats = self.views[(view, method)] = ViewStats()
+            stats.requests += 1
+            stats.duration += duration
+            stats.buckets[bisect_left(BUCKETS, duration)] += 1
+            if queries is not None:
+                stats.sampled += 1
+                stats.queries += queries
+                stats.duplicates += duplicates
+                stats.db_time += db_time
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+    def render(self):
+        with self.lock:
+            views = {key: (stats.requests, stats.duration, list(stats.buckets), stats.sampled,
+                           stats.queries, stats.duplicates, stats.db_time)
+                     for key, stats in self.views.items()}
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        def labels(view, method, **extra):
+            pairs = {'view': view, 'method': method, **extra}
+            return ','.join(f'{key}="{_escape(value)}"' for key, value in pairs.items())
+
+        family('django_http_requests_total', 'counter', 'Requests handled.')
+        for (view, method), row in views.items():
+            lines.append(f'django_http_requests_total{{{labels(view, method)}}} {row[0]}')
+
+        family('django_http_request_duration_seconds', 'histogram', 'Time spent producing the response.')
+        for (view, method), row in views.items():
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ('+Inf',), row[2]):
+                cumulative += count
+                lines.append(
+                    f'django_http_request_duration_seconds_bucket{{{labels(view, method, le=bound)}}} {cumulative}'
+                )
+            lines.append(f'django_http_request_duration_seconds_sum{{{labels(view, method)}}} {row[1]:.6f}')
+            lines.append(f'django_http_request_duration_seconds_count{{{labels(view, method)}}} {row[0]}')
+
+        for index, name, help_text in (
+            (3, 'django_sampled_requests_total', 'Requests whose queries were recorded.'),
+            (4, 'django_db_queries_total', 'Queries run by sampled requests.'),
+            (5, 'django_db_duplicate_queries_total', 'Repeats of an identical SQL statement within a sampled request.'),
+            (6, 'django_db_query_seconds_total', 'Database time of sampled requests.'),
+        ):
+            family(name, 'counter', help_text)
+            for (view, method), row in views.items():
+                value = f'{row[index]:.6f}' if isinstance(row[index], float) else row[index]
+                lines.append(f'{name}{{{labels(view, method)}}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = Registry()
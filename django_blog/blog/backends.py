@@ -0,0 +1,12 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+UserModel = get_user_model()
+
+
+class ProfileBackend(ModelBackend):
+    '''ModelBackend that loads the request user's profile in the same query'''
+
+    def get_user(self, user_id):
+        user = UserModel._default_manager.select_related('profile').filter(pk=user_id).first()
+        return user if user is not None and self.user_can_authenticate(user) else None
@@ -0,0 +1,176 @@
+'''
+Cache-aside for the public blog pages.
+
+Every cached page or fragment is keyed on version stamps: one for the post
+list, one per post and one for tags, which the tag cloud and tag pages also
+depend on. Writes don't delete anything. blog.signals bumps the stamps
+instead, so every key built from the old stamp goes unused and expires. The
+stamps are CacheVersion rows rather than cache entries: the page cache may be
+local to each worker, and a bump made by one worker (or by a management
+command such as generate_data) has to reach all of them. Reading them costs
+one small query per page view.
+
+Anonymous GETs of the list and detail pages are cached whole. Logged-in
+users get template fragments, and only the parts showing edit/delete links
+vary per user.
+
+Anonymous pages also carry HTTP validators, built only from the database so
+every worker sends the same ones. Each view's get_last_modified() answers
+with one aggregate query over the timestamps it shows. Edits and deletes
+leave no newer timestamp behind, so the time of the last bump of the page's
+stamps (CacheVersion rows are bumped by writes only) sets a floor. A matching If-None-Match or If-Modified-Since
+gets a 304 before the view runs. Cache-Control lets a CDN keep the page for
+BLOG_HTTP_SHARED_MAX_AGE seconds. The version keys go out in a surrogate-key
+header, and every bump hands the same keys to BLOG_CDN_PURGE.
+'''
+import hashlib
+import logging
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+CACHE_TIMEOUT = getattr(settings, 'BLOG_CACHE_TIMEOUT', 600)
+LIST_VERSION_KEY = 'blog:version:list'
+POST_VERSION_KEY = 'blog:version:post:{}'
+TAG_VERSION_KEY = 'blog:version:tags'
+
+HTTP_MAX_AGE = getattr(settings, 'BLOG_HTTP_MAX_AGE', 0)
+HTTP_SHARED_MAX_AGE = getattr(settings, 'BLOG_HTTP_SHARED_MAX_AGE', 600)
+SURROGATE_KEY_HEADER = getattr(settings, 'BLOG_SURROGATE_KEY_HEADER', 'Surrogate-Key')
+
+
+def cache_enabled():
+    # Read per request so the benchmark can switch it off with override_settings
+    return getattr(settings, 'BLOG_PAGE_CACHE', True)
+
+
+def get_versions(keys):
+    '''Current stamp of each version key, in one query; 0 for keys never bumped'''
+    from .models import CacheVersion
+
+    stamps = dict(CacheVersion.objects.filter(key__in=keys).values_list('key', 'stamp'))
+    return '-'.join(str(stamps.get(key, 0)) for key in keys)
+
+
+def stamp_time(version):
+    '''When the newest of the stamps in a get_versions() string was bumped; None if none ever was'''
+    newest = max(int(stamp) for stamp in version.split('-'))
+    return datetime.fromtimestamp(newest / 1e9, tz=timezone.utc) if newest else None
+
+
+def surrogate_key(version_key):
+    return version_key.replace(':', '-')
+
+
+def purge(keys):
+    '''Pass the surrogate keys of stale pages to the BLOG_CDN_PURGE callable, if one is set'''
+    # Read per call so tests can switch it with override_settings
+    hook = getattr(settings, 'BLOG_CDN_PURGE', None)
+    if not hook:
+        return
+    try:
+        import_string(hook)([surrogate_key(key) for key in keys])
+    except Exception:
+        # The write has committed already; the CDN copy just lives out its s-maxage
+        logger.exception("CDN purge of %s failed", keys)
+
+
+def bump(*keys):
+    from .models import CacheVersion
+
+    now = time.time_ns()
+    CacheVersion.objects.bulk_create([CacheVersion(key=key, stamp=now) for key in keys], ignore_conflicts=True)
+    # Never backwards, even if this server's clock is behind the last writer's
+    CacheVersion.objects.filter(key__in=keys).update(stamp=Greatest(F('stamp') + 1, Value(now)))
+    purge(keys)
+
+
+def bump_post(post_id, listed=True):
+    '''Invalidate a post's detail page, and the list pages too when `listed` data changed'''
+    keys = [POST_VERSION_KEY.format(post_id)]
+    if listed:
+        keys.append(LIST_VERSION_KEY)
+    # After commit, so a concurrent reader can't cache pre-write data under the new stamp
+    transaction.on_commit(lambda: bump(*keys))
+
+
+class AnonymousPageCacheMixin:
+    '''Serve whole pages to anonymous GET requests from the cache'''
+
+    def get_version_keys(self):
+        return [LIST_VERSION_KEY]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Used by the {% cache %} fragments; a timeout of 0 stores nothing
+        context['cache_version'] = self.cache_version
+        context['cache_timeout'] = CACHE_TIMEOUT if cache_enabled() else 0
+        return context
+
+    def get_last_modified(self):
+        '''Newest timestamp the page shows, from one aggregate query; None sends no validators'''
+        return None
+
+    def last_modified(self, digest):
+        if not cache_enabled():
+            return self.get_last_modified()
+        # Memoized per version: any write that could change the answer bumps a stamp
+        key = f'blog:modified:{digest}:{self.cache_version}'
+        modified = cache.get(key)
+        if modified is None:
+            modified = self.get_last_modified()
+            cache.set(key, modified, CACHE_TIMEOUT)
+        return modified
+
+    def add_http_headers(self, response, etag, modified):
+        if modified is not None:
+            response.headers.setdefault('ETag', etag)
+            response.headers.setdefault('Last-Modified', http_date(int(modified.timestamp())))
+        # Anonymous only; SessionMiddleware adds Vary: Cookie so logged-in users bypass shared copies
+        patch_cache_control(response, public=True, max_age=HTTP_MAX_AGE, s_maxage=HTTP_SHARED_MAX_AGE)
+        response.headers[SURROGATE_KEY_HEADER] = ' '.join(surrogate_key(key) for key in self.get_version_keys())
+        return response
+
+    def dispatch(self, request, *args, **kwargs):
+        self.cache_version = get_versions(self.get_version_keys())
+        if request.method != 'GET' or request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+
+        digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        etag = None
+        modified = self.last_modified(digest)
+        if modified is not None:
+            bumped = stamp_time(self.cache_version)
+            if bumped is not None:
+                modified = max(modified, bumped)
+            etag = '"%s"' % hashlib.md5(f'{self.cache_version}:{modified.isoformat()}'.encode()).hexdigest()
+            not_modified = get_conditional_response(request, etag=etag, last_modified=int(modified.timestamp()))
+            if not_modified is not None:
+                return self.add_http_headers(not_modified, etag, modified)
+
+        if not cache_enabled():
+            response = super().dispatch(request, *args, **kwargs)
+        else:
+            key = f'blog:page:{digest}:{self.cache_version}'
+            content = cache.get(key)
+            if content is not None:
+                return self.add_http_headers(HttpResponse(content), etag, modified)
+
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200 and hasattr(response, 'render'):
+                response.render()
+                cache.set(key, response.content, CACHE_TIMEOUT)
+        if response.status_code == 200:
+            self.add_http_headers(response, etag, modified)
+        return response
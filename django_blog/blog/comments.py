@@ -0,0 +1,73 @@
+'''
+Threaded, paged comments for the post detail page.
+
+Pages are made of threads: top-level comments newest first, each followed by
+its replies in the order they were written. Every comment stores its
+materialized path (Comment.path), so one page of threads is one range scan
+on the (post, path) index. The bounds come from the page's newest and oldest
+top-level ids and are compared on their fixed-width digits only, so the
+result doesn't depend on the database collation.
+'''
+from django.conf import settings
+from django.db.models import CharField, Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
+
+from .models import Comment, Post, PATH_STEP
+from .pagination import CountedPaginator
+
+COMMENTS_PER_PAGE = getattr(settings, 'BLOG_COMMENTS_PER_PAGE', 20)
+MAX_DEPTH = getattr(settings, 'BLOG_COMMENT_MAX_DEPTH', 6)
+
+
+def _path_prefix(comment_id):
+    return LPad(Cast(comment_id, CharField()), PATH_STEP - 1, Value('0'))
+
+
+def thread_page(post, number, per_page=COMMENTS_PER_PAGE):
+    '''Page `number` of the post's threads, comments with their authors in a single query'''
+    threads = Comment.objects.filter(post=post, parent__isnull=True).order_by('-pk').values('pk')
+    page = CountedPaginator(threads, per_page, count=post.thread_count).get_page(number)
+    if not page.paginator.count:
+        page.object_list = []
+        return page
+
+    offset = (page.number - 1) * per_page
+    newest = Subquery(threads[offset:offset + 1], output_field=IntegerField())
+    # Missing on a short last page, where everything older belongs to the page anyway
+    oldest = Subquery(threads[offset + per_page - 1:offset + per_page], output_field=IntegerField())
+    comments = (
+        Comment.objects.filter(post=post)
+        .filter(path__gte=Coalesce(_path_prefix(oldest), Value('')), path__lt=_path_prefix(newest + 1))
+        .select_related('author')
+        .order_by('path')
+    )
+    page.object_list = sorted(comments, key=lambda comment: (-comment.thread_id, comment.path))
+    return page
+
+
+def reply_parent(post, parent_id):
+    '''The comment a reply hangs from, or None to start a thread'''
+    if not str(parent_id or '').isdigit():
+        return None
+    parent = Comment.objects.filter(post=post, pk=parent_id).select_related('parent').first()
+    if parent is not None and parent.depth >= MAX_DEPTH:
+        # Threads stop nesting at MAX_DEPTH; the reply becomes a sibling instead
+        parent = parent.parent
+    return parent
+
+
+def _count_of(queryset):
+    counted = queryset.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('*')).values('total')
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def rebuild_threads():
+    '''Recompute paths and per-post counters after bulk loads that skip Comment.save and blog.signals'''
+    # Bulk-created comments have no parent set; anything else already has its path
+    Comment.objects.filter(path='', parent__isnull=True).update(
+        path=Concat(_path_prefix('id'), Value('/'))
+    )
+    Post.objects.update(
+        comment_count=_count_of(Comment.objects.all()),
+        thread_count=_count_of(Comment.objects.filter(parent__isnull=True)),
+    )
@@ -3,6 +3,8 @@ from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
 from .models import Profile, Comment, Post
 from taggit.forms import TagWidget
+from django.core.files.uploadedfile import UploadedFile
+from .images import validate_upload
 
 
 class PostForm(forms.ModelForm):
@@ -26,7 +28,14 @@ class CustomUserCreationForm(UserCreationForm):
 class ProfileUpdateForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['bio', 'profile_picture'] 
+        fields = ['bio', 'profile_picture']
+
+    def clean_profile_picture(self):
+        picture = self.cleaned_data.get('profile_picture')
+        # Only new uploads; the stored picture comes back as a FieldFile
+        if isinstance(picture, UploadedFile):
+            validate_upload(picture)
+        return picture
 
 class UserUpdateForm(forms.ModelForm):
     email = forms.EmailField(required=True)
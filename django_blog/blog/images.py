@@ -0,0 +1,178 @@
+'''
+Profile picture pipeline.
+
+The request only runs cheap checks on an upload (byte size, format and
+pixel count, read from the header) and saves it as it is, with
+avatar_status 'pending'. Until the thumbnails exist, avatar_urls() answers
+with the placeholder. After commit the row goes to a small thread pool
+(AVATAR_WORKERS). The pool decodes the image once and writes a square WebP
+and JPEG thumbnail for each of AVATAR_SIZES. It then replaces the upload
+with a copy named after its SHA-256.
+
+Because names come from the content, the same picture uploaded twice is
+stored once. A new picture always gets new URLs, so MEDIA_URL can be served
+with a far-future Cache-Control. `manage.py process_avatars` picks up rows
+left pending, e.g. by a restart. It can also do all the work when
+AVATAR_WORKERS is 0.
+'''
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.templatetags.static import static
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+WORKERS = getattr(settings, 'AVATAR_WORKERS', 2)
+SIZES = getattr(settings, 'AVATAR_SIZES', (64, 256))
+QUALITY = getattr(settings, 'AVATAR_QUALITY', 80)
+MAX_UPLOAD_BYTES = getattr(settings, 'AVATAR_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)
+MAX_PIXELS = getattr(settings, 'AVATAR_MAX_PIXELS', 40_000_000)
+PLACEHOLDER = getattr(settings, 'AVATAR_PLACEHOLDER', 'img/avatar-placeholder.png')
+
+PENDING, READY, FAILED = 'pending', 'ready', 'failed'
+STATUS_CHOICES = [(PENDING, 'Pending'), (READY, 'Ready'), (FAILED, 'Failed')]
+
+# Accepted upload formats and the extension the original is stored under
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+# Thumbnail formats: key in avatar_urls() -> (Pillow format, extension)
+FORMATS = {'webp': ('WEBP', '.webp'), 'jpeg': ('JPEG', '.jpg')}
+
+executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='avatars') if WORKERS else None
+
+
+def validate_upload(upload):
+    '''Checks cheap enough for the request thread; nothing is decoded'''
+    if upload.size > MAX_UPLOAD_BYTES:
+        raise ValidationError(f"Images may be at most {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+    try:
+        with Image.open(upload) as image:
+            image_format, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError("Upload a valid image.")
+    finally:
+        upload.seek(0)
+    if image_format not in EXTENSIONS:
+        raise ValidationError(f"Use one of {', '.join(sorted(EXTENSIONS))}.")
+    if width * height > MAX_PIXELS:
+        raise ValidationError("This image has too many pixels.")
+
+
+def is_new_upload(field_file):
+    # A file assigned from a form or serializer isn't written to storage until the model saves
+    return bool(field_file) and not field_file._committed
+
+
+def original_name(digest, extension):
+    return f'avatars/{digest[:2]}/{digest}{extension}'
+
+
+def thumbnail_name(digest, size, key):
+    return f'avatars/{digest[:2]}/{digest}-{size}{FORMATS[key][1]}'
+
+
+def avatar_urls(obj, field='profile_picture'):
+    '''{'status': ..., 'webp': {'64': url, ...}, 'jpeg': {...}}, all the placeholder until processed'''
+    if obj.avatar_status == READY:
+        storage = getattr(obj, field).storage
+        urls = {
+            key: {str(size): storage.url(thumbnail_name(obj.avatar_hash, size, key)) for size in SIZES}
+            for key in FORMATS
+        }
+    else:
+        placeholder = static(PLACEHOLDER)
+        urls = {key: {str(size): placeholder for size in SIZES} for key in FORMATS}
+    return {'status': obj.avatar_status or None, **urls}
+
+
+def decode(data):
+    '''(format, fully decoded upright RGB image); raises on anything we won't thumbnail'''
+    image = Image.open(BytesIO(data))
+    image_format = image.format
+    if image_format not in EXTENSIONS:
+        raise ValueError(f"unsupported format {image_format}")
+    if image.width * image.height > MAX_PIXELS:
+        raise ValueError("too many pixels")
+    # JPEGs can decode straight at 1/2, 1/4 or 1/8 scale, much faster than decode-then-resize
+    largest = max(SIZES)
+    image.draft('RGB', (largest, largest))
+    image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        flat = Image.new('RGB', image.size, 'white')
+        flat.paste(image, mask=image.getchannel('A'))
+        return image_format, flat
+    return image_format, image.convert('RGB')
+
+
+def encode(image, size, image_format):
+    thumbnail = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    thumbnail.save(buffer, image_format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def store(storage, name, data):
+    '''Write `data` under its content-derived `name` unless the file is already there'''
+    if storage.exists(name):
+        return
+    saved = storage.save(name, ContentFile(data))
+    if saved != name:
+        # An identical upload got there first
+        storage.delete(saved)
+
+
+def process(model, pk, field='profile_picture'):
+    '''Thumbnail the pending upload of one row; returns the new status, or None if nothing was pending'''
+    obj = model._default_manager.filter(pk=pk, avatar_status=PENDING).first()
+    if obj is None:
+        return None
+    upload = getattr(obj, field)
+    # Only finish if the row still holds this upload; the user may have sent a newer one
+    still_pending = model._default_manager.filter(pk=pk, avatar_status=PENDING, **{field: upload.name})
+    try:
+        with upload.open('rb'):
+            data = upload.read()
+        digest = hashlib.sha256(data).hexdigest()
+        image_format, image = decode(data)
+        original = original_name(digest, EXTENSIONS[image_format])
+        store(upload.storage, original, data)
+        for size in SIZES:
+            for key, (thumbnail_format, _) in FORMATS.items():
+                store(upload.storage, thumbnail_name(digest, size, key), encode(image, size, thumbnail_format))
+    except (OSError, ValueError, SyntaxError, Image.DecompressionBombError) as exc:
+        logger.warning("Avatar for %s %s failed: %s", model._meta.label, pk, exc)
+        if not still_pending.update(avatar_status=FAILED):
+            # Superseded: nothing refers to this upload any more
+            upload.storage.delete(upload.name)
+        return FAILED
+
+    # Whether the row now points at the original or was superseded by a newer
+    # upload, nothing refers to this upload any more
+    still_pending.update(avatar_status=READY, avatar_hash=digest, **{field: original})
+    if upload.name != original:
+        upload.storage.delete(upload.name)
+    return READY
+
+
+def _run(model, pk, field):
+    try:
+        process(model, pk, field)
+    except Exception:
+        logger.exception("Avatar for %s %s crashed", model._meta.label, pk)
+    finally:
+        # Pool threads outlive the job; don't leave their connections open
+        connections.close_all()
+
+
+def schedule(model, pk, field='profile_picture'):
+    '''Hand the row to the pool once the upload is committed'''
+    if executor is not None:
+        transaction.on_commit(lambda: executor.submit(_run, model, pk, field))
@@ -0,0 +1,61 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from taggit.models import Tag
+
+from blog.models import Post, Comment
+
+WORDS = "django python blog cache query template page post comment tag view model".split()
+
+
+class Command(BaseCommand):
+    help = "Compare anonymous requests/second on the post list and detail pages with and without the page cache"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=200, help="posts to generate up to")
+        parser.add_argument('--comments', type=int, default=20, help="comments per generated post")
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        self.generate(options['posts'], options['comments'])
+        detail = Post.objects.order_by('-created_at').values_list('pk', flat=True).first()
+        pages = {'list': '/posts/', 'list page 3': '/posts/?page=3', 'detail': f'/post/{detail}/'}
+
+        client = Client()
+        for label, url in pages.items():
+            for cached in (False, True):
+                with override_settings(BLOG_PAGE_CACHE=cached):
+                    client.get(url)  # warm up / fill the cache
+                    with CaptureQueriesContext(connection) as queries:
+                        start = time.perf_counter()
+                        for _ in range(options['requests']):
+                            client.get(url)
+                        elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{label:12} {'cached' if cached else 'uncached':9} {options['requests'] / elapsed:8.0f} req/s   "
+                    f"{len(queries) / options['requests']:.1f} queries/request"
+                )
+
+    def generate(self, target, comments_per_post):
+        existing = Post.objects.count()
+        if existing >= target:
+            return
+        self.stdout.write(f"Generating {target - existing} posts...")
+        rng = random.Random(7)
+        author, _ = User.objects.get_or_create(username='page-benchmark')
+        posts = Post.objects.bulk_create([
+            Post(author=author, title=" ".join(rng.choices(WORDS, k=4)), content=" ".join(rng.choices(WORDS, k=200)))
+            for _ in range(target - existing)
+        ])
+        Comment.objects.bulk_create([
+            Comment(post=post, author=author, content=" ".join(rng.choices(WORDS, k=20)))
+            for post in posts for _ in range(comments_per_post)
+        ])
+        tags = [Tag.objects.get_or_create(name=word, slug=word)[0] for word in WORDS[:5]]
+        for post in posts:
+            post.tags.add(*rng.sample(tags, 3))
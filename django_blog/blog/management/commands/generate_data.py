@@ -0,0 +1,134 @@
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+from taggit.models import Tag, TaggedItem
+
+from blog.cache import bump, LIST_VERSION_KEY
+from blog.comments import rebuild_threads
+from blog.models import Post, Profile, Comment
+from blog.search import SEARCH_CONFIG
+from blog.tags import rebuild_stats
+
+WORDS = (
+    "django python blog cache query template page post comment tag view model "
+    "travel music coffee weekend design photo sunset mountain river city night "
+    "code deploy server release review garden recipe book movie"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users, posts, comments and tags in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--posts', type=int, default=10, help="average posts per user")
+        parser.add_argument('--comments', type=int, default=5, help="average comments per post")
+        parser.add_argument('--tags', type=int, default=500, help="distinct tags to draw from")
+        parser.add_argument('--tags-per-post', type=int, default=3)
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+
+        users = self.step("users", self.make_users, options['users'])
+        posts = self.step("posts", self.make_posts, users, options['users'] * options['posts'])
+        self.step("comments", self.make_comments, users, posts, len(posts) * options['comments'])
+        self.step("comment threads", rebuild_threads)
+        tags = self.step("tags", self.make_tags, options['tags'])
+        self.step("tagging", self.tag_posts, posts, tags, options['tags_per_post'])
+        self.step("tag stats", rebuild_stats)
+        if connection.vendor == 'postgresql':
+            self.step("search", self.index_posts, posts)
+        # bulk_create skips blog.signals, so drop the cached list pages by hand. The stamp
+        # is a CacheVersion row, so running web workers see the bump too (rebuild_stats
+        # already bumped the tags stamp)
+        bump(LIST_VERSION_KEY)
+
+    def step(self, label, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stdout.write(f"{label:10} {time.perf_counter() - start:8.1f}s")
+        return result
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def words(self, low, high):
+        return " ".join(self.rng.choices(WORDS, k=self.rng.randint(low, high)))
+
+    def make_users(self, total):
+        # Profiles would be created on first access; making them here spares those writes.
+        # An unusable password skips hashing, which would dominate the run.
+        offset = User.objects.count()
+        ids = []
+        for size in self.batches(total):
+            created = User.objects.bulk_create([
+                User(username=f'user{offset + i}', email=f'user{offset + i}@example.com', password='!')
+                for i in range(size)
+            ])
+            offset += size
+            Profile.objects.bulk_create([Profile(user=user) for user in created])
+            ids.extend(user.pk for user in created)
+        return ids
+
+    def make_posts(self, users, total):
+        ids = []
+        for size in self.batches(total):
+            created = Post.objects.bulk_create([
+                Post(author_id=self.rng.choice(users), title=self.words(3, 8).capitalize(), content=self.words(50, 400))
+                for _ in range(size)
+            ])
+            ids.extend(post.pk for post in created)
+        return ids
+
+    def make_comments(self, users, posts, total):
+        for size in self.batches(total):
+            Comment.objects.bulk_create([
+                Comment(post_id=self.rng.choice(posts), author_id=self.rng.choice(users), content=self.words(3, 40))
+                for _ in range(size)
+            ])
+
+    def make_tags(self, total):
+        Tag.objects.bulk_create(
+            [Tag(name=f'{self.rng.choice(WORDS)}-{i}', slug=f'generated-{i}') for i in range(total)],
+            ignore_conflicts=True,
+        )
+        return list(Tag.objects.filter(slug__startswith='generated-').values_list('pk', flat=True))
+
+    def tag_posts(self, posts, tags, per_post):
+        content_type = ContentType.objects.get_for_model(Post)
+        per_post = min(per_post, len(tags))
+        for start in range(0, len(posts), self.batch_size):
+            TaggedItem.objects.bulk_create([
+                TaggedItem(content_type=content_type, object_id=post_id, tag_id=tag_id)
+                for post_id in posts[start:start + self.batch_size]
+                for tag_id in self.rng.sample(tags, per_post)
+            ], ignore_conflicts=True)
+
+    def index_posts(self, posts):
+        '''Same vector as blog.search.build_search_vector, one UPDATE per batch'''
+        tag_names = (
+            TaggedItem.objects.filter(content_type=ContentType.objects.get_for_model(Post), object_id=OuterRef('pk'))
+            .order_by()
+            .values('object_id')
+            .annotate(names=StringAgg('tag__name', ' '))
+            .values('names')
+        )
+        vector = (
+            SearchVector('title', weight='A', config=SEARCH_CONFIG)
+            + SearchVector(Coalesce(Subquery(tag_names, output_field=TextField()), Value('')), weight='B', config=SEARCH_CONFIG)
+            + SearchVector('content', weight='C', config=SEARCH_CONFIG)
+        )
+        for start in range(0, len(posts), self.batch_size):
+            Post.objects.filter(pk__in=posts[start:start + self.batch_size]).update(search_vector=vector)
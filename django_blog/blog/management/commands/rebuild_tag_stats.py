@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from blog.tags import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-tag post counts behind the tag cloud, e.g. after a bulk load"
+
+    def handle(self, *args, **options):
+        in_use = rebuild_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {in_use} tags"))
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:15
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# Same weighting as blog.search.build_search_vector, computed in bulk for existing posts
+BACKFILL_SQL = '''
+UPDATE blog_post SET search_vector =
+    setweight(to_tsvector('english', title), 'A') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(tag.name, ' ')
+        FROM taggit_taggeditem item
+        JOIN taggit_tag tag ON tag.id = item.tag_id
+        JOIN django_content_type ct ON ct.id = item.content_type_id
+        WHERE ct.app_label = 'blog' AND ct.model = 'post' AND item.object_id = blog_post.id
+    ), '')), 'B') ||
+    setweight(to_tsvector('english', content), 'C');
+
+CREATE INDEX blog_post_search_vector_idx ON blog_post USING gin (search_vector);
+'''
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(BACKFILL_SQL)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS blog_post_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_delete_tag_post_created_at_post_tags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Same figures as blog.tags.rebuild_stats, for the posts tagged so far
+BACKFILL_SQL = '''
+INSERT INTO blog_tagstat (tag_id, post_count, last_used_at)
+SELECT item.tag_id, COUNT(*), MAX(post.created_at)
+FROM taggit_taggeditem item
+JOIN blog_post post ON post.id = item.object_id
+JOIN django_content_type ct ON ct.id = item.content_type_id
+WHERE ct.app_label = 'blog' AND ct.model = 'post'
+GROUP BY item.tag_id;
+'''
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_search_vector'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagStat',
+            fields=[
+                ('tag', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stat', serialize=False, to='taggit.tag')),
+                ('post_count', models.PositiveIntegerField(default=0)),
+                ('last_used_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-post_count'], name='blog_tagstat_count_idx')],
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
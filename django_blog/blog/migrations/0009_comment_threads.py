@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Concat, LPad
+
+
+def backfill(apps, schema_editor):
+    # Every existing comment is a top-level one
+    Comment = apps.get_model('blog', 'Comment')
+    Post = apps.get_model('blog', 'Post')
+    Comment.objects.update(path=Concat(LPad(Cast('id', models.CharField()), 10, Value('0')), Value('/')))
+    counted = (
+        Comment.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('*')).values('total')
+    )
+    total = Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+    Post.objects.update(comment_count=total, thread_count=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_avatars'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='blog.comment'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='thread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'path'], name='blog_comment_thread_idx'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
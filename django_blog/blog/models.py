@@ -1,9 +1,11 @@
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
-from PIL import Image
-from django.dispatch import receiver
-from django.db.models.signals import post_save
 from taggit.managers import TaggableManager
+from taggit.models import Tag
+from django.contrib.postgres.search import SearchVectorField
+from .images import STATUS_CHOICES as AVATAR_STATUS_CHOICES
 
 
 class Post(models.Model):
@@ -13,28 +15,47 @@ class Post(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE) 
     created_at = models.DateTimeField(auto_now_add=True)
     tags = TaggableManager()
+    # Title, tag names and content; kept current by blog.signals, GIN index created in migration 0006
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Denormalized from the comments table by blog.signals: all comments, and top-level ones only
+    comment_count = models.PositiveIntegerField(default=0)
+    thread_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.title 
+
+    @staticmethod
+    def adjust_comment_count(post_id, delta, threads=0):
+        Post.objects.filter(pk=post_id).update(
+            comment_count=Greatest(F('comment_count') + delta, 0),
+            thread_count=Greatest(F('thread_count') + threads, 0),
+        )
     
+class ProfileManager(models.Manager):
+    def for_user(self, user):
+        '''The user's profile, created on first access instead of at sign-up'''
+        try:
+            return user.profile
+        except Profile.DoesNotExist:
+            profile, _ = self.get_or_create(user=user)
+            user.profile = profile
+            return profile
+
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     bio = models.TextField(blank=True)
     profile_picture = models.ImageField(upload_to='profile_pics', default='profile_pics/default.jpg')
+    # Filled in by blog.images once the upload has been thumbnailed
+    avatar_status = models.CharField(max_length=10, choices=AVATAR_STATUS_CHOICES, blank=True, default='')
+    avatar_hash = models.CharField(max_length=64, blank=True, default='')
+
+    objects = ProfileManager()
 
     def __str__(self):
         return f"{self.user.username}'s profile"
     
-#Signals for profile creation/update automatically
-
-@receiver(post_save, sender=User)
-def create_profile(sender, instance, created, **kwargs):
-    if created:
-        Profile.objects.create(User=instance)
-
-@receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    instance.profile.save() 
+PATH_STEP = 11  # ten zero-padded digits of a comment id and a '/'
 
 
 class Comment(models.Model):
@@ -43,10 +64,55 @@ class Comment(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies')
+    # Materialized path: the ids from the thread's top comment down to this one,
+    # e.g. '0000000012/0000000040/'. A subtree is one range scan on (post, path).
+    path = models.CharField(max_length=255, editable=False, default='')
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}" 
     
     class Meta:
         ordering = ['-created_at'] 
+        indexes = [
+            models.Index(fields=['post', 'path'], name='blog_comment_thread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if not self.path:
+            # The path ends in our own id, so it can only be set once we have one
+            self.path = (self.parent.path if self.parent_id else '') + f'{self.pk:010d}/'
+            Comment.objects.filter(pk=self.pk).update(path=self.path)
+
+    @property
+    def depth(self):
+        return len(self.path) // PATH_STEP - 1
+
+    @property
+    def thread_id(self):
+        return int(self.path[:PATH_STEP - 1])
 
+
+class TagStat(models.Model):
+    '''How many posts use a tag and when it was last applied; kept current by blog.signals'''
+    tag = models.OneToOneField(Tag, on_delete=models.CASCADE, primary_key=True, related_name='stat')
+    post_count = models.PositiveIntegerField(default=0)
+    last_used_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-post_count'], name='blog_tagstat_count_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag.name}: {self.post_count}"
+
+
+class CacheVersion(models.Model):
+    '''Version stamp of a group of cached pages (see blog.cache); every worker reads the same row'''
+    key = models.CharField(max_length=100, unique=True)
+    stamp = models.BigIntegerField()  # time.time_ns() of the last write, never decreasing
+
+    def __str__(self):
+        return f"{self.key}: {self.stamp}"
@@ -0,0 +1,10 @@
+from django.core.paginator import Paginator
+
+
+class CountedPaginator(Paginator):
+    '''Paginator that trusts a known total instead of running COUNT(*)'''
+
+    def __init__(self, *args, count=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if count is not None:
+            self.count = count
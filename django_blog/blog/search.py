@@ -0,0 +1,47 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connections
+from django.db.models import F, Q, Value
+
+from .models import Post
+
+SEARCH_CONFIG = 'english'
+
+
+def build_search_vector(post):
+    '''Title and tag names weigh more than the body'''
+    tag_names = " ".join(post.tags.names())
+    return (
+        SearchVector('title', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Value(tag_names), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('content', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vector(post):
+    if connections[Post.objects.db].vendor != 'postgresql':
+        return
+    Post.objects.filter(pk=post.pk).update(search_vector=build_search_vector(post))
+
+
+def search_posts(query, queryset=None):
+    '''
+    Posts matching `query`, best match first.
+
+    Uses the GIN-indexed Post.search_vector on Postgres; other databases get
+    the old icontains lookup over title, content and tag names.
+    '''
+    if queryset is None:
+        queryset = Post.objects.all()
+    if connections[queryset.db].vendor != 'postgresql':
+        return queryset.filter(
+            Q(title__icontains=query) |
+            Q(content__icontains=query) |
+            Q(tags__name__icontains=query)
+        ).distinct().order_by('-created_at')
+
+    search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+    return (
+        queryset.filter(search_vector=search_query)
+        .annotate(rank=SearchRank(F('search_vector'), search_query))
+        .order_by('-rank', '-created_at')
+    )
@@ -0,0 +1,79 @@
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Post, Comment, Profile
+from .images import PENDING, is_new_upload, schedule
+from .search import update_search_vector
+from .cache import bump_post
+from .tags import tags_added, tags_removed
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    update_search_vector(instance)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_tags(sender, instance, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear') and isinstance(instance, Post):
+        update_search_vector(instance)
+        # The list pages show tags too
+        bump_post(instance.pk)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def count_post_tags(sender, instance, action, pk_set, **kwargs):
+    '''Keep TagStat in step; taggit passes only the tags actually added or removed'''
+    if not isinstance(instance, Post):
+        return
+    if action == 'post_add':
+        tags_added(pk_set)
+    elif action == 'post_remove':
+        tags_removed(pk_set)
+    elif action == 'pre_clear':
+        # clear() sends no pk_set
+        instance._cleared_tag_ids = list(instance.tags.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        tags_removed(instance.__dict__.pop('_cleared_tag_ids', []))
+
+
+@receiver(pre_delete, sender=Post)
+def uncount_post_tags(sender, instance, **kwargs):
+    # The tagged items go with the post without any m2m_changed signal
+    tags_removed(list(instance.tags.values_list('pk', flat=True)))
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    bump_post(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    # The list pages don't show comments
+    bump_post(instance.post_id, listed=False)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        Post.adjust_comment_count(instance.post_id, 1, threads=0 if instance.parent_id else 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    # Also sent for each reply deleted along with its thread
+    Post.adjust_comment_count(instance.post_id, -1, threads=0 if instance.parent_id else -1)
+
+
+@receiver(pre_save, sender=Profile)
+def mark_new_avatar(sender, instance, **kwargs):
+    instance._new_avatar = is_new_upload(instance.profile_picture)
+    if instance._new_avatar:
+        instance.avatar_status = PENDING
+        instance.avatar_hash = ''
+
+
+@receiver(post_save, sender=Profile)
+def process_new_avatar(sender, instance, **kwargs):
+    if instance.__dict__.pop('_new_avatar', False):
+        schedule(Profile, instance.pk)
@@ -0,0 +1,72 @@
+'''
+Per-tag post counts for the tag cloud and the per-tag listing.
+
+blog.signals keeps TagStat current as tags are added to or removed from
+posts (PostForm, the admin, post.tags.add/remove). `manage.py
+rebuild_tag_stats` recomputes every row after bulk loads that skip signals.
+'''
+import math
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import bump, TAG_VERSION_KEY
+from .models import Post, TagStat
+
+CLOUD_SIZE = getattr(settings, 'BLOG_TAG_CLOUD_SIZE', 100)
+CLOUD_WEIGHTS = 5
+
+
+def _changed():
+    transaction.on_commit(lambda: bump(TAG_VERSION_KEY))
+
+
+def tags_added(tag_ids):
+    if not tag_ids:
+        return
+    TagStat.objects.bulk_create([TagStat(tag_id=pk) for pk in tag_ids], ignore_conflicts=True)
+    TagStat.objects.filter(tag_id__in=tag_ids).update(post_count=F('post_count') + 1, last_used_at=timezone.now())
+    _changed()
+
+
+def tags_removed(tag_ids):
+    if not tag_ids:
+        return
+    TagStat.objects.filter(tag_id__in=tag_ids).update(post_count=Greatest(F('post_count') - 1, 0))
+    _changed()
+
+
+def rebuild_stats():
+    '''Recompute every row from the tagged posts; returns the number of tags in use'''
+    rows = (
+        Post.objects.filter(tags__isnull=False)
+        .values('tags')
+        .annotate(post_count=Count('id'), last_used_at=Max('created_at'))
+        .order_by()
+    )
+    stats = [TagStat(tag_id=row['tags'], post_count=row['post_count'], last_used_at=row['last_used_at']) for row in rows]
+    with transaction.atomic():
+        TagStat.objects.exclude(tag_id__in=[stat.tag_id for stat in stats]).update(post_count=0)
+        TagStat.objects.bulk_create(
+            stats, batch_size=1000,
+            update_conflicts=True, unique_fields=['tag'], update_fields=['post_count', 'last_used_at'],
+        )
+    _changed()
+    return len(stats)
+
+
+def cloud(limit=CLOUD_SIZE):
+    '''The `limit` most used tags by name, each with a weight from 1 to CLOUD_WEIGHTS on a log scale'''
+    stats = list(
+        TagStat.objects.filter(post_count__gt=0).select_related('tag').order_by('-post_count', 'tag__name')[:limit]
+    )
+    if not stats:
+        return []
+    low, high = math.log(stats[-1].post_count), math.log(stats[0].post_count)
+    for stat in stats:
+        share = (math.log(stat.post_count) - low) / (high - low) if high > low else 1
+        stat.weight = 1 + round(share * (CLOUD_WEIGHTS - 1))
+    return sorted(stats, key=lambda stat: stat.tag.name.lower())
@@ -1,3 +1,278 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
 
-# Create your tests here.
+from querymetrics.testing import QueryBudgetMixin
+from . import cache as page_cache
+from .forms import PostForm
+from .models import CacheVersion, Post, Comment, Profile, TagStat
+from .comments import rebuild_threads, thread_page
+
+
+# Measure the uncached rendering; the page cache would hide the queries
+@override_settings(BLOG_PAGE_CACHE=False)
+class PageQueryBudgetTests(QueryBudgetMixin, TestCase):
+    '''List and detail pages must cost the same at 1, 10 and 100 rows'''
+
+    def setUp(self):
+        User.objects.bulk_create([User(username=f'writer{i}') for i in range(3)])
+        self.writers = list(User.objects.order_by('id'))
+        self.post = Post.objects.create(author=self.writers[0], title='Budget', content='body')
+        self.post.tags.add('django', 'cache')
+
+    def grow_posts(self, size):
+        missing = size - Post.objects.count()
+        Post.objects.bulk_create([
+            Post(author=self.writers[i % len(self.writers)], title=f'post {i}', content='body')
+            for i in range(missing)
+        ])
+
+    def grow_comments(self, size):
+        missing = size - self.post.comments.count()
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.writers[i % len(self.writers)], content='hi')
+            for i in range(missing)
+        ])
+        rebuild_threads()
+
+    def grow_tagged(self, size):
+        self.grow_posts(size)
+        for post in Post.objects.exclude(pk=self.post.pk):
+            post.tags.add('django')
+
+    def test_post_list_budget(self):
+        # Version stamps, Last-Modified aggregate, COUNT for the paginator, the page with its authors, the page's tags
+        self.assertQueryBudgetScales(5, self.grow_posts, lambda: self.client.get(reverse('post-list')))
+
+    def test_post_detail_budget(self):
+        # Version stamp, Last-Modified aggregate, post with author, its tags, one page of comment threads with authors
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        self.assertQueryBudgetScales(5, self.grow_comments, lambda: self.client.get(url))
+
+    def test_posts_by_tag_budget(self):
+        # Version stamps, Last-Modified aggregate, tag with its stats (no COUNT), the page with its authors, the page's tags
+        url = reverse('posts-by-tag', kwargs={'tag_slug': 'django'})
+        self.client.get(url)  # content type lookup is cached per process
+        self.assertQueryBudgetScales(5, self.grow_tagged, lambda: self.client.get(url))
+
+
+class TagStatTests(TestCase):
+    def setUp(self):
+        User.objects.bulk_create([User(username='writer')])
+        self.writer = User.objects.get()
+        self.post = Post.objects.create(author=self.writer, title='Tags', content='body')
+
+    def count(self, name):
+        return TagStat.objects.get(tag__name=name).post_count
+
+    def test_form_save_counts_only_changed_tags(self):
+        form = PostForm({'title': 'Tags', 'content': 'body', 'tags': 'django, cache'}, instance=self.post)
+        form.save()
+        form = PostForm({'title': 'Tags', 'content': 'body', 'tags': 'cache, python'}, instance=self.post)
+        form.save()
+        self.assertEqual((self.count('django'), self.count('cache'), self.count('python')), (0, 1, 1))
+        self.assertIsNotNone(TagStat.objects.get(tag__name='python').last_used_at)
+
+    def test_clear_and_delete_uncount(self):
+        other = Post.objects.create(author=self.writer, title='Other', content='body')
+        self.post.tags.add('django')
+        other.tags.add('django')
+        self.post.tags.clear()
+        self.assertEqual(self.count('django'), 1)
+        other.delete()
+        self.assertEqual(self.count('django'), 0)
+
+    def test_tag_pages(self):
+        self.post.tags.add('django')
+        response = self.client.get(reverse('tag-cloud'))
+        self.assertContains(response, 'tag-weight-5')
+        response = self.client.get(reverse('posts-by-tag', kwargs={'tag_slug': 'django'}))
+        self.assertContains(response, '1 post')
+        self.assertContains(response, 'Tags')
+
+
+class CommentThreadTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='pw')
+        self.post = Post.objects.create(author=self.user, title='Threads', content='body')
+        self.client.force_login(self.user)
+
+    def comment(self, text, parent=None):
+        url = reverse('post-detail', kwargs={'pk': self.post.pk})
+        self.client.post(url, {'content': text, 'parent': parent.pk if parent else ''})
+        return Comment.objects.get(content=text)
+
+    def test_replies_follow_their_thread(self):
+        first = self.comment('first')
+        second = self.comment('second')
+        reply = self.comment('reply', parent=first)
+        nested = self.comment('nested', parent=reply)
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.thread_count), (4, 2))
+        self.assertEqual(nested.depth, 2)
+
+        page = thread_page(self.post, 1, per_page=1)
+        self.assertEqual([c.content for c in page], ['second'])
+        page = thread_page(self.post, 2, per_page=1)
+        self.assertEqual([c.content for c in page], ['first', 'reply', 'nested'])
+
+    def test_deleting_a_thread_uncounts_its_replies(self):
+        first = self.comment('first')
+        self.comment('reply', parent=first)
+        self.comment('other')
+        first.delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.thread_count), (1, 1))
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('writer')
+        self.post = Post.objects.create(author=self.user, title='First', content='body')
+        self.detail = reverse('post-detail', kwargs={'pk': self.post.pk})
+        self.list = reverse('post-list')
+
+    def test_anonymous_pages_are_served_from_the_cache(self):
+        self.client.get(self.detail)
+        # Just the version stamp
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(self.detail), 'First')
+
+    def test_bump_from_another_process_reaches_this_one(self):
+        self.assertContains(self.client.get(self.list), 'First')
+        # What generate_data does: write without signals, then bump the list stamp.
+        # The stamp is a row, so no cache shared with that process is needed.
+        Post.objects.filter(pk=self.post.pk).update(title='Bulk')
+        CacheVersion.objects.update_or_create(key=page_cache.LIST_VERSION_KEY, defaults={'stamp': 1})
+        self.assertContains(self.client.get(self.list), 'Bulk')
+
+    def test_edit_bumps_list_and_detail(self):
+        self.client.get(self.list)
+        self.client.get(self.detail)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.title = 'Renamed'
+            self.post.save()
+        self.assertContains(self.client.get(self.list), 'Renamed')
+        self.assertContains(self.client.get(self.detail), 'Renamed')
+
+    def test_comment_bumps_only_its_post(self):
+        other = Post.objects.create(author=self.user, title='Second', content='body')
+        versions = [page_cache.get_versions([key]) for key in (
+            page_cache.LIST_VERSION_KEY,
+            page_cache.POST_VERSION_KEY.format(self.post.pk),
+            page_cache.POST_VERSION_KEY.format(other.pk),
+        )]
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.user, content='new comment')
+        list_version, post_version, other_version = versions
+        self.assertEqual(page_cache.get_versions([page_cache.LIST_VERSION_KEY]), list_version)
+        self.assertNotEqual(page_cache.get_versions([page_cache.POST_VERSION_KEY.format(self.post.pk)]), post_version)
+        self.assertEqual(page_cache.get_versions([page_cache.POST_VERSION_KEY.format(other.pk)]), other_version)
+        self.assertContains(self.client.get(self.detail), 'new comment')
+
+    def test_stamp_is_bumped_only_after_commit(self):
+        key = page_cache.POST_VERSION_KEY.format(self.post.pk)
+        before = page_cache.get_versions([key])
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post.save()
+            # A reader inside the write's window still sees the old stamp
+            self.assertEqual(page_cache.get_versions([key]), before)
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(page_cache.get_versions([key]), before)
+
+
+purged = []
+
+
+def record_purge(keys):
+    purged.extend(keys)
+
+
+@override_settings(BLOG_CDN_PURGE='blog.tests.record_purge')
+class HttpCachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        purged.clear()
+        self.user = User.objects.create_user('writer', password='pw')
+        self.post = Post.objects.create(author=self.user, title='Fresh', content='body')
+        self.url = reverse('post-detail', kwargs={'pk': self.post.pk})
+
+    def test_revalidation_skips_the_view(self):
+        response = self.client.get(self.url)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('s-maxage', response['Cache-Control'])
+        self.assertEqual(response['Surrogate-Key'], f'blog-version-post-{self.post.pk}')
+
+        # The freshness check is memoized with the page; only the version stamp is read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_new_comment_changes_validators_and_purges(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=self.post, author=self.user, content='hi')
+        self.assertIn(f'blog-version-post-{self.post.pk}', purged)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_validators_come_from_the_content(self):
+        first = self.client.get(self.url)
+        # Another worker, with nothing cached
+        cache.clear()
+        second = self.client.get(self.url)
+        self.assertEqual((first['ETag'], first['Last-Modified']), (second['ETag'], second['Last-Modified']))
+        self.assertEqual(first['Last-Modified'], http_date(int(self.post.created_at.timestamp())))
+        self.assertEqual(purged, [])
+
+    def test_logged_in_pages_are_not_shared(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertNotIn('public', response.get('Cache-Control', ''))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        author = User.objects.create_user('author')
+        self.by_title = Post.objects.create(author=author, title='Django tips', content='body')
+        self.by_content = Post.objects.create(author=author, title='Notes', content='more django here')
+        self.by_tag = Post.objects.create(author=author, title='Misc', content='body')
+        self.by_tag.tags.add('django')
+        Post.objects.create(author=author, title='Flask', content='unrelated')
+
+    def test_list_and_search_views_share_results(self):
+        expected = {self.by_title.pk, self.by_content.pk, self.by_tag.pk}
+        for url in (reverse('post-list'), reverse('search-results')):
+            response = self.client.get(url, {'q': 'django'})
+            self.assertEqual({post.pk for post in response.context['posts']}, expected, url)
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='reader', email='reader@example.com', password='pw')
+        self.client.force_login(self.user)
+
+    def test_profile_created_on_first_visit(self):
+        self.assertFalse(Profile.objects.filter(user=self.user).exists())
+        self.assertEqual(self.client.get(reverse('profile')).status_code, 200)
+        self.assertTrue(Profile.objects.filter(user=self.user).exists())
+
+    def test_user_and_profile_load_together(self):
+        Profile.objects.create(user=self.user)
+        # session, then the user joined with its profile
+        with self.assertNumQueries(2):
+            self.client.get(reverse('profile'))
+
+    def test_unchanged_submit_writes_nothing(self):
+        Profile.objects.create(user=self.user, bio='hi')
+        data = {'username': 'reader', 'email': 'reader@example.com', 'bio': 'hi'}
+        # session, user with profile, the username uniqueness check; no UPDATEs
+        with self.assertNumQueries(3):
+            response = self.client.post(reverse('profile'), data)
+        self.assertRedirects(response, reverse('profile'), fetch_redirect_response=False)
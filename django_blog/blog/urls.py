@@ -2,7 +2,7 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
-from .views import  PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, CommentCreateView,CommentDeleteView, CommentUpdateView, SearchResultsView, PostByTagListView
+from .views import  PostListView, PostDetailView, PostCreateView, PostUpdateView, PostDeleteView, CommentCreateView,CommentDeleteView, CommentUpdateView, SearchResultsView, PostByTagListView, TagCloudView
 
 
 
@@ -13,6 +13,7 @@ urlpatterns = [
     path('register/', views.register, name='register'),
     path('profile/', views.profile, name='profile'),
 
+    path('', PostListView.as_view(), name='home'),
     path('posts/', PostListView.as_view(), name='post-list'),
     path('post/new/', PostCreateView.as_view(), name='post-create'),
     path('post/<int:pk>/', PostDetailView.as_view(), name='post-detail'),
@@ -22,6 +23,7 @@ urlpatterns = [
     path('post/<int:pk>/comments/new/',CommentCreateView.as_view(), name='add-comment'),
     path('comment/<int:pk>/update/', CommentUpdateView.as_view(), name='comment-update'),
     path('comment/<int:pk>/delete/', CommentDeleteView.as_view(), name='comment-delete'),
+    path('tags/', TagCloudView.as_view(), name='tag-cloud'),
     path('tags/<slug:tag_slug>/', PostByTagListView.as_view(), name='posts-by-tag'),
     path('search/', SearchResultsView.as_view(), name='search-results'),
 ]
@@ -3,10 +3,18 @@ from django.contrib import messages
 from .forms import CustomUserCreationForm, UserUpdateForm, ProfileUpdateForm, CommentForm, PostForm
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView, DetailView, DeleteView, CreateView, UpdateView
-from .models import Post, Comment
+from .models import Post, Comment, Profile, TagStat
+from django.db.models import Max
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy, reverse
 from taggit.models import Tag
+from django.utils.functional import SimpleLazyObject
+from .pagination import CountedPaginator
+from .comments import thread_page, reply_parent
+from .search import search_posts
+from .cache import AnonymousPageCacheMixin, LIST_VERSION_KEY, POST_VERSION_KEY, TAG_VERSION_KEY
+from .tags import cloud
+from .images import avatar_urls
 
 def register(request):
     if request.method == 'POST':
@@ -22,51 +30,74 @@ def register(request):
 
 @login_required
 def profile(request):
+    # request.user comes with its profile (blog.backends.ProfileBackend)
+    user_profile = Profile.objects.for_user(request.user)
     if request.method == 'POST':
         u_form = UserUpdateForm(request.POST, instance=request.user)
-        p_form = ProfileUpdateForm(request.POST, request.FILES, instance=request.user.profile)
+        p_form = ProfileUpdateForm(request.POST, request.FILES, instance=user_profile)
 
         if u_form.is_valid() and p_form.is_valid():
-            u_form.save()
-            p_form.save()
+            # Only write what was actually edited
+            if u_form.has_changed():
+                u_form.save()
+            if p_form.has_changed():
+                p_form.save()
             messages.success(request, 'Your profile has been updated successfully.')
             return redirect('profile')
     else:
         u_form = UserUpdateForm(instance=request.user)
-        p_form = ProfileUpdateForm(instance=request.user.profile)
+        p_form = ProfileUpdateForm(instance=user_profile)
 
-    return render(request, 'blog/profile.html', {'u_form': u_form, 'p_form': p_form})
+    avatar = avatar_urls(user_profile)
+    return render(request, 'blog/profile.html', {'u_form': u_form, 'p_form': p_form, 'avatar': avatar})
 
 #Show all posts
-class PostListView(ListView):
+class PostListView(AnonymousPageCacheMixin, ListView):
     model = Post
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
     ordering = ['-created_at']
+    paginate_by = 10
+
+    def get_last_modified(self):
+        return Post.objects.aggregate(newest=Max('created_at'))['newest']
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        # One extra query fetches the tags of the whole page
+        queryset = super().get_queryset().select_related('author').prefetch_related('tags')
         query = self.request.GET.get('q')
 
         if query:
-            queryset = queryset.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(tags__name__icontains=query)  
-            ).distinct()
+            queryset = search_posts(query, queryset)
         return queryset
 
 
 #Show a single post
-class PostDetailView(DetailView):
+class PostDetailView(AnonymousPageCacheMixin, DetailView):
     model = Post
     template_name = 'blog/post_detail.html'
 
+    def get_version_keys(self):
+        return [POST_VERSION_KEY.format(self.kwargs['pk'])]
+
+    def get_last_modified(self):
+        # None for a missing post, which then 404s as usual
+        times = Post.objects.filter(pk=self.kwargs['pk']).aggregate(
+            created=Max('created_at'), commented=Max('comments__updated_at'),
+        )
+        return max(filter(None, times.values()), default=None)
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('author')
+
     def get_context_data(self, **kwargs):
         """Adds extra data to the template context in addition to what Django already provides"""
         context = super().get_context_data(**kwargs)
-        context['comments'] = self.object.comments.all().order_by('-created_at')
-        context['form'] = CommentForm()
+        # Lazy: not evaluated at all when the comments fragment comes from the cache
+        number = self.request.GET.get('comments')
+        context['comments_page'] = SimpleLazyObject(lambda: thread_page(self.object, number))
+        context.setdefault('form', CommentForm())
+        context['reply_to'] = self.request.GET.get('reply', '')
         return context
 
     def post(self, request, *args, **kwargs):
@@ -77,6 +108,7 @@ class PostDetailView(DetailView):
             comment = form.save(commit=False)
             comment.post = self.object
             comment.author = request.user
+            comment.parent = reply_parent(self.object, request.POST.get('parent'))
             comment.save()
             return redirect('post-detail', pk=self.object.pk)
         context = self.get_context_data(form=form)
@@ -128,6 +160,7 @@ class CommentCreateView(LoginRequiredMixin, CreateView):
         post = get_object_or_404(Post, pk=self.kwargs['pk']) 
         form.instance.post = post  
         form.instance.author = self.request.user  
+        form.instance.parent = reply_parent(post, self.request.POST.get('parent'))
         return super().form_valid(form)
 
     def get_success_url(self):
@@ -160,31 +193,61 @@ class CommentDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user == comment.author
 
 
-class PostByTagListView(ListView):
+class PostByTagListView(AnonymousPageCacheMixin, ListView):
     model = Post
     template_name = 'blog/posts_by_tag.html'
     context_object_name = 'posts'
+    paginate_by = 10
+
+    def get_version_keys(self):
+        return [LIST_VERSION_KEY, TAG_VERSION_KEY]
+
+    def get_last_modified(self):
+        # last_used_at moves whenever a post gets this tag
+        return TagStat.objects.filter(tag__slug=self.kwargs['tag_slug']).aggregate(newest=Max('last_used_at'))['newest']
 
     def get_queryset(self):
-        self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
-        return Post.objects.filter(tags__in=[self.tag])
+        self.tag = get_object_or_404(Tag.objects.select_related('stat'), slug=self.kwargs['tag_slug'])
+        return (
+            Post.objects.filter(tags=self.tag)
+            .select_related('author')
+            .prefetch_related('tags')
+            .order_by('-created_at', '-pk')
+        )
+
+    def get_paginator(self, queryset, per_page, **kwargs):
+        # The tag's post count is already in TagStat
+        stat = getattr(self.tag, 'stat', None)
+        return CountedPaginator(queryset, per_page, count=stat.post_count if stat else None, **kwargs)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['tag'] = self.tag
-        return context 
-    
+        return context
+
+
+class TagCloudView(AnonymousPageCacheMixin, ListView):
+    template_name = 'blog/tag_cloud.html'
+    context_object_name = 'tags'
+
+    def get_version_keys(self):
+        return [TAG_VERSION_KEY]
+
+    def get_last_modified(self):
+        return TagStat.objects.aggregate(newest=Max('last_used_at'))['newest']
+
+    def get_queryset(self):
+        return cloud()
+
+
 class SearchResultsView(ListView):
     model = Post
     template_name = 'blog/search_results.html'
     context_object_name = 'posts'
+    paginate_by = 10
 
     def get_queryset(self):
         query = self.request.GET.get('q')
         if query:
-            return Post.objects.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(tags__name__icontains=query)
-            ).distinct()
-        return Post.objects.none() 
\ No newline at end of file
+            return search_posts(query).select_related('author').prefetch_related('tags')
+        return Post.objects.none()
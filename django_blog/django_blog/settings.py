@@ -46,9 +46,11 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'blog',
     'taggit',
+    'querymetrics',
 ]
 
 MIDDLEWARE = [
+    'querymetrics.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +98,9 @@ DATABASES = {
 }
 
 
+AUTHENTICATION_BACKENDS = ['blog.backends.ProfileBackend']  # ModelBackend that fetches the profile with the user
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -138,3 +143,25 @@ STATICFILES_DIRS = [BASE_DIR / "blog" / "static"]
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Cached pages and fragments (see blog/cache.py)
+BLOG_PAGE_CACHE = True
+BLOG_CACHE_TIMEOUT = 600  # seconds; writes invalidate earlier through version stamps
+BLOG_TAG_CLOUD_SIZE = 100  # most used tags shown on /tags/
+BLOG_COMMENTS_PER_PAGE = 20  # top-level threads per page on the post detail page
+BLOG_COMMENT_MAX_DEPTH = 6  # deeper replies are attached to the parent's level
+BLOG_HTTP_MAX_AGE = 0  # seconds browsers reuse an anonymous page before revalidating it
+BLOG_HTTP_SHARED_MAX_AGE = 600  # seconds a CDN may keep one; purges end it sooner
+BLOG_SURROGATE_KEY_HEADER = 'Surrogate-Key'  # response header a CDN purges by (space-separated keys)
+BLOG_CDN_PURGE = None  # dotted path to a callable taking a list of surrogate keys
+
+AVATAR_WORKERS = 2  # threads thumbnailing uploaded profile pictures; 0 leaves it all to manage.py process_avatars
+AVATAR_SIZES = (64, 256)  # square thumbnail edges in pixels, each written as WebP and JPEG
+AVATAR_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+AVATAR_MAX_PIXELS = 40_000_000  # larger images are refused before anything is decoded
+
+# Request/query instrumentation (see querymetrics/)
+QUERY_METRICS_SAMPLE_RATE = 1.0  # share of requests whose queries are recorded
+QUERY_METRICS_SLOW_MS = 500  # requests slower than this are logged with their worst queries
+QUERY_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # who may scrape /metrics
+QUERY_METRICS_LOADTEST_ENDPOINTS = ['/posts/@3', '/posts/?page=2', '/post/1/@3']  # default paths (@weight) for manage.py loadtest
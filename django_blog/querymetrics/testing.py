@@ -0,0 +1,41 @@
+'''
+Query budgets for tests.
+
+Mix QueryBudgetMixin into a TestCase and declare how many queries a view may
+issue. assertQueryBudgetScales repeats the check at several table sizes, so a
+per-row query (N+1) fails even if the count at one row happens to fit. A
+failure lists the SQL that ran, with repeated statements marked.
+'''
+from collections import Counter
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetMixin:
+    budget_sizes = (1, 10, 100)
+
+    def assertQueryBudget(self, budget, func, using=DEFAULT_DB_ALIAS, label=''):
+        '''Run func() and fail if it issues more than `budget` queries; returns its result'''
+        with CaptureQueriesContext(connections[using]) as context:
+            result = func()
+        if len(context) > budget:
+            self.fail(self._budget_report(budget, context.captured_queries, label))
+        return result
+
+    def assertQueryBudgetScales(self, budget, grow, func, sizes=None, using=DEFAULT_DB_ALIAS):
+        '''
+        For each size call grow(size) to bring the data up to that many rows,
+        then assert func() stays within `budget` queries.
+        '''
+        for size in sizes or self.budget_sizes:
+            grow(size)
+            self.assertQueryBudget(budget, func, using=using, label=f' at {size} rows')
+
+    def _budget_report(self, budget, queries, label):
+        repeats = Counter(query['sql'] for query in queries)
+        lines = [f"{len(queries)} queries{label}, budget is {budget}:"]
+        for number, query in enumerate(queries, 1):
+            marker = f"  [x{repeats[query['sql']]}]" if repeats[query['sql']] > 1 else ""
+            lines.append(f"{number:3}. {query['sql']}{marker}")
+        return "\n".join(lines)
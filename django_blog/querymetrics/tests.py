@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from .middleware import QueryRecorder, recording
+from .registry import registry
+
+
+class QueryMetricsSmokeTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def test_installed_and_recording(self):
+        self.assertIn('querymetrics.middleware.QueryMetricsMiddleware', settings.MIDDLEWARE)
+        with recording(QueryRecorder()) as recorder:
+            get_user_model().objects.count()
+        self.assertEqual(recorder.count, 1)
+
+    def test_requests_show_up_on_the_metrics_endpoint(self):
+        self.client.get('/metrics')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('django_http_requests_total{view="metrics",method="GET"} 1', response.content.decode())
@@ -0,0 +1,127 @@
+'''
+Login helpers that keep password hashing off the request threads.
+
+Hashing runs in a small dedicated thread pool (LOGIN_HASH_WORKERS). When
+more than LOGIN_MAX_PENDING checks are already queued, new logins are turned
+away instead of piling up behind them. Failed attempts are counted per
+username and per client IP in sliding windows, in the shared cache so the
+limits hold across processes. Once a key is over its limit, further attempts
+are rejected before any hashing.
+'''
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+from django.core.cache import cache
+
+HASH_WORKERS = getattr(settings, 'LOGIN_HASH_WORKERS', 4)
+MAX_PENDING = getattr(settings, 'LOGIN_MAX_PENDING', 64)
+USERNAME_LIMIT = getattr(settings, 'LOGIN_USERNAME_RATE_LIMIT', (10, 300))  # failures, seconds
+IP_LIMIT = getattr(settings, 'LOGIN_IP_RATE_LIMIT', (50, 300))
+
+executor = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix='login-hash')
+
+
+class Busy(Exception):
+    '''Too many password checks already waiting'''
+
+
+class SlidingWindowLimiter:
+    '''
+    Sliding-window failure counter.
+
+    Counts live in the shared cache as two fixed windows; the estimate weights
+    the previous window by how much of it still overlaps the sliding one.
+    Keys found over the limit also get a block entry there, which expires when
+    the current window rolls over. Every process sees the same counts and
+    blocks, and one get_many() answers a check.
+    '''
+
+    def __init__(self, scope, limit, window):
+        self.scope = scope
+        self.limit = limit
+        self.window = window
+
+    def _keys(self, key, now):
+        index = int(now // self.window)
+        return [f'login:{self.scope}:{key}:{index}', f'login:{self.scope}:{key}:{index - 1}']
+
+    def _block_key(self, key):
+        return f'login:{self.scope}:{key}:blocked'
+
+    def retry_after(self, key):
+        '''Seconds until `key` may try again, or 0 if it may now'''
+        now = time.time()
+        block_key = self._block_key(key)
+        current_key, previous_key = self._keys(key, now)
+        values = cache.get_many([block_key, current_key, previous_key])
+        until = values.get(block_key)
+        if until is not None and until > now:
+            return until - now
+
+        overlap = 1 - (now % self.window) / self.window
+        estimate = values.get(current_key, 0) + values.get(previous_key, 0) * overlap
+        if estimate < self.limit:
+            return 0
+        # Blocked at least until the current window rolls over
+        until = now + self.window - now % self.window
+        cache.set(block_key, until, math.ceil(until - now))
+        return until - now
+
+    def record_failure(self, key):
+        current_key, _ = self._keys(key, time.time())
+        cache.add(current_key, 0, 2 * self.window)
+        try:
+            cache.incr(current_key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(current_key, 1, 2 * self.window)
+
+
+username_limiter = SlidingWindowLimiter('user', *USERNAME_LIMIT)
+ip_limiter = SlidingWindowLimiter('ip', *IP_LIMIT)
+
+_pending = 0
+_pending_lock = threading.Lock()
+
+
+async def run_hashing(func, *args):
+    '''Run `func` on the hashing pool; raises Busy when the queue is full'''
+    global _pending
+    with _pending_lock:
+        if _pending >= MAX_PENDING:
+            raise Busy()
+        _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+    finally:
+        with _pending_lock:
+            _pending -= 1
+
+
+def needs_rehash(encoded):
+    '''True when `encoded` was made with another hasher or older parameters than the default one'''
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def verify(password, encoded):
+    '''
+    (matches, new encoded hash or None). A new hash is only made when the
+    password matched and the stored one needs upgrading.
+    '''
+    if encoded is None:
+        # Unknown user: spend the same time as a real check
+        make_password(password)
+        return False, None
+    if not check_password(password, encoded):
+        return False, None
+    return True, make_password(password) if needs_rehash(encoded) else None
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.models import CustomUser
+from social_media_api.authentication import CachedTokenAuthentication, local_cache, stats
+
+
+class PingView(APIView):
+    def get(self, request):
+        return Response({'user': request.user.pk})
+
+
+class Command(BaseCommand):
+    help = "Compare requests/second of TokenAuthentication and CachedTokenAuthentication on a trivial view"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+        parser.add_argument('--tokens', type=int, default=100, help="distinct users cycling through the requests")
+
+    def handle(self, *args, **options):
+        keys = []
+        for i in range(options['tokens']):
+            user, _ = CustomUser.objects.get_or_create(username=f'auth-benchmark-{i}')
+            keys.append(Token.objects.get_or_create(user=user)[0].key)
+
+        factory = RequestFactory()
+        requests = [
+            factory.get('/ping/', HTTP_AUTHORIZATION=f'Token {keys[i % len(keys)]}')
+            for i in range(options['requests'])
+        ]
+
+        local_cache.clear()
+        stats.reset()
+        for label, auth_class in [('TokenAuthentication', TokenAuthentication),
+                                  ('CachedTokenAuthentication', CachedTokenAuthentication)]:
+            view = PingView.as_view(authentication_classes=[auth_class])
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for request in requests:
+                    view(request)
+                elapsed = time.perf_counter() - start
+            self.stdout.write(
+                f"{label:28} {len(requests) / elapsed:9.0f} req/s   "
+                f"{len(queries) / len(requests):.3f} queries/request"
+            )
+        self.stdout.write(f"cache: {stats.snapshot()}")
@@ -0,0 +1,97 @@
+import random
+import statistics
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Max, Min
+
+from accounts.graph import Follow, followers_of, following_of, mutual_follows, followed_by_following
+from accounts.models import CustomUser
+
+PAGE = 21  # one page plus the look-ahead row the paginator fetches
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic follow graph and time the follower/following/mutual queries on it"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help="graph size to generate up to")
+        parser.add_argument('--edges', type=int, default=50_000_000)
+        parser.add_argument('--skew', type=float, default=3.0, help="higher values concentrate followers on fewer accounts")
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        self.generate(options['users'], options['edges'], options['skew'], options['batch_size'])
+
+        hot = CustomUser.objects.order_by('-follower_count').first()
+        typical = CustomUser.objects.filter(follower_count__gt=0).order_by('follower_count')[
+            CustomUser.objects.filter(follower_count__gt=0).count() // 2
+        ]
+        viewer = CustomUser.objects.order_by('-following_count').first()
+        middle_edge = Follow.objects.filter(from_customuser=hot).aggregate(Min('id'), Max('id'))
+        deep_cursor = (middle_edge['id__min'] + middle_edge['id__max']) // 2
+
+        self.stdout.write(f"hot account: {hot.follower_count} followers; typical: {typical.follower_count}; "
+                          f"viewer follows {viewer.following_count}")
+        cases = [
+            ("followers, hot, first page", followers_of(hot).order_by('-id')),
+            ("followers, hot, deep page", followers_of(hot).filter(id__lt=deep_cursor).order_by('-id')),
+            ("followers, typical", followers_of(typical).order_by('-id')),
+            ("following, viewer", following_of(viewer).order_by('-id')),
+            ("mutual, viewer", mutual_follows(viewer).order_by('-id')),
+            ("mutual, hot", mutual_follows(hot).order_by('-id')),
+            ("followed-by, typical", followed_by_following(viewer, typical).order_by('-id')),
+        ]
+        for label, queryset in cases:
+            self.stdout.write(f"{label:28} {self.time(queryset, options['repeat']):9.2f} ms")
+        # Includes building the cached adjacency on the first call
+        self.stdout.write(f"{'followed-by, hot':28} {self.time_call(lambda: followed_by_following(viewer, hot).order_by('-id'), options['repeat']):9.2f} ms")
+
+    def generate(self, users, edges, skew, batch_size):
+        existing = CustomUser.objects.count()
+        if existing < users:
+            self.stdout.write(f"Generating {users - existing} users...")
+            while existing < users:
+                size = min(batch_size, users - existing)
+                CustomUser.objects.bulk_create([
+                    CustomUser(username=f'graph-{existing + i}', password='!') for i in range(size)
+                ])
+                existing += size
+
+        existing_edges = Follow.objects.count()
+        if existing_edges >= edges:
+            return
+        first, last = CustomUser.objects.aggregate(Min('id'), Max('id')).values()
+        span = last - first + 1
+        rng = random.Random(42)
+        self.stdout.write(f"Generating about {edges - existing_edges} edges...")
+        while existing_edges < edges:
+            size = min(batch_size, edges - existing_edges)
+            batch = []
+            for _ in range(size):
+                # random() ** skew piles popularity onto the lowest ids
+                followed = first + int(span * rng.random() ** skew)
+                follower = first + rng.randrange(span)
+                if followed != follower:
+                    batch.append(Follow(from_customuser_id=followed, to_customuser_id=follower))
+            Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            existing_edges += size
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("ANALYZE accounts_customuser_followers")
+        call_command('rebuild_counters', stdout=self.stdout)
+
+    def time(self, queryset, repeat):
+        return self.time_call(lambda: queryset, repeat)
+
+    def time_call(self, build, repeat):
+        '''Median wall time in ms to build the queryset and fetch one page'''
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(build()[:PAGE])
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.recommendations import rebuild_all, rebuild_changed
+
+
+class Command(BaseCommand):
+    help = "Rebuild who-to-follow recommendations, incrementally from follow changes unless --full"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="recompute every user from the whole graph")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        if options['full']:
+            rebuilt = rebuild_all(options['batch_size'])
+        else:
+            rebuilt = rebuild_changed(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt recommendations for {rebuilt} users in {time.perf_counter() - start:.1f}s"
+        ))
@@ -0,0 +1,54 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.graph import add_edges
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Load follow edges from a CSV of follower_id,followed_id rows, streaming in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        totals = {'rows': 0, 'added': 0, 'skipped': 0}
+
+        try:
+            handle = open(options['csv_file'], newline='')
+        except OSError as exc:
+            raise CommandError(exc)
+
+        with handle:
+            batch = []
+            for row in csv.reader(handle):
+                if not row or not row[0].strip().isdigit():
+                    continue  # header or blank line
+                try:
+                    batch.append((int(row[0]), int(row[1])))
+                except (IndexError, ValueError):
+                    totals['skipped'] += 1
+                    continue
+                if len(batch) >= batch_size:
+                    self.load(batch, totals)
+                    batch = []
+            if batch:
+                self.load(batch, totals)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {totals['rows']} edges: added {totals['added']}, skipped {totals['skipped']}"
+        ))
+        self.stdout.write("Run rebuild_feeds to bring home feeds in line with the imported graph.")
+
+    def load(self, batch, totals):
+        user_ids = {user_id for pair in batch for user_id in pair}
+        known = set(CustomUser.objects.filter(pk__in=user_ids).values_list('id', flat=True))
+        valid = [(follower, target) for follower, target in batch if follower in known and target in known]
+        added = add_edges(valid)
+        totals['rows'] += len(batch)
+        totals['added'] += len(added)
+        totals['skipped'] += len(batch) - len(added)
+        self.stdout.write(f"  {totals['rows']} rows processed")
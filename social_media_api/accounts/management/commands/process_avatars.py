@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.images import PENDING, READY, process
+from accounts.models import CustomUser
+
+
+class Command(BaseCommand):
+    help = "Thumbnail profile pictures still pending, e.g. after a restart or with AVATAR_WORKERS = 0"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=5.0, help="seconds to sleep when nothing is pending")
+        parser.add_argument('--once', action='store_true', help="exit once nothing is pending")
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        while True:
+            pending = list(
+                CustomUser.objects.filter(avatar_status=PENDING).order_by('pk').values_list('pk', flat=True)[:options['batch_size']]
+            )
+            for pk in pending:
+                status = process(CustomUser, pk)
+                if status == READY:
+                    done += 1
+                elif status is not None:
+                    failed += 1
+            if pending:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {done} avatars, {failed} failed"))
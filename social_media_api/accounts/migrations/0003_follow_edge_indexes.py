@@ -0,0 +1,24 @@
+from django.db import migrations
+
+# The followers table is created by the ManyToManyField, so its indexes can't
+# be declared in a Meta class. These let follower/following pages walk the
+# edges of one user in id order without sorting.
+INDEXES = {
+    'accounts_follow_followed_id_idx': 'from_customuser_id',
+    'accounts_follow_follower_id_idx': 'to_customuser_id',
+}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_follow_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            f'CREATE INDEX {name} ON accounts_customuser_followers ({column}, id)',
+            f'DROP INDEX {name}',
+        )
+        for name, column in INDEXES.items()
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:52
+
+from django.db import migrations, models
+
+
+def queue_existing(apps, schema_editor):
+    # Pictures uploaded before the pipeline; `manage.py process_avatars` thumbnails them
+    CustomUser = apps.get_model('accounts', 'CustomUser')
+    CustomUser.objects.exclude(profile_picture='').exclude(profile_picture__isnull=True).update(avatar_status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_revoked_tokens'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='avatar_status',
+            field=models.CharField(blank=True, choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='', max_length=10),
+        ),
+        migrations.RunPython(queue_existing, migrations.RunPython.noop),
+    ]
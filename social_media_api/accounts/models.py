@@ -1,11 +1,78 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
 
+from .images import STATUS_CHOICES as AVATAR_STATUS_CHOICES
+
 class CustomUser(AbstractUser):
     bio = models.TextField(blank=True, null=True)
     profile_picture = models.ImageField(upload_to='profile_pics/', blank=True, null=True)
+    # Filled in by accounts.images once the upload has been thumbnailed
+    avatar_status = models.CharField(max_length=10, choices=AVATAR_STATUS_CHOICES, blank=True, default='')
+    avatar_hash = models.CharField(max_length=64, blank=True, default='')
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
+    # Denormalized from the followers table, kept in step by follow()/unfollow()
+    follower_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.username
 
+    def follow(self, other):
+        '''Follow `other`; returns False if already following'''
+        with transaction.atomic():
+            _, created = CustomUser.followers.through.objects.get_or_create(
+                from_customuser=other, to_customuser=self
+            )
+            if created:
+                CustomUser.objects.filter(pk=other.pk).update(follower_count=F('follower_count') + 1)
+                CustomUser.objects.filter(pk=self.pk).update(following_count=F('following_count') + 1)
+                FollowChange.objects.create(user=self)
+        return created
+
+    def unfollow(self, other):
+        '''Stop following `other`; returns False if not following'''
+        with transaction.atomic():
+            deleted, _ = CustomUser.followers.through.objects.filter(
+                from_customuser=other, to_customuser=self
+            ).delete()
+            if deleted:
+                CustomUser.objects.filter(pk=other.pk).update(follower_count=F('follower_count') - 1)
+                CustomUser.objects.filter(pk=self.pk).update(following_count=F('following_count') - 1)
+                FollowChange.objects.create(user=self)
+        return bool(deleted)
+
+
+
+class FollowChange(models.Model):
+    '''
+    Marks a user whose following list changed since the last recommendation
+    build; build_recommendations consumes these to rebuild incrementally.
+    '''
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class Recommendation(models.Model):
+    '''Precomputed who-to-follow entry; `score` is how many accounts the user follows follow `candidate`'''
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='recommendations')
+    candidate = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='+')
+    score = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score'], name='accounts_rec_user_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.candidate_id} for {self.user_id} ({self.score})"
+
+
+class RevokedToken(models.Model):
+    '''Id of a signed access/refresh token revoked before its expiry (see social_media_api.authentication)'''
+    jti = models.CharField(max_length=32, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,132 @@
+'''
+Offline "who to follow" scoring.
+
+The follow graph is loaded into two CSR arrays indexed by user id:
+`targets[offsets[u]:offsets[u + 1]]` are the accounts u follows. A
+candidate's score is the number of 2-hop paths u -> followed -> candidate,
+i.e. how many of the accounts u follows also follow the candidate. The top
+RECOMMENDATIONS_TOP_K per user are written to the Recommendation table, so
+serving them is a single indexed read.
+'''
+import heapq
+from array import array
+from collections import Counter
+from itertools import accumulate
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from .graph import Follow
+from .models import CustomUser, FollowChange, Recommendation
+
+TOP_K = getattr(settings, 'RECOMMENDATIONS_TOP_K', 20)
+MAX_FANOUT = getattr(settings, 'RECOMMENDATIONS_MAX_FANOUT', 5000)
+ID_CHUNK = 1000
+
+
+class FollowGraph:
+    def __init__(self, offsets, targets):
+        self.offsets = offsets
+        self.targets = targets
+
+    @classmethod
+    def from_edges(cls, edges, max_id):
+        '''Build from (follower, followed) pairs sorted by follower'''
+        degrees = array('q', bytes(8 * (max_id + 1)))
+        targets = array('q')
+        for follower, followed in edges:
+            degrees[follower] += 1
+            targets.append(followed)
+        return cls(array('q', accumulate(degrees, initial=0)), targets)
+
+    def following(self, user_id):
+        if user_id + 1 >= len(self.offsets):
+            return self.targets[:0]
+        return self.targets[self.offsets[user_id]:self.offsets[user_id + 1]]
+
+    def top_candidates(self, user_id, limit=TOP_K):
+        '''[(candidate id, score)] best first, ties broken by lower id'''
+        followed = self.following(user_id)
+        scores = Counter()
+        for middle in followed:
+            middle_following = self.following(middle)
+            # Accounts that follow everyone say nothing about taste
+            if len(middle_following) <= MAX_FANOUT:
+                scores.update(middle_following)
+        for pk in followed:
+            scores.pop(pk, None)
+        scores.pop(user_id, None)
+        return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _edges(follower_ids=None):
+    edges = Follow.objects.order_by('to_customuser', 'from_customuser').values_list('to_customuser', 'from_customuser')
+    if follower_ids is None:
+        yield from edges.iterator(chunk_size=10000)
+        return
+    follower_ids = sorted(follower_ids)
+    for start in range(0, len(follower_ids), ID_CHUNK):
+        yield from edges.filter(to_customuser__in=follower_ids[start:start + ID_CHUNK])
+
+
+def load_graph(follower_ids=None):
+    '''Load every edge, or only the outgoing edges of `follower_ids`'''
+    max_id = CustomUser.objects.aggregate(Max('id'))['id__max'] or 0
+    return FollowGraph.from_edges(_edges(follower_ids), max_id)
+
+
+def store(graph, user_ids, batch_size=1000):
+    '''Replace the stored recommendations of `user_ids` from `graph`'''
+    user_ids = sorted(user_ids)
+    for start in range(0, len(user_ids), batch_size):
+        chunk = user_ids[start:start + batch_size]
+        rows = [
+            Recommendation(user_id=user_id, candidate_id=candidate, score=score)
+            for user_id in chunk
+            for candidate, score in graph.top_candidates(user_id)
+        ]
+        with transaction.atomic():
+            Recommendation.objects.filter(user_id__in=chunk).delete()
+            Recommendation.objects.bulk_create(rows, batch_size=batch_size)
+
+
+def rebuild_all(batch_size=1000):
+    '''Recompute every user from a full graph load; returns the number of users'''
+    last_change = FollowChange.objects.aggregate(Max('id'))['id__max']
+    graph = load_graph()
+    user_ids = list(CustomUser.objects.values_list('id', flat=True))
+    store(graph, user_ids, batch_size)
+    if last_change is not None:
+        FollowChange.objects.filter(id__lte=last_change).delete()
+    return len(user_ids)
+
+
+def rebuild_changed(batch_size=1000):
+    '''
+    Recompute only the users whose 2-hop neighbourhood changed: everyone who
+    followed or unfollowed, plus everyone following them. Returns the number
+    of users rebuilt.
+    '''
+    last_change = FollowChange.objects.aggregate(Max('id'))['id__max']
+    if last_change is None:
+        return 0
+    changed = set(FollowChange.objects.filter(id__lte=last_change).values_list('user_id', flat=True))
+    dirty = set(changed)
+    changed = sorted(changed)
+    for start in range(0, len(changed), ID_CHUNK):
+        dirty.update(
+            Follow.objects.filter(from_customuser__in=changed[start:start + ID_CHUNK])
+            .values_list('to_customuser', flat=True)
+        )
+
+    # Only the dirty users' edges and their followed accounts' edges are needed
+    direct = load_graph(dirty)
+    needed = set(dirty)
+    for user_id in dirty:
+        needed.update(direct.following(user_id))
+    graph = load_graph(needed)
+
+    store(graph, dirty, batch_size)
+    FollowChange.objects.filter(id__lte=last_change).delete()
+    return len(dirty)
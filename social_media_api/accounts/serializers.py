@@ -1,8 +1,8 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from rest_framework.authtoken.models import Token
-from .models import CustomUser
-from django.contrib.auth.models import User
+from .images import avatar_urls, validate_upload
+from .models import CustomUser, Recommendation
 
 class UserRegistrationSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -11,6 +11,11 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         model = get_user_model() 
         fields = ['id', 'username', 'email', 'password', 'bio', 'profile_picture']
 
+    def validate_profile_picture(self, value):
+        if value:
+            validate_upload(value)
+        return value
+
     def create(self, validated_data):
         user = get_user_model().objects.create_user(
             username = validated_data['username'],
@@ -30,5 +35,44 @@ class UserLoginSerializer(serializers.Serializer):
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
-        model = User
-        fields = ['id', 'username', 'email'] 
\ No newline at end of file
+        model = get_user_model()
+        fields = ['id', 'username', 'email']
+
+
+class UserSummarySerializer(serializers.ModelSerializer):
+    '''Compact user entry for follower/following lists'''
+    # Thumbnail URLs rather than the full-size upload
+    avatar = serializers.SerializerMethodField()
+
+    class Meta:
+        model = get_user_model()
+        fields = ['id', 'username', 'avatar', 'follower_count']
+
+    def get_avatar(self, user):
+        return avatar_urls(user)
+
+
+class AvatarUploadSerializer(serializers.ModelSerializer):
+    profile_picture = serializers.ImageField()
+
+    class Meta:
+        model = get_user_model()
+        fields = ['profile_picture']
+
+    def validate_profile_picture(self, value):
+        validate_upload(value)
+        return value
+
+
+class BulkFollowSerializer(serializers.Serializer):
+    user_ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=1000
+    )
+
+
+class RecommendationSerializer(serializers.ModelSerializer):
+    user = UserSummarySerializer(source='candidate', read_only=True)
+
+    class Meta:
+        model = Recommendation
+        fields = ['user', 'score']
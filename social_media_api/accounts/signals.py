@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from social_media_api.authentication import invalidate_token
+from .images import PENDING, is_new_upload, schedule
+from .models import CustomUser
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=CustomUser)
+def forget_cached_user(sender, instance, created, **kwargs):
+    '''Cached tokens carry a copy of the user, so drop them when it changes'''
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(pre_save, sender=CustomUser)
+def mark_new_avatar(sender, instance, **kwargs):
+    instance._new_avatar = is_new_upload(instance.profile_picture)
+    if instance._new_avatar:
+        instance.avatar_status = PENDING
+        instance.avatar_hash = ''
+
+
+@receiver(post_save, sender=CustomUser)
+def process_new_avatar(sender, instance, **kwargs):
+    if instance.__dict__.pop('_new_avatar', False):
+        schedule(CustomUser, instance.pk)
@@ -1,3 +1,439 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+
+from social_media_api import authentication
+
+from . import graph, images, login
+from .images import FAILED, PENDING, READY, process, thumbnail_name
+from .models import CustomUser, FollowChange, RevokedToken
+from .recommendations import FollowGraph, rebuild_all, rebuild_changed
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_file(name='me.jpg', size=(1200, 800), image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, 'teal').save(buffer, image_format)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AvatarPipelineTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='pic', password='pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def upload(self, upload):
+        return self.client.put('/api/accounts/profile/avatar/', {'profile_picture': upload}, format='multipart')
+
+    def test_upload_answers_with_placeholder_then_thumbnails(self):
+        response = self.upload(image_file())
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['avatar']['status'], PENDING)
+        self.assertIn('placeholder', response.data['avatar']['jpeg']['64'])
+
+        # The pool only runs after commit; do its work here
+        self.assertEqual(process(CustomUser, self.user.pk), READY)
+        self.user.refresh_from_db()
+        storage = self.user.profile_picture.storage
+        self.assertTrue(self.user.profile_picture.name.endswith(f'{self.user.avatar_hash}.jpg'))
+        for size in (64, 256):
+            with storage.open(thumbnail_name(self.user.avatar_hash, size, 'webp')) as handle:
+                self.assertEqual(Image.open(handle).size, (size, size))
+
+    def test_same_picture_is_stored_once(self):
+        other = CustomUser.objects.create_user(username='twin', password='pw')
+        for user in (self.user, other):
+            user.profile_picture = image_file()
+            user.save()
+            process(CustomUser, user.pk)
+            user.refresh_from_db()
+        self.assertEqual(self.user.profile_picture.name, other.profile_picture.name)
+
+    def test_undecodable_upload_fails(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(profile_picture='profile_pics/missing.jpg', avatar_status=PENDING)
+        self.assertEqual(process(CustomUser, self.user.pk), FAILED)
+
+    def test_superseded_upload_is_deleted(self):
+        self.upload(image_file('first.jpg'))
+        first = CustomUser.objects.get(pk=self.user.pk).profile_picture
+        decode = images.decode
+
+        def newer_upload_arrives(data):
+            # The user sends another picture while the first is being thumbnailed
+            CustomUser.objects.filter(pk=self.user.pk).update(profile_picture='profile_pics/newer.jpg')
+            return decode(data)
+
+        with mock.patch.object(images, 'decode', side_effect=newer_upload_arrives):
+            process(CustomUser, self.user.pk)
+        self.assertFalse(first.storage.exists(first.name))
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.profile_picture.name, self.user.avatar_status), ('profile_pics/newer.jpg', PENDING))
+
+    def test_oversized_image_is_refused_in_the_request(self):
+        with mock.patch.object(images, 'MAX_PIXELS', 100):
+            response = self.upload(image_file())
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkFollowTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('me')
+        self.others = [CustomUser.objects.create_user(f'other{i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def statuses(self, url, ids):
+        response = self.client.post(url, {'user_ids': ids}, format='json')
+        return {row['id']: row['status'] for row in response.data['results']}
+
+    def test_statuses_and_counters(self):
+        a, b, c = (other.pk for other in self.others)
+        self.user.follow(self.others[0])
+        statuses = self.statuses('/api/accounts/follow/bulk/', [a, b, b, self.user.pk, 10**6])
+        self.assertEqual(statuses, {a: 'already_following', b: 'followed', self.user.pk: 'self', 10**6: 'not_found'})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 2)
+        self.assertEqual(CustomUser.objects.get(pk=b).follower_count, 1)
+
+        statuses = self.statuses('/api/accounts/unfollow/bulk/', [a, c])
+        self.assertEqual(statuses, {a: 'unfollowed', c: 'not_following'})
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.following_count, 1)
+
+    def test_failed_bulk_unfollow_changes_nothing(self):
+        self.user.follow(self.others[0])
+        with mock.patch('accounts.views.remove_authors_from_feed', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.statuses('/api/accounts/unfollow/bulk/', [self.others[0].pk])
+        self.assertTrue(self.user.following.filter(pk=self.others[0].pk).exists())
+
+    def test_import_skips_unknown_and_duplicate_edges(self):
+        a, b, _ = (other.pk for other in self.others)
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as handle:
+            handle.write(f"follower_id,followed_id\n{a},{b}\n{a},{b}\n{b},{a}\n{a},{10**6}\n{a},{a}\n")
+        self.addCleanup(os.remove, handle.name)
+        call_command('import_follows', handle.name, '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(CustomUser.objects.get(pk=a).following_count, 1)
+        self.assertEqual(CustomUser.objects.get(pk=a).follower_count, 1)
+        self.assertEqual(CustomUser.followers.through.objects.count(), 2)
+
+
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.viewer = CustomUser.objects.create_user('viewer')
+        self.target = CustomUser.objects.create_user('target')
+        self.fans = [CustomUser.objects.create_user(f'fan{i}') for i in range(5)]
+        for fan in self.fans:
+            fan.follow(self.target)
+        self.target.follow(self.fans[0])
+        self.viewer.follow(self.fans[1])
+        self.viewer.follow(self.fans[2])
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def usernames(self, action, **params):
+        names, url = [], f'/api/accounts/users/{self.target.pk}/{action}/'
+        while url:
+            response = self.client.get(url, params)
+            names += [user['username'] for user in response.data['results']]
+            url, params = response.data['next'], {}
+        return names
+
+    def test_followers_page_through_every_edge(self):
+        self.assertEqual(sorted(self.usernames('followers', page_size=2)), [f'fan{i}' for i in range(5)])
+        self.assertEqual(self.usernames('following'), ['fan0'])
+
+    def test_mutual_and_followed_by(self):
+        self.assertEqual(self.usernames('mutual'), ['fan0'])
+        self.assertEqual(sorted(self.usernames('followed-by')), ['fan1', 'fan2'])
+
+    def test_followed_by_uses_cached_ids_for_hot_accounts(self):
+        with mock.patch.object(graph, 'HOT_ACCOUNT_THRESHOLD', 1):
+            self.assertEqual(sorted(self.usernames('followed-by')), ['fan1', 'fan2'])
+        self.assertEqual(list(graph.follower_ids(self.target)), sorted(fan.pk for fan in self.fans))
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.me, self.a, b, self.c, d, self.e = (CustomUser.objects.create_user(name) for name in 'mabcde')
+        self.me.follow(self.a)
+        self.me.follow(b)
+        self.a.follow(self.c)
+        self.a.follow(d)
+        b.follow(self.c)
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+
+    def suggestions(self):
+        return [(row['user']['username'], row['score']) for row in self.client.get('/api/accounts/recommendations/').data]
+
+    def test_full_rebuild_scores_two_hop_paths(self):
+        rebuild_all()
+        self.assertEqual(self.suggestions(), [('c', 2), ('d', 1)])
+        # Followed since the build: hidden straight away
+        self.me.follow(self.c)
+        self.assertEqual(self.suggestions(), [('d', 1)])
+
+    def test_graph_holds_64_bit_ids(self):
+        graph = FollowGraph.from_edges([(1, 2**40)], 1)
+        self.assertEqual(list(graph.targets), [2**40])
+
+    def test_incremental_rebuild_reaches_followers_of_changed_users(self):
+        rebuild_all()
+        self.a.follow(self.e)
+        rebuild_changed()
+        self.assertIn(('e', 1), self.suggestions())
+        self.assertFalse(FollowChange.objects.exists())
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        authentication.local_cache.clear()
+        authentication.stats.reset()
+        self.user = CustomUser.objects.create_user('alice')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def profile(self):
+        return self.client.get('/api/accounts/profile/')
+
+    def test_repeat_requests_skip_the_token_query(self):
+        self.assertEqual(self.profile().status_code, 200)
+        with self.assertNumQueries(0):
+            authentication.CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual(authentication.stats.snapshot()['misses'], 1)
+
+        # Another process: local copy gone, the shared cache still answers
+        authentication.local_cache.clear()
+        with self.assertNumQueries(0):
+            authentication.CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual(authentication.stats.snapshot()['shared_hits'], 1)
+
+    def test_logout_evicts_the_cached_token(self):
+        self.assertEqual(self.profile().status_code, 200)
+        self.assertEqual(self.client.post('/api/accounts/logout/').status_code, 200)
+        self.assertEqual(self.profile().status_code, 401)
+
+    def test_rotation_evicts_the_old_token(self):
+        self.assertEqual(self.profile().status_code, 200)
+        new_key = self.client.post('/api/accounts/token/rotate/').data['token']
+        self.assertEqual(self.profile().status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {new_key}')
+        self.assertEqual(self.profile().status_code, 200)
+
+    def test_revocation_reaches_other_processes(self):
+        self.assertEqual(self.profile().status_code, 200)
+        # Another worker: its own LRU, the same shared cache
+        other_worker = authentication.LocalTokenCache(authentication.LOCAL_CACHE_SIZE, authentication.LOCAL_TTL)
+        with mock.patch.object(authentication, 'local_cache', other_worker):
+            self.assertEqual(self.profile().status_code, 200)
+        self.assertEqual(authentication.stats.snapshot()['shared_hits'], 1)
+
+        # Logging out here clears this worker's LRU and the shared tier
+        self.client.post('/api/accounts/logout/')
+        self.assertIsNone(cache.get(authentication.CACHE_KEY.format(authentication._digest(self.token.key))))
+        # The other worker honours its copy for at most AUTH_TOKEN_LOCAL_TTL
+        with mock.patch.object(authentication, 'local_cache', other_worker), \
+                mock.patch.object(authentication.time, 'monotonic', return_value=time.monotonic() + authentication.LOCAL_TTL + 1):
+            self.assertEqual(self.profile().status_code, 401)
+
+    def test_default_cache_is_shared_between_processes(self):
+        # Test runs may swap CACHES; check what the project ships with
+        from social_media_api import settings as project_settings
+        self.assertEqual(project_settings.CACHES['default']['BACKEND'], 'django.core.cache.backends.redis.RedisCache')
+
+    def test_posting_reads_a_fresh_follower_count(self):
+        from posts.feed import CELEBRITY_THRESHOLD
+        from posts.models import FeedEntry
+
+        fan = CustomUser.objects.create_user('fan')
+        fan.follow(self.user)
+        # Cache the token, and the user with it, before the count changes
+        self.assertEqual(self.profile().status_code, 200)
+        CustomUser.objects.filter(pk=self.user.pk).update(follower_count=CELEBRITY_THRESHOLD)
+        self.assertEqual(self.client.post('/api/posts/posts/', {'title': 't', 'content': 'c'}).status_code, 201)
+        self.assertFalse(FeedEntry.objects.filter(user=fan).exists())
+
+    def test_deactivated_user_is_rejected_at_once(self):
+        self.assertEqual(self.profile().status_code, 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.profile().status_code, 401)
+
+
+class SignedTokenTests(TestCase):
+    def setUp(self):
+        authentication.revocations.bloom = None
+        self.user = CustomUser.objects.create_user('alice')
+        self.tokens = authentication.issue_tokens(self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def test_reads_are_authenticated_from_the_claims(self):
+        # Loads the revocation filter
+        self.assertEqual(self.client.get('/api/notifications/').status_code, 200)
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+        with self.assertNumQueries(0):
+            user, claims = authentication.SignedTokenAuthentication().authenticate(request)
+        self.assertEqual((user.pk, user.username), (self.user.pk, 'alice'))
+
+    def test_staff_claims_pass_admin_reads(self):
+        self.assertEqual(self.client.get('/api/accounts/auth-cache/').status_code, 403)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_staff=True)
+        self.user.refresh_from_db()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {authentication.issue_tokens(self.user)['access']}")
+        self.assertEqual(self.client.get('/api/accounts/auth-cache/').status_code, 200)
+        self.assertEqual(self.client.get('/api/posts/posts/cache-stats/').status_code, 200)
+
+    def test_fields_outside_the_claims_load_on_access(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(email='alice@example.com', is_staff=True)
+        claims = authentication.read_token(self.tokens['access'], 'access')
+        user = authentication.SignedTokenAuthentication().get_user(claims)
+        with self.assertNumQueries(0):
+            self.assertFalse(user.is_staff)  # as issued
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'alice@example.com')
+        # A token from before the staff claims: the flag is read from the table
+        del claims['st']
+        self.assertTrue(authentication.SignedTokenAuthentication().get_user(claims).is_staff)
+
+    def test_writes_use_the_stored_user(self):
+        from posts.feed import CELEBRITY_THRESHOLD
+        from posts.models import FeedEntry
+
+        fan = CustomUser.objects.create_user('fan')
+        fan.follow(self.user)
+        CustomUser.objects.filter(pk=self.user.pk).update(follower_count=CELEBRITY_THRESHOLD)
+        response = self.client.post('/api/posts/posts/', {'title': 't', 'content': 'c'})
+        self.assertEqual(response.status_code, 201)
+        # A claims-only user has follower_count 0 and would have been fanned out
+        self.assertFalse(FeedEntry.objects.filter(user=fan).exists())
+
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.post('/api/posts/posts/', {'title': 't', 'content': 'c'}).status_code, 401)
+
+    def test_logout_revokes_access_and_refresh(self):
+        response = self.client.post('/api/accounts/logout/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertEqual(self.client.get('/api/notifications/').status_code, 401)
+        response = APIClient().post('/api/accounts/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_refresh_token_works_once(self):
+        client = APIClient()
+        response = client.post('/api/accounts/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.data['refresh'], self.tokens['refresh'])
+        response = client.post('/api/accounts/token/refresh/', {'refresh': self.tokens['refresh']})
+        self.assertEqual(response.status_code, 401)
+
+    def test_stale_filter_reloads_off_the_request_path(self):
+        revocations = authentication.revocations
+        revocations.is_revoked('x')
+        revocations.loaded_at -= revocations.interval + 1
+        with mock.patch.object(authentication.threading, 'Thread') as thread:
+            self.assertFalse(revocations.is_revoked('x'))
+            self.assertFalse(revocations.is_revoked('x'))
+        # One reload started; the old filter kept answering meanwhile
+        self.assertEqual(thread.return_value.start.call_count, 1)
+
+        # Revoked while the reload was pending: still caught after the swap
+        authentication.revoke(authentication.read_token(self.tokens['access'], 'access'))
+        revocations.reload()
+        self.assertEqual(self.client.get('/api/notifications/').status_code, 401)
+
+
+@override_settings(PASSWORD_HASHERS=[
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+])
+class LoginTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('alice', password='secret')
+
+    def login(self, password='secret', username='alice'):
+        return self.client.post('/api/accounts/login/', {'username': username, 'password': password},
+                                content_type='application/json')
+
+    def test_login_returns_both_token_kinds(self):
+        response = self.login()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {'token', 'access', 'refresh', 'expires_in'})
+        self.assertEqual(self.login('wrong').status_code, 400)
+
+    def test_repeated_failures_are_limited_per_username(self):
+        with mock.patch.object(login.username_limiter, 'limit', 3):
+            for _ in range(3):
+                self.assertEqual(self.login('wrong').status_code, 400)
+            # Refused before hashing, even with the right password
+            with mock.patch('accounts.views.verify') as verify:
+                response = self.login()
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+            verify.assert_not_called()
+            # Other accounts are unaffected
+            CustomUser.objects.create_user('bob', password='secret')
+            self.assertEqual(self.login(username='bob').status_code, 200)
+
+    def test_limits_and_blocks_are_shared_between_processes(self):
+        with mock.patch.object(login.username_limiter, 'limit', 3):
+            for _ in range(3):
+                self.login('wrong')
+            self.assertEqual(self.login().status_code, 429)
+        # Another process: its own limiter object, the same cache
+        other = login.SlidingWindowLimiter('user', 100, login.USERNAME_LIMIT[1])
+        self.assertGreater(other.retry_after('alice'), 0)
+        self.assertEqual(other.retry_after('bob'), 0)
+
+    def test_login_sends_the_auth_signals(self):
+        failed, logged_in = mock.Mock(), mock.Mock()
+        user_login_failed.connect(failed)
+        user_logged_in.connect(logged_in)
+        self.addCleanup(user_login_failed.disconnect, failed)
+        self.addCleanup(user_logged_in.disconnect, logged_in)
+
+        self.login('wrong')
+        self.assertEqual(failed.call_args.kwargs['credentials'], {'username': 'alice'})
+        self.assertIsNone(CustomUser.objects.get(pk=self.user.pk).last_login)
+        self.login()
+        self.assertEqual(logged_in.call_args.kwargs['user'].pk, self.user.pk)
+        self.assertIsNotNone(CustomUser.objects.get(pk=self.user.pk).last_login)
+
+    def test_full_hashing_queue_answers_503(self):
+        with mock.patch.object(login, 'MAX_PENDING', 0):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+    def test_outdated_hash_is_upgraded_on_login(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(password=PBKDF2PasswordHasher().encode('secret', 'salt', iterations=1))
+        self.assertEqual(self.login().status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('md5$'))
+        self.assertEqual(self.login().status_code, 200)
@@ -1,5 +1,9 @@
 from django.urls import path, include
-from .views import UserRegistrationView, UserLoginView, UserProfileView, FollowUserView, UnfollowUserView, UserViewSet
+from .views import (
+    UserRegistrationView, user_login, UserProfileView, FollowUserView, UnfollowUserView, UserViewSet,
+    BulkFollowView, BulkUnfollowView, RecommendationListView,
+    LogoutView, TokenRotateView, TokenRefreshView, AuthCacheStatsView, AvatarUploadView,
+)
 from django.conf.urls.static import static
 from django.conf import settings 
 from rest_framework.routers import DefaultRouter
@@ -9,10 +13,18 @@ router.register(r'users', UserViewSet, basename='user')
 
 urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='register'),
-    path('login/', UserLoginView.as_view(), name='login'),
+    path('login/', user_login, name='login'),
+    path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/rotate/', TokenRotateView.as_view(), name='token-rotate'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
+    path('auth-cache/', AuthCacheStatsView.as_view(), name='auth-cache-stats'),
     path('profile/', UserProfileView.as_view(), name='profile'),
+    path('profile/avatar/', AvatarUploadView.as_view(), name='profile-avatar'),
     path('follow/<int:user_id>/', FollowUserView.as_view(), name='follow-user'),
     path('unfollow/<int:user_id>/', UnfollowUserView.as_view(), name='unfollow-user'),
+    path('follow/bulk/', BulkFollowView.as_view(), name='bulk-follow'),
+    path('unfollow/bulk/', BulkUnfollowView.as_view(), name='bulk-unfollow'),
+    path('recommendations/', RecommendationListView.as_view(), name='recommendations'),
     path('', include(router.urls)),
 ]
 
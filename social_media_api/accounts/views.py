@@ -1,12 +1,31 @@
+import json
+import math
+
 from django.shortcuts import render, get_object_or_404
+from django.db import transaction
 from rest_framework import generics, status, viewsets, permissions
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from django.contrib.auth import authenticate, get_user_model
-from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in, user_login_failed
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from .serializers import UserRegistrationSerializer, UserLoginSerializer, UserSerializer, UserSummarySerializer, BulkFollowSerializer, RecommendationSerializer, AvatarUploadSerializer
+from .graph import (
+    add_edges, remove_edges, followers_of, following_of, mutual_follows, followed_by_following,
+)
 from rest_framework.views import APIView
-from .models import CustomUser
+from social_media_api.authentication import stats as auth_cache_stats, issue_tokens, read_token, revoke, revocations
+from rest_framework import exceptions
+from .models import CustomUser, Recommendation
+from .login import Busy, ip_limiter, run_hashing, username_limiter, verify
+from .images import avatar_urls
+from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.decorators import action
+from posts.feed import backfill_feed, backfill_feed_from, remove_author_from_feed, remove_authors_from_feed
+from notifications.events import notify, notify_many, FOLLOWED
+from realtime.broker import following_changed
 
 User = get_user_model()
 
@@ -16,54 +35,203 @@ class UserViewSet(viewsets.ModelViewSet):
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated]   
 
+    def edge_page(self, edges, side):
+        '''Page follow edges by edge id and answer with the user on `side` of each'''
+        page = self.paginate_queryset(edges)
+        users = [getattr(edge, side) for edge in page]
+        return self.get_paginated_response(UserSummarySerializer(users, many=True, context=self.get_serializer_context()).data)
+
+    @action(detail=True, methods=['get'])
+    def followers(self, request, pk=None):
+        return self.edge_page(followers_of(self.get_object()), 'to_customuser')
+
+    @action(detail=True, methods=['get'])
+    def following(self, request, pk=None):
+        return self.edge_page(following_of(self.get_object()), 'from_customuser')
+
+    @action(detail=True, methods=['get'])
+    def mutual(self, request, pk=None):
+        '''Accounts this user follows that follow them back'''
+        return self.edge_page(mutual_follows(self.get_object()), 'from_customuser')
+
+    @action(detail=True, methods=['get'], url_path='followed-by')
+    def followed_by(self, request, pk=None):
+        '''Accounts you follow that follow this user'''
+        return self.edge_page(followed_by_following(request.user, self.get_object()), 'to_customuser')
+
 
 class UserProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]   
 
     def get(self, request):
-        user = request.user
+        # request.user may come from the auth cache; read the counters fresh
+        user = CustomUser.objects.get(pk=request.user.pk)
         return Response({
             "id": user.id,
             "username": user.username,
             "email": user.email,
             "bio": user.bio,
             "profile_picture": user.profile_picture.url if user.profile_picture else None,
-            "followers": user.followers.count(),
-            "following": user.following.count(),
+            "avatar": avatar_urls(user),
+            "followers": user.follower_count,
+            "following": user.following_count,
         })
 
 
+class AvatarUploadView(APIView):
+    '''Replace the profile picture; answers 202 with placeholder URLs while the thumbnails are made'''
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser, FormParser]
+
+    def put(self, request):
+        user = CustomUser.objects.get(pk=request.user.pk)
+        serializer = AvatarUploadSerializer(user, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response({"avatar": avatar_urls(user)}, status=status.HTTP_202_ACCEPTED)
+
+
 class UserRegistrationView(generics.CreateAPIView):
     serializer_class = UserRegistrationSerializer
 
 
-class UserLoginView(generics.GenericAPIView):
-    serializer_class = UserLoginSerializer
+def _prepare_login(username, ip):
+    '''(seconds to wait, user or None), in one trip to the sync thread'''
+    wait = max(username_limiter.retry_after(username.lower()), ip_limiter.retry_after(ip))
+    if wait:
+        return wait, None
+    return 0, CustomUser.objects.filter(username=username).first()
+
+
+def _finish_login(request, user, matched, new_hash, username, ip):
+    # The password is checked here rather than through authenticate(), so send
+    # the signals it would: user_logged_in also runs update_last_login
+    if not matched:
+        username_limiter.record_failure(username.lower())
+        ip_limiter.record_failure(ip)
+        user_login_failed.send(sender=__name__, credentials={'username': username}, request=request)
+        return None
+    if new_hash:
+        # Hasher or its parameters changed since this password was stored
+        CustomUser.objects.filter(pk=user.pk).update(password=new_hash)
+    user_logged_in.send(sender=user.__class__, request=request, user=user)
+    token, created = Token.objects.get_or_create(user=user)
+    # `token` for TokenAuthentication clients, access/refresh for Bearer clients
+    return {"token": token.key, **issue_tokens(user)}
+
+
+@csrf_exempt
+async def user_login(request):
+    '''
+    Async login. Rate limits are checked before any hashing, and the password
+    check itself runs on the bounded hashing pool (accounts.login), so a login
+    storm can't tie up the threads serving everything else. The check is
+    ModelBackend's done by hand: other AUTHENTICATION_BACKENDS aren't asked,
+    but the user_logged_in / user_login_failed signals are sent as usual.
+    '''
+    if request.method != 'POST':
+        return JsonResponse({"detail": "Method not allowed."}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    try:
+        data = json.loads(request.body) if request.content_type == 'application/json' else request.POST
+    except ValueError:
+        return JsonResponse({"detail": "Malformed JSON."}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = UserLoginSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    username = serializer.validated_data['username']
+    password = serializer.validated_data['password']
+    ip = request.META.get('REMOTE_ADDR', '')
+
+    wait, user = await sync_to_async(_prepare_login)(username, ip)
+    if wait:
+        response = JsonResponse({"error": "Too many failed attempts."}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
+
+    # Same as ModelBackend: inactive users fail, after the same hashing cost
+    encoded = user.password if user is not None and user.is_active else None
+    try:
+        matched, new_hash = await run_hashing(verify, password, encoded)
+    except Busy:
+        response = JsonResponse({"error": "Login is busy, try again."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        response['Retry-After'] = '1'
+        return response
+
+    body = await sync_to_async(_finish_login)(request, user, matched, new_hash, username, ip)
+    if body is None:
+        return JsonResponse({"error": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
+    return JsonResponse(body, status=status.HTTP_200_OK)
+
+
+class LogoutView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        serializer = self.get_serializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
+        # Deleting the token also evicts it from the auth cache (accounts.signals)
+        Token.objects.filter(user=request.user).delete()
+        if isinstance(request.auth, dict):
+            revoke(request.auth)
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                revoke(read_token(refresh, 'refresh'))
+            except exceptions.AuthenticationFailed:
+                pass
+        return Response({"detail": "Logged out."}, status=status.HTTP_200_OK)
 
-        username = serializer.validated_data['username']
-        password = serializer.validated_data['password']
 
-        user = authenticate(username=username, password=password)
-        if user:
-            token, created = Token.objects.get_or_create(user=user)
-            return Response({"token": token.key}, status=status.HTTP_200_OK)
-        return Response({"error": "Invalid credentials"}, status=status.HTTP_400_BAD_REQUEST)
+class TokenRotateView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        Token.objects.filter(user=request.user).delete()
+        token = Token.objects.create(user=request.user)
+        return Response({"token": token.key}, status=status.HTTP_200_OK)
+
+
+class TokenRefreshView(APIView):
+    '''Swap a refresh token for a new access/refresh pair; the old refresh token is revoked'''
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        claims = read_token(request.data.get('refresh', ''), 'refresh')
+        if revocations.is_revoked(claims['jti']):
+            raise exceptions.AuthenticationFailed('Token revoked.')
+        user = CustomUser.objects.filter(pk=claims['uid'], is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        revoke(claims)
+        return Response(issue_tokens(user), status=status.HTTP_200_OK)
+
+    def get_authenticate_header(self, request):
+        # Answer bad refresh tokens with 401 rather than 403
+        return 'Bearer'
+
+
+class AuthCacheStatsView(APIView):
+    '''Token cache hit rate of the worker process answering the request'''
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(auth_cache_stats.snapshot())
 
 
 class FollowUserView(APIView):
     permission_classes = [permissions.IsAuthenticated]   
 
+    @transaction.atomic
     def post(self, request, user_id):
         user_to_follow = get_object_or_404(CustomUser, id=user_id)
 
         if request.user == user_to_follow:
             return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-        request.user.following.add(user_to_follow)
+        if request.user.follow(user_to_follow):
+            backfill_feed(request.user, user_to_follow)
+            notify(request.user, FOLLOWED, user_to_follow)
+            following_changed(request.user.pk)
         return Response(
             {"detail": f"You are now following {user_to_follow.username}."},
             status=status.HTTP_200_OK
@@ -79,8 +247,80 @@ class UnfollowUserView(APIView):
         if request.user == user_to_unfollow:
             return Response({"detail": "You cannot unfollow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-        request.user.following.remove(user_to_unfollow)
+        if request.user.unfollow(user_to_unfollow):
+            remove_author_from_feed(request.user, user_to_unfollow)
+            following_changed(request.user.pk)
         return Response(
             {"detail": f"You have unfollowed {user_to_unfollow.username}."},
             status=status.HTTP_200_OK
         )
+
+
+class BulkFollowView(generics.GenericAPIView):
+    '''Follow up to 1000 users at once; answers with a status per requested id'''
+    serializer_class = BulkFollowSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    changed_status = "followed"
+    unchanged_status = "already_following"
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_ids = list(dict.fromkeys(serializer.validated_data['user_ids']))
+
+        found = set(CustomUser.objects.filter(id__in=user_ids).values_list('id', flat=True))
+        targets = found - {request.user.id}
+        changed = {target for _, target in self.apply(request.user, targets)}
+
+        results = []
+        for user_id in user_ids:
+            if user_id == request.user.id:
+                result = "self"
+            elif user_id not in found:
+                result = "not_found"
+            elif user_id in changed:
+                result = self.changed_status
+            else:
+                result = self.unchanged_status
+            results.append({"id": user_id, "status": result})
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+    @transaction.atomic
+    def apply(self, user, targets):
+        added = add_edges((user.id, target) for target in targets)
+        new_ids = [target for _, target in added]
+        if new_ids:
+            backfill_feed_from(user, new_ids)
+            notify_many(user, FOLLOWED, CustomUser, new_ids)
+            following_changed(user.pk)
+        return added
+
+
+class BulkUnfollowView(BulkFollowView):
+    changed_status = "unfollowed"
+    unchanged_status = "not_following"
+
+    @transaction.atomic
+    def apply(self, user, targets):
+        removed = remove_edges((user.id, target) for target in targets)
+        if removed:
+            remove_authors_from_feed(user, [target for _, target in removed])
+            following_changed(user.pk)
+        return removed
+
+
+class RecommendationListView(generics.ListAPIView):
+    '''Who-to-follow, read straight from the table build_recommendations fills'''
+    serializer_class = RecommendationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = None
+
+    def get_queryset(self):
+        user = self.request.user
+        return (
+            Recommendation.objects.filter(user=user)
+            # Drop anyone followed since the last build
+            .exclude(candidate__in=user.following.all())
+            .select_related('candidate')
+            .order_by('-score', 'candidate')
+        )
@@ -0,0 +1,24 @@
+from django.core.cache import cache
+
+from .models import Notification
+
+UNREAD_KEY = 'notifications:unread:{}'
+UNREAD_TIMEOUT = 60 * 60
+
+
+def unread_count(user):
+    '''
+    Unread notifications for `user`, cached until the next write touching them.
+    Those writes also happen in the notification worker, so this relies on the
+    default cache being shared between processes (Redis, see CACHES).
+    '''
+    key = UNREAD_KEY.format(user.pk)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(recipient=user, is_read=False).count()
+        cache.set(key, count, UNREAD_TIMEOUT)
+    return count
+
+
+def invalidate_unread(user_ids):
+    cache.delete_many([UNREAD_KEY.format(user_id) for user_id in user_ids])
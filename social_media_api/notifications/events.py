@@ -0,0 +1,155 @@
+'''
+Notification pipeline.
+
+The request path only calls notify(), which writes one NotificationEvent row
+(in the same transaction as the like/comment/follow it describes). A worker
+(`manage.py process_notifications`) drains the queue in batches: it works out
+who should be told, folds repeated events on the same target into a single
+"X and N others ..." row and writes everything with bulk_create/bulk_update.
+NotificationActor remembers who has been folded into a row, so N counts
+distinct people however often they repeat themselves.
+'''
+from django.contrib.auth import get_user_model
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationActor, NotificationEvent
+from .counters import invalidate_unread
+from realtime.broker import publish, user_channel
+
+User = get_user_model()
+
+LIKED = 'liked your post'
+COMMENTED = 'commented on your post'
+FOLLOWED = 'started following you'
+
+
+def notify(actor, verb, target):
+    '''Queue a notification about `actor` doing `verb` to `target`'''
+    NotificationEvent.objects.create(
+        actor=actor,
+        verb=verb,
+        target_content_type=ContentType.objects.get_for_model(target),
+        target_object_id=target.pk,
+    )
+
+
+def notify_many(actor, verb, target_model, target_ids):
+    '''Queue one event per target id with a single INSERT'''
+    content_type = ContentType.objects.get_for_model(target_model)
+    NotificationEvent.objects.bulk_create([
+        NotificationEvent(actor=actor, verb=verb, target_content_type=content_type, target_object_id=pk)
+        for pk in target_ids
+    ])
+
+
+def _recipients(events):
+    '''Map (content type id, object id) -> recipient id, one query per content type'''
+    by_type = {}
+    for event in events:
+        by_type.setdefault(event.target_content_type_id, set()).add(event.target_object_id)
+
+    recipients = {}
+    for content_type_id, object_ids in by_type.items():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is User:
+            recipients.update({(content_type_id, pk): pk for pk in object_ids})
+            continue
+        rows = model.objects.filter(pk__in=object_ids).values_list('pk', 'author_id')
+        recipients.update({(content_type_id, pk): author_id for pk, author_id in rows})
+    return recipients
+
+
+def process_events(batch_size=500, push=True):
+    '''Turn one batch of queued events into notifications; returns how many events were consumed'''
+    with transaction.atomic():
+        events = list(
+            NotificationEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        recipients = _recipients(events)
+        # (recipient, verb, content type, object id) -> actor ids, newest last
+        grouped = {}
+        for event in events:
+            target = (event.target_content_type_id, event.target_object_id)
+            recipient_id = recipients.get(target)
+            if recipient_id is None or recipient_id == event.actor_id:
+                continue
+            actors = grouped.setdefault((recipient_id, event.verb) + target, [])
+            if event.actor_id in actors:
+                actors.remove(event.actor_id)
+            actors.append(event.actor_id)
+
+        existing = {}
+        if grouped:
+            unread = Notification.objects.filter(
+                is_read=False,
+                recipient_id__in={key[0] for key in grouped},
+                verb__in={key[1] for key in grouped},
+                target_object_id__in={key[3] for key in grouped},
+            )
+            for notification in unread:
+                key = (notification.recipient_id, notification.verb,
+                       notification.target_content_type_id, notification.target_object_id)
+                if key in grouped:
+                    existing[key] = notification
+
+        # Actors already folded into the rows being extended
+        folded = set(
+            NotificationActor.objects.filter(
+                notification__in=existing.values(),
+                actor_id__in={actor_id for actors in grouped.values() for actor_id in actors},
+            ).values_list('notification_id', 'actor_id')
+        ) if existing else set()
+
+        now = timezone.now()
+        to_create, to_update, new_actors = [], [], []
+        for key, actors in grouped.items():
+            notification = existing.get(key)
+            if notification is None:
+                recipient_id, verb, content_type_id, object_id = key
+                notification = Notification(
+                    recipient_id=recipient_id,
+                    actor_id=actors[-1],
+                    verb=verb,
+                    target_content_type_id=content_type_id,
+                    target_object_id=object_id,
+                    others_count=len(actors) - 1,
+                )
+                to_create.append(notification)
+                new_actors.append((notification, actors))
+                continue
+            unseen = [actor_id for actor_id in actors if (notification.id, actor_id) not in folded]
+            notification.others_count += len(unseen)
+            notification.actor_id = actors[-1]
+            notification.timestamp = now
+            to_update.append(notification)
+            new_actors.append((notification, unseen))
+
+        Notification.objects.bulk_create(to_create, batch_size=batch_size)
+        Notification.objects.bulk_update(to_update, ['actor', 'others_count', 'timestamp'], batch_size=batch_size)
+        NotificationActor.objects.bulk_create(
+            [NotificationActor(notification_id=notification.id, actor_id=actor_id)
+             for notification, actors in new_actors for actor_id in actors],
+            batch_size=batch_size,
+        )
+        NotificationEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        transaction.on_commit(lambda: invalidate_unread({key[0] for key in grouped}))
+        if push:
+            transaction.on_commit(lambda: _push(to_create + to_update))
+        return len(events)
+
+
+def _push(notifications):
+    for notification in notifications:
+        publish(user_channel(notification.recipient_id), 'notification', {
+            'id': notification.id,
+            'actor': notification.actor_id,
+            'verb': notification.verb,
+            'others_count': notification.others_count,
+            'target_object_id': notification.target_object_id,
+            'timestamp': notification.timestamp.isoformat() if notification.timestamp else None,
+        })
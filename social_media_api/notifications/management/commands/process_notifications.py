@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from notifications.events import process_events
+from realtime.broker import get_broker
+
+
+class Command(BaseCommand):
+    help = "Drain the notification event queue into Notification rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--interval', type=float, default=1.0, help="seconds to sleep when the queue is empty")
+        parser.add_argument('--once', action='store_true', help="exit once the queue is empty")
+        parser.add_argument('--no-push', action='store_true', help="only fill the inboxes, publish nothing to the streams")
+
+    def handle(self, *args, **options):
+        push = not options['no_push']
+        if push and not get_broker().cross_process:
+            # This process isn't the one holding the streams; its pushes would go nowhere
+            raise CommandError(
+                f"{type(get_broker()).__name__} can't reach event streams in the web processes. "
+                "Set REALTIME_BROKER to a cross-process broker (e.g. realtime.broker.PostgresBroker) or pass --no-push."
+            )
+        total = 0
+        while True:
+            processed = process_events(options['batch_size'], push=push)
+            total += processed
+            if processed:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {total} events"))
@@ -28,7 +28,51 @@ class Notification(models.Model):
     target = GenericForeignKey('target_content_type', 'target_object_id')
 
     is_read = models.BooleanField(default=False)
+    # Further distinct actors folded into this row (see NotificationActor), e.g. "X and 40 others liked your post"
+    others_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Unread inbox and unread count
+            models.Index(fields=['recipient', 'is_read', '-timestamp', '-id'], name='notif_recipient_unread_idx'),
+            # Full inbox
+            models.Index(fields=['recipient', '-timestamp', '-id'], name='notif_recipient_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.summary} -> {self.recipient}"
+
+    @property
+    def summary(self):
+        actors = str(self.actor)
+        if self.others_count:
+            actors += f" and {self.others_count} other{'s' if self.others_count > 1 else ''}"
+        return f"{actors} {self.verb}"
+
+
+class NotificationEvent(models.Model):
+    '''
+    Queue row written on the request path; notifications.events turns these into
+    Notification rows in batches (see the process_notifications command).
+    '''
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    verb = models.CharField(max_length=255)
+    target_content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    target_object_id = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"{self.actor} {self.verb} {self.target} -> {self.recipient}"
+        return f"{self.actor_id} {self.verb} {self.target_content_type_id}:{self.target_object_id}"
 
+
+
+class NotificationActor(models.Model):
+    '''Each distinct actor folded into a notification, so a repeat actor isn't counted twice'''
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='+')
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        unique_together = ('notification', 'actor')
+
+    def __str__(self):
+        return f"{self.actor_id} in {self.notification_id}"
@@ -0,0 +1,26 @@
+from rest_framework import serializers
+from django.contrib.contenttypes.models import ContentType
+from .models import Notification
+
+
+class NotificationSerializer(serializers.ModelSerializer):
+    actor_username = serializers.ReadOnlyField(source='actor.username')
+    summary = serializers.ReadOnlyField()
+    target_type = serializers.SerializerMethodField()
+    target = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Notification
+        fields = ['id', 'actor', 'actor_username', 'verb', 'summary', 'others_count',
+                  'target_type', 'target_object_id', 'target', 'timestamp', 'is_read']
+        read_only_fields = fields
+
+    def get_target_type(self, obj):
+        if obj.target_content_type_id is None:
+            return None
+        # ContentType lookups are served from Django's in-process cache
+        return ContentType.objects.get_for_id(obj.target_content_type_id).model
+
+    def get_target(self, obj):
+        target = obj.target
+        return str(target) if target is not None else None
@@ -1,3 +1,101 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from accounts.models import CustomUser
+from posts.models import Post
+from .events import COMMENTED, FOLLOWED, LIKED, notify, process_events
+from .models import Notification, NotificationEvent
+
+
+class CoalescingTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.bob = CustomUser.objects.create_user('bob')
+        self.alice = CustomUser.objects.create_user('alice')
+        self.post = Post.objects.create(author=self.author, title='liked', content='body')
+
+    def test_repeat_actor_is_counted_once(self):
+        notify(self.bob, LIKED, self.post)
+        process_events()
+        notify(self.alice, LIKED, self.post)
+        process_events()
+        notify(self.bob, LIKED, self.post)
+        notify(self.bob, LIKED, self.post)
+        process_events()
+
+        notification = Notification.objects.get()
+        self.assertEqual((notification.actor, notification.others_count), (self.bob, 1))
+        self.assertEqual(notification.summary, "bob and 1 other liked your post")
+
+    def test_recipients_and_self_actions(self):
+        notify(self.author, LIKED, self.post)
+        notify(self.bob, COMMENTED, self.post)
+        notify(self.alice, FOLLOWED, self.bob)
+        self.assertEqual(process_events(), 3)
+        self.assertFalse(NotificationEvent.objects.exists())
+        rows = set(Notification.objects.values_list('recipient__username', 'actor__username', 'verb'))
+        self.assertEqual(rows, {('author', 'bob', COMMENTED), ('bob', 'alice', FOLLOWED)})
+
+    def test_like_queues_one_event(self):
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        client.post(f'/api/posts/posts/{self.post.pk}/like/')
+        client.post(f'/api/posts/posts/{self.post.pk}/like/')
+        self.assertEqual(NotificationEvent.objects.count(), 1)
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user('reader')
+        actor = CustomUser.objects.create_user('actor')
+        self.older = Notification.objects.create(recipient=self.user, actor=actor, verb=FOLLOWED, is_read=True)
+        self.middle = Notification.objects.create(recipient=self.user, actor=actor, verb=LIKED)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ids(self, **params):
+        return [item['id'] for item in self.client.get('/api/notifications/', params).data['results']]
+
+    def test_unread_flag(self):
+        self.assertEqual(self.ids(unread='1'), [self.middle.pk])
+        self.assertEqual(self.ids(unread='true'), [self.middle.pk])
+        self.assertEqual(len(self.ids(unread='0')), 2)
+        self.assertEqual(len(self.ids(unread='false')), 2)
+
+    def test_mark_read_up_to_cursor(self):
+        cursor = self.client.get('/api/notifications/').data['read_cursor']
+        newest = Notification.objects.create(recipient=self.user, actor=self.middle.actor, verb=COMMENTED)
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread'], 2)
+
+        response = self.client.post('/api/notifications/mark-read/', {'cursor': cursor})
+        self.assertEqual(response.data['marked'], 1)
+        self.assertEqual(self.ids(unread='1'), [newest.pk])
+        # The cached count was dropped with the write
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread'], 1)
+
+    def test_worker_writes_refresh_the_cached_count(self):
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread'], 1)
+        notify(self.middle.actor, COMMENTED, Post.objects.create(author=self.user, title='t', content='c'))
+        # What `manage.py process_notifications` runs; it invalidates after commit
+        with self.captureOnCommitCallbacks(execute=True):
+            process_events(push=False)
+        self.assertEqual(self.client.get('/api/notifications/unread-count/').data['unread'], 2)
+
+    def test_unread_count_cache_is_shared_with_the_worker(self):
+        # Test runs may swap CACHES; check what the project ships with
+        from social_media_api import settings as project_settings
+        self.assertNotIn('locmem', project_settings.CACHES['default']['BACKEND'])
+
+    def test_mark_read_body_must_be_an_object(self):
+        for body in ([1, 2], 'cursor', 5):
+            response = self.client.post('/api/notifications/mark-read/', body, format='json')
+            self.assertEqual(response.status_code, 400)
+
+    def test_bad_cursor_is_a_bad_request(self):
+        response = self.client.post('/api/notifications/mark-read/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/api/notifications/', {'cursor': 'nope'}).status_code, 400)
+        self.middle.refresh_from_db()
+        self.assertFalse(self.middle.is_read)
@@ -1,3 +1,54 @@
-from django.shortcuts import render
+from django.db.models import Q
+from rest_framework import generics, permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import Notification
+from .serializers import NotificationSerializer
+from .counters import unread_count, invalidate_unread
 
-# Create your views here.
+# ?unread= values that mean yes; anything else (0, false, ...) lists everything
+TRUE_VALUES = {'1', 'true', 'yes', 'on'}
+
+
+class NotificationListView(generics.ListAPIView):
+    '''Inbox, newest first; ?unread=1 limits it to unread notifications'''
+    serializer_class = NotificationSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = Notification.objects.filter(recipient=self.request.user)
+        if self.request.query_params.get('unread', '').lower() in TRUE_VALUES:
+            queryset = queryset.filter(is_read=False)
+        # prefetch_related on the generic FK costs one query per target content type
+        return queryset.select_related('actor').prefetch_related('target').order_by('-timestamp')
+
+    def list(self, request, *args, **kwargs):
+        response = super().list(request, *args, **kwargs)
+        page = self.paginator.page
+        # Position of the newest item shown; POST it to mark-read/ to clear everything up to it
+        response.data['read_cursor'] = self.paginator.encode_cursor('-timestamp', page[0]) if page else None
+        return response
+
+
+class UnreadCountView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response({"unread": unread_count(request.user)})
+
+
+class MarkReadView(APIView):
+    '''Marks every notification at or before `cursor` (or all of them) as read in one UPDATE'''
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        if not isinstance(request.data, dict):
+            return Response({"detail": "Expected an object."}, status=status.HTTP_400_BAD_REQUEST)
+        queryset = Notification.objects.filter(recipient=request.user, is_read=False)
+        cursor = request.data.get('cursor')
+        if cursor:
+            timestamp, pk = NotificationListView.pagination_class().load_cursor(cursor, '-timestamp')
+            queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lte=pk))
+        marked = queryset.update(is_read=True)
+        invalidate_unread([request.user.pk])
+        return Response({"marked": marked}, status=status.HTTP_200_OK)
@@ -0,0 +1,99 @@
+'''
+Cached detail responses for PostViewSet.retrieve.
+
+An entry holds a post's serialized data and a strong ETag. Requests whose
+If-None-Match matches get a 304 without touching the database or a
+serializer. likes and comments don't change Post.updated_at, so entries are
+keyed by post id, renderer format and a per-post version stamp. The
+posts.signals receivers bump the stamp after every post, comment or like
+write commits; entries under the old stamp go unused and expire.
+
+Stamps and entries live in the default cache, which is shared by every
+worker (Redis, see CACHES), so a bump after an edit reaches them all and
+cache.add() lets only one worker mint a missing stamp. The ETag is a hash of
+the data, not of the stamp: workers agree on it, and it survives a stamp
+being evicted and re-minted.
+
+A reader that missed stores what it read under the stamp it saw before
+querying. If a write commits in between, that stamp is already stale, so
+pre-write data can't outlive the write (plain delete-on-write let it stay
+for POST_DETAIL_CACHE_TIMEOUT).
+'''
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+DETAIL_TIMEOUT = getattr(settings, 'POST_DETAIL_CACHE_TIMEOUT', 60 * 60)
+DETAIL_KEY = 'posts:detail:{}:{}:{}'
+VERSION_KEY = 'posts:version:{}'
+# Formats served from the cache; others are served uncached
+CACHED_FORMATS = ('json', 'api')
+
+
+class CacheStats:
+    '''Per-process counters'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.hits = self.misses = self.not_modified = 0
+
+    def record(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+        }
+
+
+stats = CacheStats()
+
+
+def make_etag(data):
+    payload = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return '"%s"' % hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def get_version(post_id):
+    '''Current stamp of the post, creating it if missing'''
+    key = VERSION_KEY.format(post_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh stamp, so an evicted version can't bring old entries back
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def get_detail(post_id, fmt):
+    '''(version, entry or None); pass the version on to set_detail() after a miss'''
+    version = get_version(post_id)
+    entry = cache.get(DETAIL_KEY.format(post_id, version, fmt))
+    stats.record('hits' if entry is not None else 'misses')
+    return version, entry
+
+
+def set_detail(post_id, fmt, version, data):
+    entry = {'etag': make_etag(data), 'data': data}
+    cache.set(DETAIL_KEY.format(post_id, version, fmt), entry, DETAIL_TIMEOUT)
+    return entry
+
+
+def invalidate_post(post_id):
+    '''Bump the post's stamp once the current transaction commits'''
+    # After commit, so a concurrent reader can't cache pre-write data under the new stamp
+    transaction.on_commit(lambda: cache.set(VERSION_KEY.format(post_id), time.time_ns(), None))
@@ -0,0 +1,179 @@
+'''
+Materialized home feed.
+
+Posts are pushed into each follower's FeedEntry rows when they are created
+(fan-out-on-write). Authors with a very large audience are skipped at write
+time and their posts are pulled in when the feed is read (fan-out-on-read).
+
+Fan-out only inserts. Feeds that grow past FEED_MAX_DEPTH are cut back by
+`manage.py trim_feeds`, run periodically, so a post's write cost doesn't
+grow with feed depth. Backfills touch a single feed and trim it straight away.
+'''
+import heapq
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .models import Post, FeedEntry
+from realtime.broker import publish_many, user_channel, author_channel
+
+FEED_MAX_DEPTH = getattr(settings, 'FEED_MAX_DEPTH', 800)
+CELEBRITY_THRESHOLD = getattr(settings, 'FEED_CELEBRITY_THRESHOLD', 10000)
+FANOUT_BATCH_SIZE = 1000
+BACKFILL_SIZE = 100
+
+User = get_user_model()
+
+
+def is_celebrity(user):
+    # Read from the table: `user` is often request.user, which may be a cached
+    # copy (CachedTokenAuthentication) whose counters lag behind
+    follower_count = User.objects.filter(pk=user.pk).values_list('follower_count', flat=True).first()
+    return (follower_count or 0) >= CELEBRITY_THRESHOLD
+
+
+def followed_celebrity_ids(user):
+    '''Ids of the accounts `user` follows whose posts are not fanned out'''
+    return list(user.following.filter(follower_count__gte=CELEBRITY_THRESHOLD).values_list('id', flat=True))
+
+
+def trim_feed(user_id):
+    '''Drop everything past FEED_MAX_DEPTH from one user's feed; returns how many entries went'''
+    entries = FeedEntry.objects.filter(user_id=user_id)
+    # One seek down the (user, created_at, post) index finds the first entry to drop
+    cutoff = list(
+        entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[FEED_MAX_DEPTH:FEED_MAX_DEPTH + 1]
+    )
+    if not cutoff:
+        return 0
+    created_at, post_id = cutoff[0]
+    deleted, _ = entries.filter(
+        Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lte=post_id)
+    ).delete()
+    return deleted
+
+
+def over_depth_user_ids():
+    '''Users whose feed holds more than FEED_MAX_DEPTH entries'''
+    return (
+        FeedEntry.objects.order_by().values('user_id')
+        .annotate(entries=Count('id')).filter(entries__gt=FEED_MAX_DEPTH)
+        .values_list('user_id', flat=True)
+    )
+
+
+def _write_entries(entries):
+    # Fan-out doesn't trim: the reads only touch the newest rows, and
+    # `manage.py trim_feeds` removes the excess off the request path
+    FeedEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def _push_post(post, channels):
+    data = {
+        'id': post.id,
+        'author': post.author_id,
+        'author_username': post.author.username,
+        'title': post.title,
+        'created_at': post.created_at.isoformat(),
+    }
+
+    transaction.on_commit(lambda: publish_many(channels, 'post', data))
+
+
+def fan_out_post(post):
+    '''Push a new post into the feed of every follower of its author'''
+    if is_celebrity(post.author):
+        _push_post(post, [author_channel(post.author_id)])
+        return 0
+
+    follower_ids = post.author.followers.values_list('id', flat=True)
+    batch = []
+    written = 0
+    for follower_id in follower_ids.iterator(chunk_size=FANOUT_BATCH_SIZE):
+        batch.append(FeedEntry(user_id=follower_id, post=post, created_at=post.created_at))
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            _write_entries(batch)
+            _push_post(post, [user_channel(entry.user_id) for entry in batch])
+            written += len(batch)
+            batch = []
+    if batch:
+        _write_entries(batch)
+        _push_post(post, [user_channel(entry.user_id) for entry in batch])
+        written += len(batch)
+    return written
+
+
+def backfill_feed(user, author):
+    '''Copy the latest posts of a newly followed author into the user's feed'''
+    if is_celebrity(author):
+        return
+    recent = Post.objects.filter(author=author).order_by('-created_at', '-id').values_list('id', 'created_at')
+    entries = [
+        FeedEntry(user=user, post_id=post_id, created_at=created_at)
+        for post_id, created_at in recent[:BACKFILL_SIZE]
+    ]
+    if entries:
+        _write_entries(entries)
+        trim_feed(user.pk)
+
+
+def backfill_feed_from(user, author_ids):
+    '''Bulk version of backfill_feed: newest posts across several newly followed authors in one query'''
+    author_ids = list(
+        User.objects.filter(pk__in=author_ids, follower_count__lt=CELEBRITY_THRESHOLD).values_list('id', flat=True)
+    )
+    if not author_ids:
+        return
+    recent = Post.objects.filter(author_id__in=author_ids).order_by('-created_at', '-id').values_list('id', 'created_at')
+    entries = [
+        FeedEntry(user=user, post_id=post_id, created_at=created_at)
+        for post_id, created_at in recent[:FEED_MAX_DEPTH]
+    ]
+    if entries:
+        _write_entries(entries)
+        trim_feed(user.pk)
+
+
+def remove_authors_from_feed(user, author_ids):
+    FeedEntry.objects.filter(user=user, post__author_id__in=author_ids).delete()
+
+
+def remove_author_from_feed(user, author):
+    FeedEntry.objects.filter(user=user, post__author=author).delete()
+
+
+def _older_than(queryset, created_field, id_field, before):
+    if before is None:
+        return queryset
+    created_at, pk = before
+    return queryset.filter(
+        Q(**{f'{created_field}__lt': created_at}) |
+        Q(**{created_field: created_at, f'{id_field}__lt': pk})
+    )
+
+
+def get_feed(user, before=None, limit=20):
+    '''
+    Return up to `limit` posts for the user's home feed, newest first.
+
+    `before` is the (created_at, id) key of the last post already seen.
+    Materialized entries and celebrity posts are each read with one indexed
+    range query and merged by key.
+    '''
+    entries = FeedEntry.objects.filter(user=user)
+    entries = _older_than(entries, 'created_at', 'post_id', before)
+    keys = list(entries.order_by('-created_at', '-post_id').values_list('created_at', 'post_id')[:limit])
+
+    celebrity_ids = followed_celebrity_ids(user)
+    if celebrity_ids:
+        pulled = Post.objects.filter(author_id__in=celebrity_ids)
+        pulled = _older_than(pulled, 'created_at', 'id', before)
+        pulled_keys = list(pulled.order_by('-created_at', '-id').values_list('created_at', 'id')[:limit])
+        keys = heapq.merge(keys, pulled_keys, reverse=True)
+
+    # An author who crossed the threshold can still have fanned-out entries, so drop repeats
+    post_ids = list(dict.fromkeys(pk for _, pk in keys))[:limit]
+    posts = Post.objects.for_listing().in_bulk(post_ids)
+    return [posts[pk] for pk in post_ids if pk in posts]
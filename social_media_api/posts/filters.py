@@ -0,0 +1,30 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
+from rest_framework import filters
+
+SEARCH_CONFIG = 'english'
+
+
+def full_text_search(queryset, terms):
+    '''Match `terms` against the GIN-indexed Post.search_vector, best matches first'''
+    query = SearchQuery(terms, config=SEARCH_CONFIG, search_type='websearch')
+    return (
+        queryset.filter(search_vector=query)
+        # ts_rank returns float4; as float8 the value in the cursor compares back exactly
+        .annotate(rank=Cast(SearchRank(F('search_vector'), query), FloatField()))
+        .order_by('-rank')
+    )
+
+
+class PostSearchFilter(filters.SearchFilter):
+    '''
+    Serves ?search= from the stored tsvector on Postgres, ranked by ts_rank.
+    Other databases fall back to the plain SearchFilter (icontains on search_fields).
+    '''
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if not terms or connections[queryset.db].vendor != 'postgresql':
+            return super().filter_queryset(request, queryset, view)
+        return full_text_search(queryset, terms)
@@ -0,0 +1,75 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models import Q
+
+from posts.filters import full_text_search
+from posts.models import Post
+
+User = get_user_model()
+
+WORDS = (
+    "django python postgres index query cache feed follow like comment travel music "
+    "football coffee weekend startup design photo sunset mountain river city night "
+    "code deploy server latency release bug review garden recipe book movie"
+).split()
+
+DEFAULT_TERMS = ["postgres", "coffee sunset", "deploy", "mountain river", "zebra"]
+
+
+class Command(BaseCommand):
+    help = "Compare the old icontains search with the tsvector search on a generated corpus"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000_000, help="corpus size to generate up to")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--term', action='append', dest='terms')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("The full-text backend needs Postgres; this database is %s" % connection.vendor)
+
+        self.generate(options['posts'], options['batch_size'])
+        for term in options['terms'] or DEFAULT_TERMS:
+            old = Post.objects.filter(Q(title__icontains=term) | Q(content__icontains=term)).order_by('-created_at')
+            new = full_text_search(Post.objects.all(), term)
+            old_ms = self.time(old, options['repeat'])
+            new_ms = self.time(new, options['repeat'])
+            self.stdout.write(
+                f"{term!r:20} icontains {old_ms:9.2f} ms   tsvector {new_ms:9.2f} ms   x{old_ms / max(new_ms, 0.001):.1f}"
+            )
+
+    def generate(self, target, batch_size):
+        existing = Post.objects.count()
+        if existing >= target:
+            return
+        author, _ = User.objects.get_or_create(username='search-benchmark')
+        rng = random.Random(42)
+        self.stdout.write(f"Generating {target - existing} posts...")
+        while existing < target:
+            size = min(batch_size, target - existing)
+            Post.objects.bulk_create([
+                Post(
+                    author=author,
+                    title=" ".join(rng.choices(WORDS, k=5)),
+                    content=" ".join(rng.choices(WORDS, k=60)),
+                )
+                for _ in range(size)
+            ])
+            existing += size
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE posts_post")
+
+    def time(self, queryset, repeat):
+        '''Median wall time in ms to fetch one page of results'''
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset[:20])
+            samples.append((time.perf_counter() - start) * 1000)
+        return statistics.median(samples)
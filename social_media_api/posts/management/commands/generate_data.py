@@ -0,0 +1,115 @@
+import random
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+
+from posts.models import Post, Comment, Like
+
+User = get_user_model()
+Follow = User.followers.through
+
+WORDS = (
+    "django python postgres index query cache feed follow like comment travel music "
+    "football coffee weekend startup design photo sunset mountain river city night "
+    "code deploy server latency release bug review garden recipe book movie"
+).split()
+
+
+class Command(BaseCommand):
+    help = "Fill the database with synthetic users, follows, posts, comments and likes in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--follows', type=int, default=50, help="average accounts followed per user")
+        parser.add_argument('--posts', type=int, default=5, help="average posts per user")
+        parser.add_argument('--comments', type=int, default=3, help="average comments per post")
+        parser.add_argument('--likes', type=int, default=10, help="average likes per post")
+        parser.add_argument('--skew', type=float, default=3.0, help="higher values concentrate followers and likes on fewer accounts/posts")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--skip-feeds', action='store_true', help="don't rebuild the materialized feeds afterwards")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.skew = options['skew']
+
+        users = self.step("users", self.make_users, options['users'])
+        self.step("follows", self.make_edges, users, options['users'] * options['follows'])
+        posts = self.step("posts", self.make_posts, users, options['users'] * options['posts'])
+        self.step("comments", self.make_comments, users, posts, len(posts) * options['comments'])
+        self.step("likes", self.make_likes, users, posts, len(posts) * options['likes'])
+
+        self.step("counters", call_command, 'rebuild_counters', stdout=self.stdout)
+        if not options['skip_feeds']:
+            self.step("feeds", call_command, 'rebuild_feeds', stdout=self.stdout)
+
+    def step(self, label, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.stdout.write(f"{label:10} {time.perf_counter() - start:8.1f}s")
+        return result
+
+    def batches(self, total):
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def popular(self, ids):
+        '''A random id, biased towards the front of `ids`'''
+        return ids[int(len(ids) * self.rng.random() ** self.skew)]
+
+    def make_users(self, total):
+        # An unusable password skips hashing, which would dominate the run
+        offset = User.objects.count()
+        ids = []
+        for size in self.batches(total):
+            created = User.objects.bulk_create([
+                User(username=f'user{offset + i}', email=f'user{offset + i}@example.com', password='!')
+                for i in range(size)
+            ])
+            offset += size
+            ids.extend(user.pk for user in created)
+        return ids
+
+    def make_edges(self, users, total):
+        for size in self.batches(total):
+            edges = {}
+            for _ in range(size):
+                followed, follower = self.popular(users), self.rng.choice(users)
+                if followed != follower:
+                    edges[(followed, follower)] = Follow(from_customuser_id=followed, to_customuser_id=follower)
+            Follow.objects.bulk_create(edges.values(), ignore_conflicts=True)
+
+    def make_posts(self, users, total):
+        ids = []
+        for size in self.batches(total):
+            created = Post.objects.bulk_create([
+                Post(
+                    author_id=self.rng.choice(users),
+                    title=" ".join(self.rng.choices(WORDS, k=5)).capitalize(),
+                    content=" ".join(self.rng.choices(WORDS, k=self.rng.randint(10, 80))),
+                )
+                for _ in range(size)
+            ])
+            ids.extend(post.pk for post in created)
+        return ids
+
+    def make_comments(self, users, posts, total):
+        for size in self.batches(total):
+            Comment.objects.bulk_create([
+                Comment(
+                    post_id=self.popular(posts),
+                    author_id=self.rng.choice(users),
+                    content=" ".join(self.rng.choices(WORDS, k=self.rng.randint(3, 25))),
+                )
+                for _ in range(size)
+            ])
+
+    def make_likes(self, users, posts, total):
+        for size in self.batches(total):
+            Like.objects.bulk_create(
+                [Like(post_id=self.popular(posts), user_id=self.rng.choice(users)) for _ in range(size)],
+                ignore_conflicts=True,
+            )
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from posts.models import Post, Comment, Like
+
+User = get_user_model()
+Follow = User.followers.through
+
+
+def count_of(queryset, field):
+    '''Correlated COUNT(*) of `queryset` rows whose `field` points at the outer row'''
+    counted = (
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = "Recompute denormalized like/comment/follower counters and fix any drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        fixed_posts = self.reconcile(
+            Post.objects.annotate(
+                real_like_count=count_of(Like.objects.all(), 'post'),
+                real_comment_count=count_of(Comment.objects.all(), 'post'),
+            ),
+            ['like_count', 'comment_count'],
+            batch_size,
+        )
+        fixed_users = self.reconcile(
+            User.objects.annotate(
+                real_follower_count=count_of(Follow.objects.all(), 'from_customuser'),
+                real_following_count=count_of(Follow.objects.all(), 'to_customuser'),
+            ),
+            ['follower_count', 'following_count'],
+            batch_size,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Fixed {fixed_posts} posts and {fixed_users} users"))
+
+    def reconcile(self, queryset, fields, batch_size):
+        '''Walk the table in primary key batches and write back only the rows that drifted'''
+        fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(queryset.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                return fixed
+            last_pk = batch[-1].pk
+
+            drifted = []
+            for obj in batch:
+                changed = False
+                for field in fields:
+                    real = getattr(obj, f'real_{field}')
+                    if getattr(obj, field) != real:
+                        setattr(obj, field, real)
+                        changed = True
+                if changed:
+                    drifted.append(obj)
+            if drifted:
+                queryset.model.objects.bulk_update(drifted, fields)
+                fixed += len(drifted)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from posts.feed import FEED_MAX_DEPTH, CELEBRITY_THRESHOLD
+from posts.models import Post, FeedEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild every user's materialized home feed from the follow graph"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        celebrity_ids = list(User.objects.filter(follower_count__gte=CELEBRITY_THRESHOLD).values_list('id', flat=True))
+
+        rebuilt = 0
+        for user in User.objects.only('id').iterator(chunk_size=batch_size):
+            authors = user.following.exclude(id__in=celebrity_ids)
+            recent = (
+                Post.objects.filter(author__in=authors)
+                .order_by('-created_at', '-id')
+                .values_list('id', 'created_at')[:FEED_MAX_DEPTH]
+            )
+            with transaction.atomic():
+                FeedEntry.objects.filter(user=user).delete()
+                FeedEntry.objects.bulk_create(
+                    [FeedEntry(user=user, post_id=pk, created_at=created_at) for pk, created_at in recent],
+                    batch_size=batch_size,
+                )
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} feeds"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.feed import FEED_MAX_DEPTH, over_depth_user_ids, trim_feed
+
+
+class Command(BaseCommand):
+    help = "Cut materialized home feeds back to FEED_MAX_DEPTH entries; run it periodically (e.g. from cron)"
+
+    def handle(self, *args, **options):
+        trimmed = removed = 0
+        for user_id in over_depth_user_ids().iterator():
+            removed += trim_feed(user_id)
+            trimmed += 1
+        self.stdout.write(self.style.SUCCESS(f"Trimmed {trimmed} feeds to {FEED_MAX_DEPTH} entries, removed {removed}"))
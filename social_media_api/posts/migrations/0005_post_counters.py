@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:13
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_likes_and_comments(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+
+    def count_of(model_name):
+        model = apps.get_model('posts', model_name)
+        counted = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(total=Count('*')).values('total')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+    Post.objects.update(like_count=count_of('Like'), comment_count=count_of('Comment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_likes_and_comments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:14
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+# The tsvector is maintained in the database so bulk_create and raw updates keep it current.
+# Only title/content changes fire the trigger, so counter updates don't pay for re-parsing.
+CREATE_SQL = '''
+CREATE FUNCTION posts_post_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_post_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, content ON posts_post
+    FOR EACH ROW EXECUTE FUNCTION posts_post_search_vector_update();
+
+UPDATE posts_post SET title = title;
+
+CREATE INDEX posts_post_search_vector_idx ON posts_post USING gin (search_vector);
+'''
+
+DROP_SQL = '''
+DROP INDEX IF EXISTS posts_post_search_vector_idx;
+DROP TRIGGER IF EXISTS posts_post_search_vector_trigger ON posts_post;
+DROP FUNCTION IF EXISTS posts_post_search_vector_update();
+'''
+
+
+def create_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SQL)
+
+
+def drop_search_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_trigger, drop_search_trigger),
+    ]
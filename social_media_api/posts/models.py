@@ -1,16 +1,69 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
+from django.contrib.postgres.search import SearchVectorField
 from django.contrib.auth.models import User
 from django.conf import settings 
 
+COMMENT_PREVIEW_SIZE = getattr(settings, 'COMMENT_PREVIEW_SIZE', 3)
+
+
+class PostQuerySet(models.QuerySet):
+    def with_comments(self):
+        '''Post authors plus every comment and its author, in three queries'''
+        comments = Comment.objects.select_related('author').order_by('-created_at', '-id')
+        return self.select_related('author').prefetch_related(models.Prefetch('comments', queryset=comments))
+
+    def for_listing(self, comment_limit=COMMENT_PREVIEW_SIZE):
+        '''Post authors and only the latest `comment_limit` comments per post'''
+        comments = Comment.objects.select_related('author').order_by('-created_at', '-id')[:comment_limit]
+        return self.select_related('author').prefetch_related(
+            models.Prefetch('comments', queryset=comments, to_attr='latest_comments')
+        )
+
+
 class Post(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True) 
+    # Denormalized counters, updated with F() in the like and comment write paths
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Weighted title/content tsvector, filled by a database trigger on Postgres (see migration 0006)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the fan-out-on-read side of the feed (celebrity authors)
+            models.Index(fields=['author', '-created_at', '-id'], name='posts_post_author_created_idx'),
+            # Keyset pagination of the post list
+            models.Index(fields=['-created_at', '-id'], name='posts_post_created_idx'),
+        ]
 
     def __str__(self):
         return self.title 
+
+    def add_like(self, user):
+        '''Like the post as `user`; returns False if it was already liked'''
+        with transaction.atomic():
+            _, created = Like.objects.get_or_create(user=user, post=self)
+            if created:
+                Post.objects.filter(pk=self.pk).update(like_count=F('like_count') + 1)
+        return created
+
+    def remove_like(self, user):
+        with transaction.atomic():
+            deleted, _ = Like.objects.filter(user=user, post=self).delete()
+            if deleted:
+                Post.objects.filter(pk=self.pk).update(like_count=F('like_count') - 1)
+        return bool(deleted)
+
+    @staticmethod
+    def adjust_comment_count(post_id, delta):
+        Post.objects.filter(pk=post_id).update(comment_count=F('comment_count') + delta)
     
 
 class Comment(models.Model):
@@ -20,6 +73,11 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='posts_comment_created_idx'),
+        ]
+
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}" 
 
@@ -32,4 +90,21 @@ class Like(models.Model):
         unique_together = ("user", "post")
 
         def __str__(self):
-            return f"{self.user.username} liked {self.post.title}" 
\ No newline at end of file
+            return f"{self.user.username} liked {self.post.title}"
+
+
+class FeedEntry(models.Model):
+    '''One row per (follower, post) in a user's materialized home feed'''
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey('Post', on_delete=models.CASCADE, related_name='feed_entries')
+    # Copied from the post so the feed can be read and paginated from this table alone
+    created_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_feed_user_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id} in feed of {self.user_id}"
@@ -25,11 +25,18 @@ class PostSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Post
-        fields = ['id', 'author', 'author_username', 'title', 'content', 'created_at', 'updated_at', 'comments']
-        read_only_fields = ['author', 'created_at', 'updated_at']
+        fields = ['id', 'author', 'author_username', 'title', 'content', 'created_at', 'updated_at',
+                  'like_count', 'comment_count', 'comments']
+        read_only_fields = ['author', 'created_at', 'updated_at', 'like_count', 'comment_count']
 
     def create(self, validated_data):
         request = self.context.get('request')
         if request and hasattr(request, 'user'):
             validated_data['author'] = request.user
         return super().create(validated_data)
+
+
+
+class PostListSerializer(PostSerializer):
+    '''Used in list responses: only the latest comments are embedded, with the total alongside'''
+    comments = CommentSerializer(source='latest_comments', many=True, read_only=True)
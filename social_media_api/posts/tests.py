@@ -1,3 +1,288 @@
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from django.core import signing
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db.models import F, FloatField
+from django.db.models.functions import Cast
 from django.test import TestCase
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import CustomUser
+from querymetrics.testing import QueryBudgetMixin
+from social_media_api.pagination import KeysetPagination
+from . import cache as response_cache, feed
+from .feed import CELEBRITY_THRESHOLD, backfill_feed, fan_out_post, get_feed, trim_feed
+from .models import COMMENT_PREVIEW_SIZE, Post, Comment, FeedEntry
+
+
+class HotPathQueryBudgetTests(QueryBudgetMixin, TestCase):
+    '''The list, detail and feed endpoints must cost the same at 1, 10 and 100 posts'''
+
+    def setUp(self):
+        self.reader = CustomUser.objects.create_user('reader', password='x')
+        self.authors = [CustomUser.objects.create_user(f'author{i}', password='x') for i in range(3)]
+        for author in self.authors:
+            self.reader.follow(author)
+        # One followed account is merged into the feed at read time
+        CustomUser.objects.filter(pk=self.authors[0].pk).update(follower_count=CELEBRITY_THRESHOLD)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def grow_posts(self, size):
+        for i in range(Post.objects.count(), size):
+            author = self.authors[i % len(self.authors)]
+            post = Post.objects.create(author=author, title=f'post {i}', content='body')
+            Comment.objects.bulk_create([
+                Comment(post=post, author=commenter, content='hi') for commenter in self.authors
+            ])
+            post.add_like(self.authors[(i + 1) % len(self.authors)])
+            fan_out_post(post)
+
+    def test_post_list_budget(self):
+        self.assertQueryBudgetScales(2, self.grow_posts, lambda: self.client.get('/api/posts/posts/'))
+
+    def test_post_list_next_page_budget(self):
+        def second_page():
+            first = self.client.get('/api/posts/posts/')
+            if first.data['next']:
+                self.client.get(first.data['next'])
+        # Two requests
+        self.assertQueryBudgetScales(4, self.grow_posts, second_page)
+
+    def test_post_detail_budget(self):
+        post = Post.objects.create(author=self.authors[0], title='detail', content='body')
+
+        def grow_comments(size):
+            # The fetched post's own comments, each by a different user
+            missing = size - post.comments.count()
+            commenters = CustomUser.objects.bulk_create([
+                CustomUser(username=f'commenter{post.comments.count() + i}') for i in range(missing)
+            ])
+            Comment.objects.bulk_create([Comment(post=post, author=user, content='hi') for user in commenters])
+
+        def uncached_detail():
+            cache.clear()
+            return self.client.get(f'/api/posts/posts/{post.pk}/')
+        self.assertQueryBudgetScales(2, grow_comments, uncached_detail)
+        self.assertEqual(len(uncached_detail().data['comments']), self.budget_sizes[-1])
+
+    def test_feed_budget(self):
+        # entries, followed celebrities, their posts, the posts, comment previews
+        self.assertQueryBudgetScales(5, self.grow_posts, lambda: self.client.get('/api/posts/feed/'))
+
+
+class FeedTests(TestCase):
+    def setUp(self):
+        self.reader = CustomUser.objects.create_user('reader', password='x')
+        self.author = CustomUser.objects.create_user('author', password='x')
+        self.star = CustomUser.objects.create_user('star', password='x')
+        self.reader.follow(self.author)
+        self.reader.follow(self.star)
+        CustomUser.objects.filter(pk=self.star.pk).update(follower_count=CELEBRITY_THRESHOLD)
+        self.star.refresh_from_db()
+
+    def post(self, author, title):
+        post = Post.objects.create(author=author, title=title, content='body')
+        fan_out_post(post)
+        return post
+
+    def test_fan_out_writes_followers_feeds(self):
+        post = self.post(self.author, 'hello')
+        self.assertEqual(list(FeedEntry.objects.values_list('user', 'post')), [(self.reader.pk, post.pk)])
+
+    def test_celebrity_posts_are_merged_at_read_time(self):
+        first = self.post(self.author, 'first')
+        starred = self.post(self.star, 'starred')
+        last = self.post(self.author, 'last')
+        self.assertFalse(FeedEntry.objects.filter(post=starred).exists())
+        self.assertEqual(get_feed(self.reader), [last, starred, first])
+        # Paging continues from the key of the last post seen
+        self.assertEqual(get_feed(self.reader, before=(starred.created_at, starred.pk)), [first])
+
+    def test_trim_keeps_the_newest_entries(self):
+        posts = [self.post(self.author, f'post {i}') for i in range(5)]
+        with mock.patch.object(feed, 'FEED_MAX_DEPTH', 3):
+            self.assertEqual(trim_feed(self.reader.pk), 2)
+            self.assertEqual(trim_feed(self.reader.pk), 0)
+        kept = FeedEntry.objects.filter(user=self.reader).values_list('post', flat=True)
+        self.assertEqual(set(kept), {post.pk for post in posts[2:]})
+
+    def test_fan_out_leaves_trimming_to_the_command(self):
+        with mock.patch.object(feed, 'FEED_MAX_DEPTH', 2):
+            for i in range(4):
+                self.post(self.author, f'post {i}')
+            self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 4)
+            self.assertEqual(list(feed.over_depth_user_ids()), [self.reader.pk])
+
+    def test_follow_backfills_recent_posts(self):
+        newcomer = CustomUser.objects.create_user('newcomer', password='x')
+        post = Post.objects.create(author=self.author, title='old', content='body')
+        newcomer.follow(self.author)
+        backfill_feed(newcomer, self.author)
+        self.assertEqual(get_feed(newcomer), [post])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        Post.objects.bulk_create([Post(author=self.author, title=f'post {i}', content='body') for i in range(7)])
+        # Every post shares one timestamp, so only the id tie-breaker orders them
+        Post.objects.update(created_at=Post.objects.first().created_at)
+        self.client = APIClient()
+
+    def walk(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        return ids
+
+    def test_pages_cover_every_post_once(self):
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/posts/posts/?page_size=3'), expected)
+
+    def test_ascending_ordering(self):
+        expected = list(Post.objects.order_by('updated_at', 'id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/posts/posts/?page_size=2&ordering=updated_at'), expected)
+
+    def test_tampered_cursor_is_refused(self):
+        next_url = self.client.get('/api/posts/posts/?page_size=3').data['next']
+        cursor = parse_qs(urlsplit(next_url).query)['cursor'][0]
+        # Point the cursor at another position but keep the old signature
+        forged = signing.dumps(['-created_at', None, 10**6], salt='social_media_api.pagination', compress=True)
+        tampered = forged.rsplit(':', 1)[0] + ':' + cursor.rsplit(':', 1)[1]
+        response = self.client.get('/api/posts/posts/', {'cursor': tampered})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_is_tied_to_its_ordering(self):
+        next_url = self.client.get('/api/posts/posts/?page_size=3').data['next']
+        response = self.client.get(next_url + '&ordering=updated_at')
+        self.assertEqual(response.status_code, 400)
+
+
+class CommentPreviewTests(TestCase):
+    def test_list_embeds_latest_comments_and_detail_all(self):
+        author = CustomUser.objects.create_user('author')
+        post = Post.objects.create(author=author, title='busy', content='body')
+        comments = [Comment.objects.create(post=post, author=author, content=f'comment {i}') for i in range(5)]
+        client = APIClient()
+
+        listed = client.get('/api/posts/posts/').data['results'][0]
+        newest = [comment.pk for comment in reversed(comments)][:COMMENT_PREVIEW_SIZE]
+        self.assertEqual([comment['id'] for comment in listed['comments']], newest)
+
+        detail = client.get(f'/api/posts/posts/{post.pk}/').data
+        self.assertEqual(len(detail['comments']), 5)
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        self.author = CustomUser.objects.create_user('author')
+        self.fan = CustomUser.objects.create_user('fan')
+        self.post = Post.objects.create(author=self.author, title='counted', content='body')
+        self.client = APIClient()
+        self.client.force_authenticate(self.fan)
+
+    def test_likes_and_comments_move_the_counters(self):
+        self.assertEqual(self.client.post(f'/api/posts/posts/{self.post.pk}/like/').data['like_count'], 1)
+        self.assertEqual(self.client.post(f'/api/posts/posts/{self.post.pk}/like/').status_code, 400)
+        comment_id = self.client.post('/api/posts/comments/', {'post': self.post.pk, 'content': 'hi'}).data['id']
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 1))
+
+        self.client.post(f'/api/posts/posts/{self.post.pk}/unlike/')
+        self.client.delete(f'/api/posts/comments/{comment_id}/')
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (0, 0))
+
+    def test_rebuild_counters_fixes_drift(self):
+        self.post.add_like(self.fan)
+        self.fan.follow(self.author)
+        Post.objects.update(like_count=7, comment_count=3)
+        CustomUser.objects.update(follower_count=0, following_count=9)
+
+        call_command('rebuild_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (1, 0))
+        counts = dict(CustomUser.objects.values_list('username', 'follower_count'))
+        self.assertEqual(counts, {'author': 1, 'fan': 0})
+        self.assertEqual(CustomUser.objects.get(pk=self.fan.pk).following_count, 1)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        author = CustomUser.objects.create_user('author')
+        # Same text, so on Postgres every match ties on rank
+        Post.objects.bulk_create([Post(author=author, title='zebra sighting', content='striped zebra') for _ in range(5)])
+        Post.objects.create(author=author, title='lion', content='no stripes here')
+        self.client = APIClient()
+
+    def test_search_pages_through_tied_matches(self):
+        ids, url = [], '/api/posts/posts/?search=zebra&page_size=2'
+        while url:
+            response = self.client.get(url)
+            ids += [post['id'] for post in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(sorted(ids), sorted(Post.objects.filter(title__startswith='zebra').values_list('id', flat=True)))
+
+    def test_float_cursor_round_trips_on_ties(self):
+        Post.objects.filter(title='lion').update(like_count=1)
+        # Thirds aren't exact in binary; ties on them must still page cleanly
+        ranked = Post.objects.annotate(rank=Cast(F('like_count') + 1, FloatField()) / 3.0).order_by('-rank')
+        paginator, seen, params = KeysetPagination(), [], {'page_size': 2}
+        while True:
+            request = Request(APIRequestFactory().get('/', params))
+            seen += [post.pk for post in paginator.paginate_queryset(ranked, request)]
+            if not paginator.has_next:
+                break
+            params['cursor'] = paginator.encode_cursor(paginator.ordering, paginator.page[-1])
+        self.assertEqual(len(seen), 6)
+        self.assertEqual(len(set(seen)), 6)
+
+
+class DetailCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, title='hello', content='body')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.url = f'/api/posts/posts/{self.post.pk}/'
+
+    def test_matching_etag_gets_304_without_a_query(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_writes_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{self.url}like/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['like_count'], 1)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_etag_comes_from_the_content(self):
+        etag = self.client.get(self.url)['ETag']
+        # A lost stamp is re-minted; unchanged content keeps its validator
+        cache.clear()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
 
-# Create your tests here.
+    def test_read_racing_a_write_is_not_kept(self):
+        # A reader misses, a write commits, then the reader stores what it read before the write
+        version, entry = response_cache.get_detail(self.post.pk, 'json')
+        self.assertIsNone(entry)
+        with self.captureOnCommitCallbacks(execute=True):
+            response_cache.invalidate_post(self.post.pk)
+        response_cache.set_detail(self.post.pk, 'json', version, {'title': 'stale'})
+        self.assertEqual(self.client.get(self.url).data['title'], 'hello')
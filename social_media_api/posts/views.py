@@ -1,10 +1,17 @@
-from django.shortcuts import render
-from rest_framework import viewsets, permissions, filters, generics
+from django.shortcuts import render, get_object_or_404
+from django.db import transaction
+from rest_framework import viewsets, permissions, filters, generics, status
+from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied
 from .models import Post, Comment
-from .serializers import PostSerializer, CommentSerializer
+from .serializers import PostSerializer, PostListSerializer, CommentSerializer
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from .feed import fan_out_post, get_feed
+from .filters import PostSearchFilter
+from . import cache as response_cache
+from .cache import invalidate_post
+from notifications.events import notify, LIKED, COMMENTED
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -20,27 +27,100 @@ class PostViewSet(viewsets.ModelViewSet):
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    filter_backends = [PostSearchFilter, filters.OrderingFilter]
     search_fields = ["title", "content"]
     ordering_fields = ["created_at", "updated_at"]
 
+    def get_queryset(self):
+        if self.action == 'list':
+            return super().get_queryset().for_listing()
+        return super().get_queryset().with_comments()
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return PostListSerializer
+        return PostSerializer
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        fan_out_post(post)
+
+    def retrieve(self, request, *args, **kwargs):
+        '''Served from posts.cache; a matching If-None-Match gets a 304 without a query'''
+        fmt = request.accepted_renderer.format
+        if fmt not in response_cache.CACHED_FORMATS or not str(kwargs['pk']).isdigit():
+            return super().retrieve(request, *args, **kwargs)
+
+        post_id = int(kwargs['pk'])
+        version, entry = response_cache.get_detail(post_id, fmt)
+        if entry is None:
+            data = self.get_serializer(self.get_object()).data
+            entry = response_cache.set_detail(post_id, fmt, version, data)
+
+        etag = entry['etag']
+        if_none_match = request.headers.get('If-None-Match', '')
+        if etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*':
+            response_cache.stats.record('not_modified')
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(entry['data'], headers={'ETag': etag})
+
+    @action(detail=False, methods=['get'], url_path='cache-stats', permission_classes=[permissions.IsAdminUser])
+    def cache_stats(self, request):
+        '''Detail cache hit/miss counters of the worker answering the request'''
+        return Response(response_cache.stats.snapshot())
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    @transaction.atomic
+    def like(self, request, pk=None):
+        post = get_object_or_404(Post, pk=pk)
+        if not post.add_like(request.user):
+            return Response({"detail": "You already liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+        notify(request.user, LIKED, post)
+        return Response({"detail": "Post liked.", "like_count": post.like_count + 1}, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def unlike(self, request, pk=None):
+        post = get_object_or_404(Post, pk=pk)
+        if not post.remove_like(request.user):
+            return Response({"detail": "You have not liked this post."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"detail": "Post unliked.", "like_count": post.like_count - 1}, status=status.HTTP_200_OK)
 
 
 class CommentViewSet(viewsets.ModelViewSet):
-    queryset = Comment.objects.all().order_by('-created_at')
+    queryset = Comment.objects.select_related('author').order_by('-created_at')
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        comment = serializer.save(author=self.request.user)
+        Post.adjust_comment_count(comment.post_id, 1)
+        notify(self.request.user, COMMENTED, comment.post)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        old_post_id = serializer.instance.post_id
+        comment = serializer.save()
+        if comment.post_id != old_post_id:
+            invalidate_post(old_post_id)
+            Post.adjust_comment_count(old_post_id, -1)
+            Post.adjust_comment_count(comment.post_id, 1)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        post_id = instance.post_id
+        instance.delete()
+        Post.adjust_comment_count(post_id, -1)
 
 class FeedView(generics.ListAPIView):
-    serializer_class = PostSerializer
+    '''Home feed read from the materialized FeedEntry table'''
+    serializer_class = PostListSerializer
     permission_classes = [permissions.IsAuthenticated]
 
-    def get_queryset(self):
-        user = self.request.user
-        following_users = user.following.all()
-        return Post.objects.filter(author__in=following_users).order_by('-created_at')
+    def list(self, request, *args, **kwargs):
+        paginator = self.paginator
+        before = paginator.start(request, '-created_at')
+        posts = get_feed(request.user, before=before, limit=paginator.page_size + 1)
+        page = paginator.paginate_items(posts)
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
@@ -0,0 +1,65 @@
+import threading
+
+from asgiref.sync import iscoroutinefunction
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from .middleware import QueryMetricsMiddleware, QueryRecorder
+from .registry import registry
+
+
+class QueryMetricsMiddlewareTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def stats(self, view, method):
+        return registry.views[(view, method)]
+
+    def test_sync_requests_record_their_queries(self):
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.create_user('alice'))
+        client.get('/api/notifications/')
+        stats = self.stats('notification-list', 'GET')
+        self.assertEqual((stats.requests, stats.sampled), (1, 1))
+        self.assertGreater(stats.queries, 0)
+
+    def test_runs_natively_in_an_async_chain(self):
+        async def get_response(request):
+            return None
+
+        self.assertTrue(iscoroutinefunction(QueryMetricsMiddleware(get_response)))
+        self.assertFalse(iscoroutinefunction(QueryMetricsMiddleware(lambda request: None)))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+    async def test_async_view_queries_are_recorded(self):
+        # user_login queries through sync_to_async, on another thread and connection
+        await self.async_client.post('/api/accounts/login/', {'username': 'nobody', 'password': 'x'},
+                                     content_type='application/json')
+        stats = self.stats('login', 'POST')
+        self.assertEqual(stats.sampled, 1)
+        self.assertGreater(stats.queries, 0)
+
+    def test_scoped_execute_wrappers_still_unwind(self):
+        def wrapper(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+
+        # The middleware installs its own wrapper while this one is active
+        connection.execute_wrappers.clear()
+        with connection.execute_wrapper(wrapper):
+            self.client.get('/api/notifications/')
+        self.assertNotIn(wrapper, connection.execute_wrappers)
+
+    def test_recorder_counts_from_many_threads(self):
+        recorder = QueryRecorder()
+
+        def run():
+            for _ in range(500):
+                recorder(lambda *args: None, 'SELECT 1', (), False, {})
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual((recorder.count, recorder.statements['SELECT 1'][0]), (4000, 4000))
@@ -0,0 +1,199 @@
+'''
+Pub/sub layer behind the server-push endpoint.
+
+publish() is called from ordinary sync code (views, the notification worker);
+subscribers are async SSE connections. InProcessBroker only reaches clients
+connected to the same process, so it is only good for a single ASGI worker
+that also does all the publishing, e.g. tests and feed pushes in development.
+Notifications are published by `manage.py process_notifications`, which is a
+separate process. It refuses to run on a broker that isn't cross_process.
+
+PostgresBroker (the default) carries messages between processes with
+LISTEN/NOTIFY on the database the project already uses. publish() sends one
+NOTIFY. Each web process keeps a single listening connection on a thread and
+hands what arrives to its own subscribers.
+'''
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+# Published to a user's channel when what they follow changes; the stream
+# recomputes its channels instead of forwarding it
+RESUBSCRIBE = 'resubscribe'
+
+
+class Subscription:
+    '''One client's queue and the channels it is registered on'''
+
+    def __init__(self, loop, queue_size):
+        self.loop = loop
+        self.queue = asyncio.Queue(queue_size)
+        self.channels = frozenset()
+
+
+class InProcessBroker:
+    queue_size = 100
+    cross_process = False
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        '''Deliver `message` to every subscriber of `channel`; safe to call from any thread'''
+        self.publish_many([channel], message)
+
+    def publish_many(self, channels, message):
+        self._deliver_local(channels, message)
+
+    def _deliver_local(self, channels, message):
+        with self._lock:
+            subscriptions = {sub for channel in channels for sub in self._subscribers.get(channel, ())}
+        for subscription in subscriptions:
+            subscription.loop.call_soon_threadsafe(self._deliver, subscription.queue, message)
+
+    @staticmethod
+    def _deliver(queue, message):
+        # A client that stopped reading loses its oldest messages rather than growing memory
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    def subscribe(self, channels):
+        '''Register a new queue on `channels`; call from the event loop that will read it'''
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        self.resubscribe(subscription, channels)
+        return subscription
+
+    def resubscribe(self, subscription, channels):
+        '''Move a subscription to a new set of channels without missing messages on the ones it keeps'''
+        channels = frozenset(channels)
+        with self._lock:
+            for channel in subscription.channels - channels:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+            for channel in channels - subscription.channels:
+                self._subscribers[channel].add(subscription)
+            subscription.channels = channels
+
+    def unsubscribe(self, subscription):
+        self.resubscribe(subscription, ())
+
+    async def listen(self, subscription, timeout=None):
+        '''
+        Yield messages arriving on the subscription.
+        Yields None after `timeout` seconds of silence so callers can send keep-alives.
+        '''
+        while True:
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield None
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({id(sub) for subs in self._subscribers.values() for sub in subs})
+
+
+class PostgresBroker(InProcessBroker):
+    '''Cross-process delivery over Postgres LISTEN/NOTIFY'''
+    cross_process = True
+    pg_channel = 'realtime'
+    # NOTIFY payloads must stay under 8000 bytes
+    max_payload = 7500
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        super().__init__()
+        self.using = using
+        self._listener = None
+
+    def publish_many(self, channels, message):
+        connection = connections[self.using]
+        if connection.vendor != 'postgresql':
+            raise ImproperlyConfigured("PostgresBroker needs a Postgres database; use InProcessBroker elsewhere")
+        try:
+            with connection.cursor() as cursor:
+                for payload in self._payloads(list(channels), message):
+                    cursor.execute("SELECT pg_notify(%s, %s)", [self.pg_channel, payload])
+        except DatabaseError:
+            # Called after commit; losing a push must not fail the request that caused it
+            logger.exception("Publishing to %d channels failed", len(channels))
+
+    def _payloads(self, channels, message):
+        '''Split the channel list so each NOTIFY payload fits'''
+        body = json.dumps(message)
+        batch, size = [], len(body)
+        for channel in channels:
+            if batch and size + len(channel) + 4 > self.max_payload:
+                yield json.dumps([batch, message])
+                batch, size = [], len(body)
+            batch.append(channel)
+            size += len(channel) + 4
+        if batch:
+            yield json.dumps([batch, message])
+
+    def subscribe(self, channels):
+        self._start_listener()
+        return super().subscribe(channels)
+
+    def _start_listener(self):
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen_forever, name='realtime-listen', daemon=True)
+                self._listener.start()
+
+    def _listen_forever(self):
+        wrapper = connections[self.using]
+        while True:
+            try:
+                # Its own connection: Django's are per thread and not meant to block for hours
+                raw = wrapper.get_new_connection(wrapper.get_connection_params())
+                raw.autocommit = True
+                with raw:
+                    raw.execute(f"LISTEN {self.pg_channel}")
+                    for notify in raw.notifies():
+                        channels, message = json.loads(notify.payload)
+                        self._deliver_local(channels, message)
+            except Exception:
+                logger.exception("Realtime listener lost its connection; reconnecting")
+                time.sleep(1)
+
+
+@lru_cache(maxsize=None)
+def get_broker():
+    return import_string(getattr(settings, 'REALTIME_BROKER', 'realtime.broker.PostgresBroker'))()
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def author_channel(user_id):
+    '''Posts by accounts too big to fan out are published once here instead of per follower'''
+    return f'author:{user_id}'
+
+
+def publish(channel, event, data):
+    get_broker().publish(channel, {'event': event, 'data': data})
+
+
+def publish_many(channels, event, data):
+    '''Same message to many channels; one NOTIFY per few hundred channels on PostgresBroker'''
+    get_broker().publish_many(channels, {'event': event, 'data': data})
+
+
+def following_changed(user_id):
+    '''Tell the user's open streams to recompute which author channels they listen on'''
+    transaction.on_commit(lambda: publish(user_channel(user_id), RESUBSCRIBE, {}))
@@ -0,0 +1,69 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Open many idle event-stream connections against a running ASGI server and report how many it holds"
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help="e.g. http://127.0.0.1:8000/api/realtime/stream/?token=<key>")
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--ramp', type=int, default=200, help="connections opened per second")
+        parser.add_argument('--hold', type=float, default=60, help="seconds to keep connections idle")
+
+    def handle(self, *args, **options):
+        result = asyncio.run(self.run(options))
+        self.stdout.write(
+            f"opened {result['opened']}/{options['connections']}, "
+            f"still open after {options['hold']:.0f}s: {result['alive']}, "
+            f"failed: {result['failed']}, median connect: {result['connect_ms']:.1f} ms"
+        )
+
+    async def run(self, options):
+        url = urlsplit(options['url'])
+        path = url.path + (f"?{url.query}" if url.query else "")
+        request = (
+            f"GET {path} HTTP/1.1\r\nHost: {url.netloc}\r\n"
+            "Accept: text/event-stream\r\nConnection: keep-alive\r\n\r\n"
+        ).encode()
+        connect_times, writers, failed = [], [], 0
+
+        async def open_one():
+            nonlocal failed
+            start = time.perf_counter()
+            try:
+                reader, writer = await asyncio.open_connection(url.hostname, url.port or 80)
+                writer.write(request)
+                await writer.drain()
+                status = await asyncio.wait_for(reader.readline(), 30)
+                if b" 200 " not in status:
+                    raise ConnectionError(status)
+            except (OSError, asyncio.TimeoutError, ConnectionError):
+                failed += 1
+                return
+            connect_times.append((time.perf_counter() - start) * 1000)
+            writers.append((reader, writer))
+
+        tasks = []
+        for i in range(options['connections']):
+            tasks.append(asyncio.create_task(open_one()))
+            if (i + 1) % options['ramp'] == 0:
+                await asyncio.sleep(1)
+        await asyncio.gather(*tasks)
+        opened = len(writers)
+
+        await asyncio.sleep(options['hold'])
+        alive = sum(1 for reader, writer in writers if not reader.at_eof() and not writer.is_closing())
+        for _, writer in writers:
+            writer.close()
+
+        connect_times.sort()
+        return {
+            'opened': opened,
+            'alive': alive,
+            'failed': failed,
+            'connect_ms': connect_times[len(connect_times) // 2] if connect_times else 0.0,
+        }
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from io import StringIO
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from accounts.models import CustomUser
+from posts.feed import CELEBRITY_THRESHOLD
+from social_media_api.authentication import issue_tokens
+from .broker import RESUBSCRIBE, InProcessBroker, PostgresBroker, author_channel, get_broker, publish, user_channel
+from .views import event_stream
+
+
+class InProcessBrokerTests(TestCase):
+    async def test_resubscribe_moves_channels(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe(['a', 'b'])
+        broker.publish('a', 1)
+        broker.resubscribe(subscription, ['b', 'c'])
+        broker.publish('a', 2)
+        broker.publish_many(['b', 'c'], 3)
+        await asyncio.sleep(0)
+        messages = broker.listen(subscription, timeout=0.01)
+        self.assertEqual([await anext(messages) for _ in range(3)], [1, 3, None])
+        broker.unsubscribe(subscription)
+        self.assertEqual(broker.subscriber_count(), 0)
+
+    def test_postgres_payloads_fit_and_cover_every_channel(self):
+        channels = [user_channel(pk) for pk in range(5000)]
+        payloads = list(PostgresBroker()._payloads(channels, {'event': 'post', 'data': {'title': 'x' * 200}}))
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(payload) < 8000 for payload in payloads))
+        self.assertEqual([channel for payload in payloads for channel in json.loads(payload)[0]], channels)
+
+
+@override_settings(REALTIME_BROKER='realtime.broker.InProcessBroker')
+class EventStreamTests(TestCase):
+    def setUp(self):
+        get_broker.cache_clear()
+        self.addCleanup(get_broker.cache_clear)
+        self.user = CustomUser.objects.create_user('listener')
+        self.star = CustomUser.objects.create_user('star')
+        CustomUser.objects.filter(pk=self.star.pk).update(follower_count=CELEBRITY_THRESHOLD)
+        self.token = Token.objects.create(user=self.user)
+
+    async def read(self, content):
+        chunk = await asyncio.wait_for(anext(content), 1)
+        return chunk.decode() if isinstance(chunk, bytes) else chunk
+
+    async def test_stream_follows_new_celebrity_without_reconnecting(self):
+        request = RequestFactory().get('/api/realtime/stream/', {'token': self.token.key})
+        response = await event_stream(request)
+        content = aiter(response.streaming_content)
+        self.assertEqual(await self.read(content), ": connected\n\n")
+
+        publish(user_channel(self.user.pk), 'notification', {'id': 1})
+        self.assertIn('event: notification', await self.read(content))
+
+        await sync_to_async(self.user.follow)(self.star)
+        publish(user_channel(self.user.pk), RESUBSCRIBE, {})
+        # Posted once the stream has had a moment to act on the resubscribe
+        asyncio.get_running_loop().call_later(0.2, publish, author_channel(self.star.pk), 'post', {'id': 2})
+        chunk = await self.read(content)
+        self.assertIn('event: post', chunk)
+        self.assertNotIn(RESUBSCRIBE, chunk)
+        # A dropped client's generator is closed when collected, which unsubscribes it
+        del response, content
+        await asyncio.sleep(0.01)
+        self.assertEqual(get_broker().subscriber_count(), 0)
+
+    async def test_stream_accepts_access_tokens(self):
+        access = issue_tokens(self.user)['access']
+        for request in (
+            RequestFactory().get('/api/realtime/stream/', {'access_token': access}),
+            RequestFactory().get('/api/realtime/stream/', HTTP_AUTHORIZATION=f'Bearer {access}'),
+        ):
+            response = await event_stream(request)
+            content = aiter(response.streaming_content)
+            self.assertEqual(await self.read(content), ": connected\n\n")
+            del response, content
+        await asyncio.sleep(0.01)
+        response = await event_stream(RequestFactory().get('/api/realtime/stream/', {'access_token': 'forged'}))
+        self.assertEqual(response.status_code, 401)
+
+    def test_worker_refuses_a_broker_it_cannot_reach_streams_through(self):
+        with self.assertRaises(CommandError):
+            call_command('process_notifications', '--once', stdout=StringIO())
+        call_command('process_notifications', '--once', '--no-push', stdout=StringIO())
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import exceptions
+
+from posts.feed import followed_celebrity_ids
+from social_media_api.authentication import CachedTokenAuthentication, SignedTokenAuthentication
+from .broker import RESUBSCRIBE, get_broker, user_channel, author_channel
+
+HEARTBEAT_SECONDS = getattr(settings, 'REALTIME_HEARTBEAT', 15)
+CHANNEL_REFRESH_SECONDS = getattr(settings, 'REALTIME_CHANNEL_REFRESH', 300)
+
+
+def _authenticate(request):
+    # EventSource can't send headers, so the credentials may also come as
+    # ?token= (Token auth) or ?access_token= (Bearer access token)
+    auth = request.headers.get('Authorization', '').split()
+    scheme, value = auth if len(auth) == 2 else (None, None)
+    key = request.GET.get('token') or (value if scheme == 'Token' else None)
+    access = request.GET.get('access_token') or (value if scheme == 'Bearer' else None)
+    try:
+        if access:
+            user, _ = SignedTokenAuthentication().authenticate_credentials(access)
+        elif key:
+            user, _ = CachedTokenAuthentication().authenticate_credentials(key)
+        else:
+            return None
+    except exceptions.AuthenticationFailed:
+        return None
+    return user
+
+
+def _channels_for(user):
+    return [user_channel(user.pk)] + [author_channel(pk) for pk in followed_celebrity_ids(user)]
+
+
+def _subscribe_request(request):
+    '''Authenticate and work out the channels in one trip to the sync thread'''
+    user = _authenticate(request)
+    if user is None:
+        return None, None
+    return user, _channels_for(user)
+
+
+async def event_stream(request):
+    '''
+    Server-Sent Events stream of new notifications and feed posts for the
+    authenticated user. Needs an ASGI server; every idle connection is just a
+    parked coroutine and one small queue.
+    '''
+    user, channels = await sync_to_async(_subscribe_request)(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+
+    async def stream():
+        broker = get_broker()
+        loop = asyncio.get_running_loop()
+        subscription = broker.subscribe(channels)
+        refresh_at = loop.time() + CHANNEL_REFRESH_SECONDS
+        try:
+            yield ": connected\n\n"
+            async for message in broker.listen(subscription, timeout=HEARTBEAT_SECONDS):
+                resubscribe = message is not None and message['event'] == RESUBSCRIBE
+                # A follow change says so at once; an account crossing the
+                # celebrity threshold is only noticed by the periodic refresh
+                if resubscribe or loop.time() >= refresh_at:
+                    broker.resubscribe(subscription, await sync_to_async(_channels_for)(user))
+                    refresh_at = loop.time() + CHANNEL_REFRESH_SECONDS
+                if resubscribe:
+                    continue
+                if message is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -2,6 +2,8 @@
 ASGI config for social_media_api project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+The server-push stream at /api/realtime/stream/ only works when served from
+here, e.g. ``uvicorn social_media_api.asgi:application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
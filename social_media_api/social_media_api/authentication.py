@@ -0,0 +1,353 @@
+'''
+Token authentication without a database hit per request.
+
+TokenAuthentication runs a Token JOIN user query on every API call.
+CachedTokenAuthentication checks a bounded per-process LRU first, then the
+shared Django cache (Redis, see CACHES), and only goes to the database when
+both miss. The accounts signals call invalidate_token() when a token is
+deleted (logout, rotation) or its user is saved. Other processes drop their
+local copy within AUTH_TOKEN_LOCAL_TTL seconds.
+
+The user that comes with a cached token is a snapshot: fine for identity,
+not for counters. Code that decides on them (posts.feed.is_celebrity) reads
+them from the table.
+
+SignedTokenAuthentication (further down) is the stateless alternative.
+'''
+import copy
+import hashlib
+import logging
+import math
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection as db_connection
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+
+LOCAL_CACHE_SIZE = getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_SIZE', 10000)
+LOCAL_TTL = getattr(settings, 'AUTH_TOKEN_LOCAL_TTL', 30)
+SHARED_TTL = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+CACHE_KEY = 'auth:token:{}'
+
+
+def _digest(key):
+    # Raw tokens never end up as cache keys
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class LocalTokenCache:
+    '''Thread-safe LRU of token digest -> Token (with its user loaded)'''
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, digest):
+        with self.lock:
+            entry = self.entries.get(digest)
+            if entry is None:
+                return None
+            token, expires = entry
+            if expires < time.monotonic():
+                del self.entries[digest]
+                return None
+            self.entries.move_to_end(digest)
+            return token
+
+    def set(self, digest, token):
+        with self.lock:
+            self.entries[digest] = (token, time.monotonic() + self.ttl)
+            self.entries.move_to_end(digest)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def discard(self, digest):
+        with self.lock:
+            self.entries.pop(digest, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class TokenCacheStats:
+    '''Per-process lookup counters'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.local_hits = self.shared_hits = self.misses = 0
+
+    def record(self, outcome):
+        with self.lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def snapshot(self):
+        total = self.local_hits + self.shared_hits + self.misses
+        return {
+            'local_hits': self.local_hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.local_hits + self.shared_hits) / total, 4) if total else None,
+        }
+
+
+local_cache = LocalTokenCache(LOCAL_CACHE_SIZE, LOCAL_TTL)
+stats = TokenCacheStats()
+
+
+def invalidate_token(key):
+    digest = _digest(key)
+    local_cache.discard(digest)
+    cache.delete(CACHE_KEY.format(digest))
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+
+    def authenticate_credentials(self, key):
+        digest = _digest(key)
+        token = local_cache.get(digest)
+        if token is not None:
+            stats.record('local_hits')
+        else:
+            token = cache.get(CACHE_KEY.format(digest))
+            if token is not None:
+                stats.record('shared_hits')
+            else:
+                stats.record('misses')
+                # Raises AuthenticationFailed for unknown or inactive
+                user, token = super().authenticate_credentials(key)
+                cache.set(CACHE_KEY.format(digest), token, SHARED_TTL)
+            local_cache.set(digest, token)
+
+        # Each request gets its own user object; the cached one stays pristine
+        return copy.copy(token.user), token
+
+
+# Stateless signed tokens
+#
+# Access tokens are HMAC-signed (django.core.signing, keyed by SECRET_KEY)
+# claims carrying the user id and username, valid for SIGNED_ACCESS_TOKEN_TTL
+# seconds. Authenticating a read costs no query: request.user is built from
+# the claims. Writes load the user row. Refresh tokens live longer and are
+# checked against the database when used. Revoked token ids are kept in
+# RevokedToken and mirrored into a per-process Bloom filter, rebuilt in the
+# background every REVOCATION_REFRESH_INTERVAL seconds; only a Bloom hit
+# (revoked, or a false positive) costs a query.
+
+ACCESS_TTL = getattr(settings, 'SIGNED_ACCESS_TOKEN_TTL', 300)
+REFRESH_TTL = getattr(settings, 'SIGNED_REFRESH_TOKEN_TTL', 14 * 24 * 60 * 60)
+REVOCATION_REFRESH_INTERVAL = getattr(settings, 'REVOCATION_REFRESH_INTERVAL', 30)
+REVOCATION_CAPACITY = getattr(settings, 'REVOCATION_BLOOM_CAPACITY', 100000)
+REVOCATION_ERROR_RATE = getattr(settings, 'REVOCATION_BLOOM_ERROR_RATE', 0.001)
+TOKEN_SALT = 'social_media_api.authentication.{}'
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+
+class RevocationList:
+    '''
+    Per-process Bloom filter of revoked token ids, reloaded from the database periodically.
+
+    Only the very first check loads the filter inline. After that a stale
+    filter keeps answering while one background thread builds its
+    replacement, which is swapped in whole; ids revoked by this process
+    during the rebuild are carried over so none slip through.
+    '''
+
+    def __init__(self, capacity, error_rate, interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.first_load = threading.Lock()
+        self.bloom = None
+        self.loaded_at = 0
+        self.added_while_loading = None
+
+    def reload(self):
+        from accounts.models import RevokedToken
+
+        with self.lock:
+            if self.added_while_loading is None:
+                self.added_while_loading = []
+        bloom = BloomFilter(self.capacity, self.error_rate)
+        try:
+            for jti in RevokedToken.objects.filter(expires_at__gt=timezone.now()).values_list('jti', flat=True).iterator():
+                bloom.add(jti)
+        finally:
+            with self.lock:
+                added, self.added_while_loading = self.added_while_loading, None
+        with self.lock:
+            for jti in added:
+                bloom.add(jti)
+            self.bloom = bloom
+            self.loaded_at = time.monotonic()
+
+    def _reload_in_background(self):
+        try:
+            self.reload()
+        except Exception:
+            # Try again on a later request; until then the old filter answers
+            logger.exception("Reloading the revocation filter failed")
+            with self.lock:
+                self.loaded_at = time.monotonic()
+        finally:
+            # Threads get their own connection; don't leave it open
+            db_connection.close()
+
+    def add(self, jti):
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+            if self.added_while_loading is not None:
+                self.added_while_loading.append(jti)
+
+    def _claim_reload(self):
+        '''True for the one caller that should start a reload of a stale filter'''
+        with self.lock:
+            if self.added_while_loading is not None or time.monotonic() - self.loaded_at <= self.interval:
+                return False
+            # Marks the reload as in progress for everyone else
+            self.added_while_loading = []
+            return True
+
+    def is_revoked(self, jti):
+        from accounts.models import RevokedToken
+
+        if self.bloom is None:
+            with self.first_load:
+                if self.bloom is None:
+                    self.reload()
+        elif time.monotonic() - self.loaded_at > self.interval and self._claim_reload():
+            threading.Thread(target=self._reload_in_background, name='revocation-reload', daemon=True).start()
+        # The filter never misses a revoked id; confirm hits against the table
+        return jti in self.bloom and RevokedToken.objects.filter(jti=jti).exists()
+
+
+revocations = RevocationList(REVOCATION_CAPACITY, REVOCATION_ERROR_RATE, REVOCATION_REFRESH_INTERVAL)
+
+
+def _sign(user, kind):
+    claims = {
+        'uid': user.pk, 'u': user.get_username(), 'st': user.is_staff, 'su': user.is_superuser,
+        'jti': secrets.token_hex(16), 't': kind,
+    }
+    return signing.dumps(claims, salt=TOKEN_SALT.format(kind), compress=True)
+
+
+def issue_tokens(user):
+    '''A fresh access/refresh pair for `user`'''
+    return {'access': _sign(user, 'access'), 'refresh': _sign(user, 'refresh'), 'expires_in': ACCESS_TTL}
+
+
+def read_token(value, kind):
+    '''Claims of a valid, unexpired token of `kind`; raises AuthenticationFailed otherwise'''
+    max_age = ACCESS_TTL if kind == 'access' else REFRESH_TTL
+    try:
+        claims = signing.loads(value, salt=TOKEN_SALT.format(kind), max_age=max_age)
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed('Token expired.')
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    if claims.get('t') != kind:
+        raise exceptions.AuthenticationFailed('Invalid token.')
+    return claims
+
+
+def revoke(claims):
+    '''Revoke the token described by `claims` until it would have expired anyway'''
+    from accounts.models import RevokedToken
+
+    ttl = ACCESS_TTL if claims['t'] == 'access' else REFRESH_TTL
+    now = timezone.now()
+    RevokedToken.objects.get_or_create(jti=claims['jti'], defaults={'expires_at': now + timedelta(seconds=ttl)})
+    RevokedToken.objects.filter(expires_at__lte=now).delete()
+    revocations.add(claims['jti'])
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    '''
+    `Authorization: Bearer <access token>`; request.auth is the claims dict.
+
+    Reads (SAFE_METHODS) get a user built from the claims without a query.
+    Writes load the real row up front, since they save objects against the
+    user and read its counters (fan-out checks follower_count, for one).
+    '''
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed('Invalid token header.')
+        return self.authenticate_credentials(auth[1].decode(errors='replace'), load=request.method not in SAFE_METHODS)
+
+    def authenticate_credentials(self, value, load=False):
+        '''(user, claims) for an access token; `load` fetches the whole user row up front'''
+        claims = read_token(value, 'access')
+        if revocations.is_revoked(claims['jti']):
+            raise exceptions.AuthenticationFailed('Token revoked.')
+        if load:
+            return self.load_user(claims), claims
+        return self.get_user(claims), claims
+
+    def get_user(self, claims):
+        '''
+        The user from the claims, without a query. id, username, is_staff and
+        is_superuser come from the token and is_active is taken as true; every
+        other field is deferred and loaded from the table when first read.
+        '''
+        User = get_user_model()
+        loaded = {'id': claims['uid'], User.USERNAME_FIELD: claims['u'], 'is_active': True}
+        # Tokens issued before these claims existed load them instead
+        for claim, field in (('st', 'is_staff'), ('su', 'is_superuser')):
+            if claim in claims:
+                loaded[field] = claims[claim]
+        # from_db() wants the values in field order
+        names = [field.attname for field in User._meta.concrete_fields if field.attname in loaded]
+        return User.from_db(DEFAULT_DB_ALIAS, names, [loaded[name] for name in names])
+
+    def load_user(self, claims):
+        user = get_user_model().objects.filter(pk=claims['uid'], is_active=True).first()
+        if user is None:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return user
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,165 @@
+'''
+Keyset (cursor) pagination used by every list endpoint.
+
+Pages are fetched with `WHERE (created_at, id) < (last seen)` instead of
+OFFSET, so page N costs the same as page 1 and no COUNT(*) is issued.
+Cursors are signed so clients can't craft arbitrary positions.
+'''
+from django.core import signing
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 50
+    cursor_query_param = 'cursor'
+    total_query_param = 'with_total'
+
+    # Fields a page may be ordered by; `id` is always added as the tie-breaker.
+    # `rank` is the search relevance annotation added by posts.filters.
+    keyset_fields = ('created_at', 'updated_at', 'timestamp', 'rank')
+    default_ordering = '-created_at'
+    cursor_salt = 'social_media_api.pagination'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, queryset):
+        order_by = queryset.query.order_by
+        if order_by and order_by[0].lstrip('-') in self.keyset_fields:
+            return order_by[0]
+        field_names = {field.name for field in queryset.model._meta.get_fields()}
+        if self.default_ordering.lstrip('-') in field_names:
+            return self.default_ordering
+        # Models without a timestamp (e.g. users) are paged by primary key alone
+        return '-pk'
+
+    def encode_cursor(self, ordering, instance):
+        value = None
+        if ordering.lstrip('-') != 'pk':
+            value = getattr(instance, ordering.lstrip('-'))
+            if hasattr(value, 'isoformat'):
+                value = value.isoformat()
+        return signing.dumps([ordering, value, instance.pk], salt=self.cursor_salt, compress=True)
+
+    def decode_cursor(self, request, ordering):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        return self.load_cursor(encoded, ordering)
+
+    def load_cursor(self, encoded, ordering):
+        '''Turn an encoded cursor back into its (value, pk) position'''
+        # A bad cursor is a bad request (400), the same for list pages and mark-read
+        invalid = ValidationError({self.cursor_query_param: self.invalid_cursor_message})
+        try:
+            cursor_ordering, value, pk = signing.loads(encoded, salt=self.cursor_salt)
+        except (signing.BadSignature, ValueError, TypeError):
+            raise invalid
+        if cursor_ordering != ordering or not isinstance(pk, int):
+            raise invalid
+        if isinstance(value, str):
+            value = parse_datetime(value)
+            if value is None:
+                raise invalid
+        return value, pk
+
+    def start(self, request, ordering):
+        '''Read page size and position from the request; returns the (value, pk) to continue after'''
+        self.request = request
+        self.ordering = ordering
+        self.page_size = self.get_page_size(request)
+        self.approximate_total = None
+        return self.decode_cursor(request, ordering)
+
+    def paginate_items(self, items):
+        '''Cut a list fetched with `page_size + 1` rows into the page and the next cursor'''
+        self.has_next = len(items) > self.page_size
+        self.page = list(items[:self.page_size])
+        return self.page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = self.get_ordering(queryset)
+        position = self.start(request, ordering)
+        field = ordering.lstrip('-')
+        descending = ordering.startswith('-')
+
+        if request.query_params.get(self.total_query_param):
+            self.approximate_total = self.get_approximate_total(queryset)
+
+        if position is not None:
+            value, pk = position
+            lookup = 'lt' if descending else 'gt'
+            if field == 'pk':
+                queryset = queryset.filter(**{f'pk__{lookup}': pk})
+            else:
+                queryset = queryset.filter(
+                    Q(**{f'{field}__{lookup}': value}) | Q(**{field: value, f'pk__{lookup}': pk})
+                )
+        if field == 'pk':
+            queryset = queryset.order_by(ordering)
+        else:
+            queryset = queryset.order_by(ordering, '-pk' if descending else 'pk')
+        return self.paginate_items(queryset[:self.page_size + 1])
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.total_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.ordering, self.page[-1]))
+
+    def get_approximate_total(self, queryset):
+        '''
+        Planner estimate of the row count, never a COUNT(*).
+
+        Unfiltered lists read pg_class.reltuples; filtered ones use the
+        row estimate from EXPLAIN. Other backends return None.
+        '''
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                # -1 means the table has never been analyzed
+                return row[0] if row and row[0] >= 0 else None
+            sql, params = queryset.query.sql_with_params()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            return plan[0]['Plan']['Plan Rows']
+
+    def get_paginated_response(self, data):
+        body = {'next': self.get_next_link()}
+        if self.approximate_total is not None:
+            body['approximate_total'] = self.approximate_total
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'approximate_total': {'type': 'integer'},
+                'results': schema,
+            },
+        }
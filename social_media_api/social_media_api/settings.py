@@ -47,10 +47,13 @@ INSTALLED_APPS = [
     'accounts',
     'posts',
     'notifications',
+    'realtime',
+    'querymetrics',
     'django_filters',
 ]
 
 MIDDLEWARE = [
+    'querymetrics.middleware.QueryMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -94,11 +97,24 @@ DATABASES = {
     }
 }
 
+# Cache
+# Shared by every web process and the notification worker: auth tokens,
+# unread counts, post detail stamps and login limits are invalidated in one
+# process and must be seen by the others. Needs the `redis` package.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+    }
+}
+
 #REST_FRAMEWORK settings 
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'social_media_api.authentication.SignedTokenAuthentication',
+        'social_media_api.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -108,10 +124,56 @@ REST_FRAMEWORK = {
         'rest_framework.filters.SearchFilter',
         'rest_framework.filters.OrderingFilter',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 5,  # show 5 items per page by default 
+    'DEFAULT_PAGINATION_CLASS': 'social_media_api.pagination.KeysetPagination',
+    'PAGE_SIZE': 5,  # show 5 items per page by default, clients can ask for up to 50 with ?page_size=
 }
 
+#Home feed settings
+
+FEED_MAX_DEPTH = 800  # newest entries kept per user in the materialized feed; run manage.py trim_feeds periodically
+FEED_CELEBRITY_THRESHOLD = 10000  # authors with this many followers are merged in at read time instead
+
+FOLLOW_GRAPH_HOT_THRESHOLD = 10000  # accounts whose follower ids are cached for graph queries
+FOLLOW_GRAPH_CACHE_TIMEOUT = 300  # seconds a cached follower id list may lag behind the table
+
+AUTH_TOKEN_LOCAL_CACHE_SIZE = 10000  # tokens kept in each process's LRU
+AUTH_TOKEN_LOCAL_TTL = 30  # seconds another process may keep honouring a revoked token
+AUTH_TOKEN_CACHE_TTL = 300  # seconds a token stays in the shared cache
+
+SIGNED_ACCESS_TOKEN_TTL = 300  # seconds; also how long a deactivated or demoted user's access token keeps its reads
+SIGNED_REFRESH_TOKEN_TTL = 14 * 24 * 60 * 60
+REVOCATION_REFRESH_INTERVAL = 30  # seconds between reloads of each process's revoked-token filter
+REVOCATION_BLOOM_CAPACITY = 100000  # revoked ids the filter is sized for
+REVOCATION_BLOOM_ERROR_RATE = 0.001
+
+LOGIN_HASH_WORKERS = 4  # threads reserved for password checks
+LOGIN_MAX_PENDING = 64  # queued checks beyond this get a 503 straight away
+LOGIN_USERNAME_RATE_LIMIT = (10, 300)  # failed logins per username per sliding window of seconds
+LOGIN_IP_RATE_LIMIT = (50, 300)  # failed logins per client IP per sliding window of seconds
+
+#Request/query instrumentation (see querymetrics/)
+QUERY_METRICS_SAMPLE_RATE = 1.0  # share of requests whose queries are recorded
+QUERY_METRICS_SLOW_MS = 500  # requests slower than this are logged with their worst queries
+QUERY_METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']  # who may scrape /metrics
+QUERY_METRICS_LOADTEST_ENDPOINTS = ['/api/posts/posts/@3', '/api/posts/posts/1/@2', '/api/posts/feed/@3']  # default paths (@weight) for manage.py loadtest
+
+AVATAR_WORKERS = 2  # threads thumbnailing uploaded profile pictures; 0 leaves it all to manage.py process_avatars
+AVATAR_SIZES = (64, 256)  # square thumbnail edges in pixels, each written as WebP and JPEG
+AVATAR_MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+AVATAR_MAX_PIXELS = 40_000_000  # larger images are refused before anything is decoded
+
+RECOMMENDATIONS_TOP_K = 20  # who-to-follow suggestions stored per user
+RECOMMENDATIONS_MAX_FANOUT = 5000  # skip followed accounts that follow more than this when counting 2-hop paths
+
+COMMENT_PREVIEW_SIZE = 3  # comments embedded per post in list responses
+POST_DETAIL_CACHE_TIMEOUT = 60 * 60  # cached post detail responses; writes invalidate them earlier
+
+#Server push (served by the ASGI application, see realtime/)
+
+REALTIME_BROKER = 'realtime.broker.PostgresBroker'  # LISTEN/NOTIFY; InProcessBroker only suits a single process and no notification worker
+REALTIME_HEARTBEAT = 15  # seconds between keep-alive comments on idle streams
+REALTIME_CHANNEL_REFRESH = 300  # seconds between re-reads of a stream's celebrity channels; follows apply at once
+
 
 
 AUTH_USER_MODEL = 'accounts.CustomUser'
@@ -21,4 +21,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/accounts/', include('accounts.urls')),
     path('api/posts/', include('posts.urls')),
+    path('api/notifications/', include('notifications.urls')),
+    path('api/realtime/', include('realtime.urls')),
+    path('', include('querymetrics.urls')),
 ]